@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 from pathlib import Path
 from datetime import timedelta
 import os
+import tempfile
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -84,9 +85,65 @@ LOGGING = {
     },
 }
 
+# Запись логов tracking.* в фоновом потоке через очередь (tracking.logging.start_log_listener)
+LOG_QUEUE_ENABLED = os.getenv('LOG_QUEUE_ENABLED', 'True') == 'True'
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', 10000))  # записей в очереди
+LOG_QUEUE_BLOCK_TIMEOUT = float(os.getenv('LOG_QUEUE_BLOCK_TIMEOUT', 0.1))  # секунд ожидания места для ошибок
+
+# Доля записываемых замеров производительности: общая и по представлениям,
+# формат PERFORMANCE_LOG_SAMPLE_RATES: "activity-bulk=0.1,keyboardactivity-list=0.05"
+PERFORMANCE_LOG_SAMPLE_RATE = float(os.getenv('PERFORMANCE_LOG_SAMPLE_RATE', 1.0))
+PERFORMANCE_LOG_SAMPLE_RATES = {
+    view_name.strip(): float(rate)
+    for view_name, rate in (
+        item.split('=', 1) for item in os.getenv('PERFORMANCE_LOG_SAMPLE_RATES', '').split(',') if '=' in item
+    )
+}
+
+# Гистограммы времени ответа (tracking.metrics, /metrics): каждый процесс сохраняет
+# свой снимок в METRICS_DIR, /metrics складывает снимки всех воркеров.
+# Снимки завершившихся процессов и не обновлявшиеся 6 интервалов сохранения удаляются.
+# /metrics отдается по токену METRICS_TOKEN (заголовок Authorization: Bearer <токен>)
+# или сотруднику с сессией. METRICS_ALLOWED_IPS - необязательный список адресов без токена;
+# за обратным прокси REMOTE_ADDR - адрес прокси, поэтому по умолчанию список пуст.
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'True') == 'True'
+METRICS_DIR = os.getenv('METRICS_DIR') or os.path.join(tempfile.gettempdir(), 'tracker33_metrics')
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', 5))  # секунд между сохранениями снимка
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+METRICS_ALLOWED_IPS = [ip for ip in os.getenv('METRICS_ALLOWED_IPS', '').split(',') if ip]
+
+# Просмотр логов в админ-панели
+LOG_VIEWER_TAIL_LINES = int(os.getenv('LOG_VIEWER_TAIL_LINES', 1000))  # строк на странице
+LOG_VIEWER_SEARCH_MATCHES = int(os.getenv('LOG_VIEWER_SEARCH_MATCHES', 200))  # совпадений на странице поиска
+LOG_FOLLOW_SECONDS = int(os.getenv('LOG_FOLLOW_SECONDS', 30))  # длительность одного потока слежения
+LOG_FOLLOW_POLL_INTERVAL = float(os.getenv('LOG_FOLLOW_POLL_INTERVAL', 1.0))  # секунд между проверками файла
+
 # Настройки мониторинга производительности
 SLOW_REQUEST_THRESHOLD = float(os.getenv('SLOW_REQUEST_THRESHOLD', 1.0))  # секунды
 SLOW_QUERY_THRESHOLD = float(os.getenv('SLOW_QUERY_THRESHOLD', 0.1))  # секунды
+SLOW_QUERY_TOP_N = int(os.getenv('SLOW_QUERY_TOP_N', 5))  # самых медленных SQL в записи о запросе
+
+# Фоновая отправка уведомлений (tracking.alerts.AlertDispatcher)
+ALERTS_ASYNC = os.getenv('ALERTS_ASYNC', 'True') == 'True'  # False - отправлять сразу в вызывающем потоке
+ALERT_QUEUE_SIZE = int(os.getenv('ALERT_QUEUE_SIZE', 1000))  # уведомлений в очереди
+ALERT_DEDUP_WINDOW = int(os.getenv('ALERT_DEDUP_WINDOW', 300))  # секунд между уведомлениями с одной сигнатурой
+ALERT_RATE_PER_MINUTE = float(os.getenv('ALERT_RATE_PER_MINUTE', 6))  # уведомлений в минуту
+ALERT_RATE_BURST = int(os.getenv('ALERT_RATE_BURST', 3))  # уведомлений подряд
+ALERT_DIGEST_INTERVAL = int(os.getenv('ALERT_DIGEST_INTERVAL', 300))  # секунд между сводками подавленных
+ALERT_HTTP_TIMEOUT = float(os.getenv('ALERT_HTTP_TIMEOUT', 5))  # секунд на запрос к Slack
+
+# Пакетная загрузка активностей (/api/activities/bulk/)
+BULK_INGEST_MAX_ITEMS = int(os.getenv('BULK_INGEST_MAX_ITEMS', 1000))  # записей в одном запросе
+BULK_INGEST_BATCH_SIZE = int(os.getenv('BULK_INGEST_BATCH_SIZE', 500))  # строк в одном INSERT
+MAX_DECOMPRESSED_REQUEST_SIZE = int(os.getenv('MAX_DECOMPRESSED_REQUEST_SIZE', 50 * 1024 * 1024))  # байт после распаковки gzip
+
+# Хранение нажатий клавиш: 'raw' - сырые строки и минутные сводки, 'bucketed' - только сводки
+KEYBOARD_STORAGE_MODE = os.getenv('KEYBOARD_STORAGE_MODE', 'raw').lower()
+KEYBOARD_RAW_RETENTION_DAYS = int(os.getenv('KEYBOARD_RAW_RETENTION_DAYS', 7))  # дней хранения сырых нажатий
+KEYBOARD_KEY_HISTOGRAM = os.getenv('KEYBOARD_KEY_HISTOGRAM', 'True') == 'True'  # считать нажатия по клавишам
+
+# Потоковый экспорт активностей (/api/export-statistics/)
+EXPORT_CHUNK_SIZE = int(os.getenv('EXPORT_CHUNK_SIZE', 2000))  # строк, читаемых из БД за один раз
 
 # Создаем директорию для логов, если она не существует
 LOGS_DIR = BASE_DIR / 'logs'
@@ -131,6 +188,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'tracking.middleware.RequestDecompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -161,12 +219,56 @@ CORS_ALLOW_HEADERS = [
 ]
 
 # Cache settings
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-        'LOCATION': 'unique-snowflake',
+# CACHE_BACKEND: locmem (по умолчанию), redis, file или db.
+# Для нескольких воркеров нужен общий кэш: redis, file или db
+# (для db предварительно выполните `python manage.py createcachetable`).
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'locmem').lower()
+CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', '10000'))
+
+if CACHE_BACKEND == 'redis':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django_redis.cache.RedisCache',
+            'LOCATION': os.getenv('CACHE_LOCATION') or 'redis://127.0.0.1:6379/1',
+            'OPTIONS': {
+                'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+            },
+        }
     }
-}
+elif CACHE_BACKEND == 'file':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.getenv('CACHE_LOCATION') or str(BASE_DIR / 'cache'),
+            'OPTIONS': {
+                'MAX_ENTRIES': CACHE_MAX_ENTRIES,
+            },
+        }
+    }
+elif CACHE_BACKEND == 'db':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': os.getenv('CACHE_LOCATION') or 'tracker_cache',
+            'OPTIONS': {
+                'MAX_ENTRIES': CACHE_MAX_ENTRIES,
+            },
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'unique-snowflake',
+            'OPTIONS': {
+                'MAX_ENTRIES': CACHE_MAX_ENTRIES,
+            },
+        }
+    }
+
+# Сбор статистики попаданий и промахов кэша по префиксам ключей.
+# Выключен по умолчанию: каждое чтение из кэша добавляет запрос incr к бэкенду
+CACHE_STATS_ENABLED = os.getenv('CACHE_STATS_ENABLED', 'False') == 'True'
 
 # Cache time to live is 15 minutes
 CACHE_TTL = 60 * 15
@@ -197,12 +299,54 @@ WSGI_APPLICATION = 'Tracker33.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# DB_ENGINE: sqlite (по умолчанию) или postgresql.
+# CONN_MAX_AGE держит соединение открытым между запросами (секунды, 0 - закрывать после запроса),
+# CONN_HEALTH_CHECKS проверяет переиспользуемое соединение перед запросом.
+DB_ENGINE = os.getenv('DB_ENGINE', 'sqlite').lower()
+DB_CONN_MAX_AGE = int(os.getenv('DB_CONN_MAX_AGE', 60))
+DB_CONN_HEALTH_CHECKS = os.getenv('DB_CONN_HEALTH_CHECKS', 'True') == 'True'
+
+if DB_ENGINE in ('postgresql', 'postgres'):
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv('DB_NAME', 'tracker'),
+            'USER': os.getenv('DB_USER', 'tracker'),
+            'PASSWORD': os.getenv('DB_PASSWORD', ''),
+            'HOST': os.getenv('DB_HOST', '127.0.0.1'),
+            'PORT': os.getenv('DB_PORT', '5432'),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': DB_CONN_HEALTH_CHECKS,
+        }
     }
-}
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.getenv('DB_NAME') or BASE_DIR / 'db.sqlite3',
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': DB_CONN_HEALTH_CHECKS,
+        }
+    }
+
+# Настройки SQLite, применяемые к каждому новому соединению (tracking.sqlite_tuning)
+SQLITE_TUNING = os.getenv('SQLITE_TUNING', 'True') == 'True'
+# Режим журнала сохраняется в самом файле базы, поэтому WAL включается только явно
+# (SQLITE_JOURNAL_MODE=WAL на сервере): иначе любая команда manage.py переводит базу в WAL
+SQLITE_JOURNAL_MODE = os.getenv('SQLITE_JOURNAL_MODE', '').upper()
+SQLITE_SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL').upper()
+SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))  # байт
+SQLITE_CACHE_SIZE = int(os.getenv('SQLITE_CACHE_SIZE', -64000))  # страниц, отрицательное значение - в КиБ
+SQLITE_BUSY_TIMEOUT = int(os.getenv('SQLITE_BUSY_TIMEOUT', 5000))  # мс ожидания блокировки записи
+
+# Групповая фиксация пакетов активностей: запросы одного процесса пишет один поток,
+# одновременно пришедшие пакеты фиксируются одной транзакцией. Включается явно
+# (INGEST_WRITE_BATCHING=True), так как поток-писатель работает со своим соединением:
+# его записи не видны транзакции теста TestCase
+INGEST_WRITE_BATCHING = os.getenv('INGEST_WRITE_BATCHING', 'False') == 'True'
+INGEST_BATCH_TIMEOUT = float(os.getenv('INGEST_BATCH_TIMEOUT', 30))  # секунд ожидания записи пакета, затем 503
+INGEST_BATCH_WINDOW_MS = int(os.getenv('INGEST_BATCH_WINDOW_MS', 0))  # ожидание следующих пакетов, мс
+INGEST_BATCH_MAX_ITEMS = int(os.getenv('INGEST_BATCH_MAX_ITEMS', 5000))  # записей в одной транзакции
 
 
 # Password validation
@@ -348,6 +492,7 @@ EMAIL_HOST_USER = 'ivan6179217@mail.ru'
 EMAIL_HOST_PASSWORD = 'zrsnavbdomujusel'
 DEFAULT_FROM_EMAIL = 'ivan6179217@mail.ru'
 SERVER_EMAIL = 'ivan6179217@mail.ru'
+EMAIL_TIMEOUT = int(os.getenv('EMAIL_TIMEOUT', 10))  # секунд на соединение с SMTP
 
 # Error handlers
 handler400 = 'users.views.bad_request'
@@ -27,6 +27,7 @@ from django.views.generic import RedirectView
 from django.contrib.auth import views as auth_views
 from users import views as user_views
 from tracking import urls as tracking_urls
+from tracking.views import MetricsView
 from django.contrib.auth.views import LogoutView
 from django.views.generic import TemplateView
 
@@ -43,6 +44,7 @@ class CustomLoginView(auth_views.LoginView):
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('admin-panel/', include('admin_panel.urls', namespace='admin_panel')),
+    path('metrics', MetricsView.as_view(), name='metrics'),
     path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('api/token/verify/', TokenVerifyView.as_view(), name='token_verify'),
@@ -0,0 +1,122 @@
+import mmap
+import os
+import re
+
+
+def _decode(data):
+    return data.decode('utf-8', errors='replace')
+
+
+def tail(path, max_lines=1000, end=None, block_size=64 * 1024, max_bytes=8 * 1024 * 1024):
+    """
+    Последние max_lines строк файла до байтового смещения end (по умолчанию - конец файла).
+    Файл читается блоками с конца, поэтому стоимость зависит от объема строк, а не от размера файла.
+    Возвращает (строки, смещение первой строки, смещение конца).
+    """
+    with open(path, 'rb') as file:
+        size = file.seek(0, os.SEEK_END)
+        end = size if end is None else max(0, min(end, size))
+        position = end
+        data = b''
+        while position > 0 and data.count(b'\n') <= max_lines and len(data) < max_bytes:
+            read = min(block_size, position)
+            position -= read
+            file.seek(position)
+            data = file.read(read) + data
+
+    offsets = []
+    offset = position
+    for segment in data.split(b'\n'):
+        offsets.append((offset, segment))
+        offset += len(segment) + 1
+
+    # Строка до начала прочитанного блока обрезана - начинаем со следующей
+    if position > 0:
+        offsets = offsets[1:]
+    # Хвост после последнего перевода строки пуст, если файл им заканчивается
+    if offsets and not offsets[-1][1]:
+        offsets.pop()
+
+    offsets = offsets[-max_lines:]
+    start = offsets[0][0] if offsets else end
+    return [_decode(segment) for _, segment in offsets], start, end
+
+
+def _caseless(query):
+    """
+    Шаблон подстроки без учета регистра: re.IGNORECASE для байтов
+    учитывает только ASCII, поэтому остальные буквы перечисляются явно
+    """
+    parts = []
+    for char in query:
+        variants = dict.fromkeys((char, char.lower(), char.upper()))
+        if len(variants) == 1 or char.isascii():
+            parts.append(re.escape(char.encode('utf-8')))
+        else:
+            parts.append(b'(?:' + b'|'.join(re.escape(variant.encode('utf-8')) for variant in variants) + b')')
+    return b''.join(parts)
+
+
+def compile_pattern(query, regex=False, ignore_case=False):
+    """
+    Регулярное выражение по байтам для поиска; без regex - поиск подстроки.
+    ^ и $ совпадают с началом и концом каждой строки.
+    """
+    flags = re.MULTILINE | (re.IGNORECASE if ignore_case else 0)
+    if regex:
+        return re.compile(query.encode('utf-8'), flags)
+    if ignore_case:
+        return re.compile(_caseless(query), flags)
+    return re.compile(re.escape(query.encode('utf-8')), flags)
+
+
+def search(path, pattern, start=0, max_matches=200):
+    """
+    Строки файла, совпадающие с pattern, начиная с байтового смещения start.
+    Файл отображается в память через mmap: поиск идет по страницам файла
+    без чтения его целиком в память процесса.
+    Возвращает ([(начало строки, конец строки, строка), ...], смещение продолжения или None).
+    """
+    matches = []
+    with open(path, 'rb') as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return matches, None
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            size = len(mapped)
+            position = max(0, min(start, size))
+            while position < size:
+                found = pattern.search(mapped, position)
+                if found is None:
+                    return matches, None
+                line_start = mapped.rfind(b'\n', 0, found.start()) + 1
+                line_end = mapped.find(b'\n', found.start())
+                if line_end == -1:
+                    line_end = size
+                position = line_end + 1
+                matches.append((line_start, position, _decode(mapped[line_start:line_end])))
+                if len(matches) >= max_matches:
+                    return matches, position if position < size else None
+    return matches, None
+
+
+def read_from(path, offset, max_bytes=64 * 1024):
+    """
+    Новые полные строки, дописанные в файл после смещения offset.
+    Если файл стал короче (ротация или очистка), чтение начинается с начала.
+    Возвращает (текст, новое смещение).
+    """
+    with open(path, 'rb') as file:
+        size = file.seek(0, os.SEEK_END)
+        if offset > size:
+            offset = 0
+        file.seek(offset)
+        data = file.read(min(max_bytes, size - offset))
+
+    # Недописанная последняя строка будет отдана в следующий раз
+    last_newline = data.rfind(b'\n')
+    if last_newline == -1:
+        if len(data) == max_bytes:
+            # Строка длиннее max_bytes отдается частями
+            return _decode(data), offset + len(data)
+        return '', offset
+    return _decode(data[:last_newline + 1]), offset + last_newline + 1
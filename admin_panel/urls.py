@@ -11,5 +11,9 @@ urlpatterns = [
     path('applications/', views.ApplicationListView.as_view(), name='applications'),
     path('activities/', views.ActivityListView.as_view(), name='activities'),
     path('logs/', views.LogsView.as_view(), name='logs'),
+    path('logs/follow/', views.LogFollowView.as_view(), name='logs_follow'),
     path('database/', views.DatabaseTablesView.as_view(), name='database'),
+    path('metrics/', views.MetricsView.as_view(), name='metrics'),
+    path('performance/', views.PerformanceHistoryView.as_view(), name='performance'),
+    path('cache-stats/', views.CacheStatsView.as_view(), name='cache_stats'),
 ] 
\ No newline at end of file
@@ -1,17 +1,24 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from django.views.generic import TemplateView, ListView, DetailView, UpdateView, DeleteView
+from django.views.generic import View, TemplateView, ListView, DetailView, UpdateView, DeleteView
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.urls import reverse_lazy
 from django.contrib import messages
 from django.db.models import Count, Sum
 from users.models import CustomUser
 from tracking.models import Application, UserActivity, KeyboardActivity, TimeLog
+from tracking.caching import cache_backend_info, cache_stats, reset_cache_stats
+from tracking.metrics import latency_summary
+from tracking.performance_log import compare_periods, p95_series
+from . import logfiles
+from tracking.pagination import KeysetPaginationMixin
 from django.contrib.admin.views.decorators import staff_member_required
 from django.utils.decorators import method_decorator
 from django.views.decorators.cache import never_cache
-from django.http import HttpResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 import os
 import glob
+import re
+import time
 from django.conf import settings
 from django import forms
 from django.contrib.auth.forms import UserCreationForm, UserChangeForm, PasswordChangeForm
@@ -114,46 +121,138 @@ class ApplicationListView(LoginRequiredMixin, SuperUserRequiredMixin, ListView):
         ).order_by('-activity_count')
 
 # Список активности
-class ActivityListView(LoginRequiredMixin, SuperUserRequiredMixin, ListView):
+class ActivityListView(LoginRequiredMixin, SuperUserRequiredMixin, KeysetPaginationMixin, ListView):
     model = UserActivity
     template_name = 'admin_panel/activity_list.html'
     context_object_name = 'activities'
-    paginate_by = 50
+    keyset_field = 'start_time'
+    keyset_page_size = 50
     
     def get_queryset(self):
-        return UserActivity.objects.select_related('user', 'application').order_by('-start_time')
+        return UserActivity.objects.select_related('user', 'application').order_by('-start_time', '-id')
 
 # Просмотр логов
-class LogsView(LoginRequiredMixin, SuperUserRequiredMixin, TemplateView):
+class LogFileMixin:
+    """
+    Выбор файла лога только из списка файлов каталога логов
+    """
+
+    def get_log_dir(self):
+        return os.path.join(settings.BASE_DIR, 'logs')
+
+    def get_log_files(self):
+        return sorted(os.path.basename(f) for f in glob.glob(os.path.join(self.get_log_dir(), '*.log')))
+
+    def get_log_path(self, name):
+        if name and name in self.get_log_files():
+            return os.path.join(self.get_log_dir(), name)
+        return None
+
+    def get_offset(self, name):
+        try:
+            return max(int(self.request.GET.get(name, '')), 0)
+        except ValueError:
+            return None
+
+class LogsView(LoginRequiredMixin, SuperUserRequiredMixin, LogFileMixin, TemplateView):
     template_name = 'admin_panel/logs.html'
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         
-        # Путь к директории с логами
-        log_dir = os.path.join(settings.BASE_DIR, 'logs')
-        
-        # Получаем список файлов логов
-        log_files = glob.glob(os.path.join(log_dir, '*.log'))
-        
         # Выбранный файл лога
         selected_log = self.request.GET.get('log')
+        log_path = self.get_log_path(selected_log)
+        query = self.request.GET.get('q', '')
         
-        if selected_log and os.path.exists(os.path.join(log_dir, selected_log)):
-            log_path = os.path.join(log_dir, selected_log)
+        if log_path:
             try:
-                with open(log_path, 'r', encoding='utf-8') as f:
-                    # Читаем последние 1000 строк
-                    log_content = f.readlines()[-1000:]
-                    context['log_content'] = ''.join(log_content)
+                if query:
+                    self._search(context, log_path, query)
+                else:
+                    # Последние строки до смещения before - читаются только нужные блоки с конца файла
+                    lines, start, end = logfiles.tail(
+                        log_path,
+                        max_lines=settings.LOG_VIEWER_TAIL_LINES,
+                        end=self.get_offset('before'),
+                    )
+                    context['log_content'] = '\n'.join(lines)
+                    context['end_offset'] = end
+                    if start > 0:
+                        context['older_query'] = self._query(before=start)
+                    if self.get_offset('before') is not None:
+                        context['newest_query'] = self._query(before=None)
+            except re.error as e:
+                context['error'] = f"Неверное регулярное выражение: {str(e)}"
             except Exception as e:
                 context['error'] = f"Ошибка чтения файла лога: {str(e)}"
         
-        context['log_files'] = [os.path.basename(f) for f in log_files]
-        context['selected_log'] = selected_log
+        context['log_files'] = self.get_log_files()
+        context['selected_log'] = selected_log if log_path else None
+        context['query'] = query
+        context['regex'] = bool(self.request.GET.get('regex'))
+        context['ignore_case'] = bool(self.request.GET.get('ignore_case'))
         
         return context
 
+    def _search(self, context, log_path, query):
+        pattern = logfiles.compile_pattern(
+            query,
+            regex=bool(self.request.GET.get('regex')),
+            ignore_case=bool(self.request.GET.get('ignore_case')),
+        )
+        matches, next_offset = logfiles.search(
+            log_path,
+            pattern,
+            start=self.get_offset('from') or 0,
+            max_matches=settings.LOG_VIEWER_SEARCH_MATCHES,
+        )
+        context['search_results'] = matches
+        if next_offset is not None:
+            context['next_search_query'] = self._query(**{'from': next_offset})
+
+    def _query(self, **changes):
+        params = self.request.GET.copy()
+        for key, value in changes.items():
+            params.pop(key, None)
+            if value is not None:
+                params[key] = value
+        return params.urlencode()
+
+# Слежение за логом: новые строки отправляются как Server-Sent Events
+@method_decorator(never_cache, name='dispatch')
+class LogFollowView(LoginRequiredMixin, SuperUserRequiredMixin, LogFileMixin, View):
+    def get(self, request, *args, **kwargs):
+        log_path = self.get_log_path(request.GET.get('log'))
+        if not log_path:
+            return HttpResponse(status=404)
+
+        # При переподключении EventSource передает смещение последнего события
+        offset = self.get_offset('offset')
+        try:
+            offset = int(request.META.get('HTTP_LAST_EVENT_ID', offset))
+        except (TypeError, ValueError):
+            pass
+        if offset is None:
+            offset = os.path.getsize(log_path)
+
+        response = StreamingHttpResponse(self._events(log_path, offset), content_type='text/event-stream')
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    def _events(self, log_path, offset):
+        # Поток ограничен по времени, чтобы не занимать воркер; браузер переподключится сам
+        deadline = time.monotonic() + settings.LOG_FOLLOW_SECONDS
+        yield 'retry: 1000\n\n'
+        while time.monotonic() < deadline:
+            text, offset = logfiles.read_from(log_path, offset)
+            if text:
+                data = '\n'.join(f'data: {line}' for line in text.rstrip('\n').split('\n'))
+                yield f'id: {offset}\n{data}\n\n'
+            else:
+                yield ': keepalive\n\n'
+                time.sleep(settings.LOG_FOLLOW_POLL_INTERVAL)
+
 # Просмотр таблиц базы данных
 class DatabaseTablesView(LoginRequiredMixin, SuperUserRequiredMixin, TemplateView):
     template_name = 'admin_panel/database_tables.html'
@@ -161,30 +260,80 @@ class DatabaseTablesView(LoginRequiredMixin, SuperUserRequiredMixin, TemplateVie
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         
-        # Получаем список таблиц
+        # Список таблиц через интроспекцию - одинаково для SQLite и PostgreSQL
         with connection.cursor() as cursor:
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-            tables = cursor.fetchall()
+            tables = connection.introspection.table_names(cursor)
         
-        context['tables'] = [table[0] for table in tables if not table[0].startswith('sqlite_')]
+        context['tables'] = tables
         
         # Выбранная таблица
         selected_table = self.request.GET.get('table')
         
-        if selected_table and selected_table in [t[0] for t in tables]:
-            # Получаем информацию о столбцах
-            with connection.cursor() as cursor:
-                cursor.execute(f"PRAGMA table_info({selected_table});")
-                columns = cursor.fetchall()
-            
-            # Получаем данные таблицы (ограничиваем 100 записями)
+        if selected_table and selected_table in tables:
+            table = connection.ops.quote_name(selected_table)
             with connection.cursor() as cursor:
-                cursor.execute(f"SELECT * FROM {selected_table} LIMIT 100;")
+                # Получаем информацию о столбцах
+                columns = connection.introspection.get_table_description(cursor, selected_table)
+                
+                # Получаем данные таблицы (ограничиваем 100 записями)
+                cursor.execute(f"SELECT * FROM {table} LIMIT 100")
                 rows = cursor.fetchall()
             
             context['selected_table'] = selected_table
-            context['columns'] = [col[1] for col in columns]
+            context['columns'] = [col.name for col in columns]
             context['rows'] = rows
             context['total_rows'] = len(rows)
         
-        return context 
\ No newline at end of file
+        return context 
+
+# Статистика кэша по префиксам ключей
+@method_decorator(never_cache, name='dispatch')
+class CacheStatsView(LoginRequiredMixin, SuperUserRequiredMixin, View):
+    def get(self, request, *args, **kwargs):
+        return JsonResponse({
+            'backend': cache_backend_info(),
+            'stats_enabled': settings.CACHE_STATS_ENABLED,
+            'prefixes': cache_stats(),
+        })
+
+    def post(self, request, *args, **kwargs):
+        # Сброс счетчиков перед новым замером
+        reset_cache_stats()
+        return JsonResponse({'status': 'success'})
+
+# Гистограммы времени ответа по представлениям
+@method_decorator(never_cache, name='dispatch')
+class MetricsView(LoginRequiredMixin, SuperUserRequiredMixin, TemplateView):
+    template_name = 'admin_panel/metrics.html'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['rows'] = latency_summary()
+        context['metrics_enabled'] = settings.METRICS_ENABLED
+        return context
+
+# История производительности по сводке журнала (команда aggregate_performance_log)
+class PerformanceHistoryView(LoginRequiredMixin, SuperUserRequiredMixin, TemplateView):
+    template_name = 'admin_panel/performance_history.html'
+    chart_views = 5
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        try:
+            days = min(max(int(self.request.GET.get('days', 7)), 1), 90)
+        except ValueError:
+            days = 7
+
+        rows = compare_periods(days=days)
+        selected_view = self.request.GET.get('view')
+        if selected_view:
+            chart_views = [selected_view]
+        else:
+            # На графике - представления с наибольшим ростом p95
+            chart_views = [row['view_name'] for row in rows[:self.chart_views]]
+
+        context['days'] = days
+        context['rows'] = rows
+        context['selected_view'] = selected_view
+        context['chart_data'] = p95_series(chart_views, days=days)
+        return context
@@ -8,6 +8,8 @@ from pathlib import Path
 import os
 import urllib3
 
+from application_map import ApplicationMap
+
 # Отключаем предупреждения о незащищенных запросах
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
@@ -40,6 +42,9 @@ class APIClient:
         self.config_dir.mkdir(exist_ok=True)
         self.token_file = self.config_dir / 'token.json'
         
+        # Соответствие имен процессов и ID приложений на сервере, хранится между запусками
+        self.applications = ApplicationMap(self.config_dir / 'applications.json')
+        
         # Настройка сессии с таймаутами
         self.session = requests.Session()
         self.session.timeout = (10, 30)  # 10 секунд на соединение, 30 секунд на ответ
@@ -535,6 +540,38 @@ class APIClient:
             logger.error(f"Ошибка при получении списка приложений: {e}")
             return None
 
+    def _api_url(self, path: str) -> str:
+        api_url = self.base_url
+        if not api_url.endswith('/'):
+            api_url += '/'
+        if not api_url.endswith('api/'):
+            api_url += 'api/'
+        return api_url + path
+
+    def refresh_application_map(self) -> bool:
+        """Обновление списка приложений с сервера; при совпадении ETag сервер отвечает 304 без данных"""
+        headers = self.get_headers()
+        if not headers:
+            logger.warning("Нет действительного токена для обновления списка приложений")
+            return False
+        return self.applications.refresh(self.session, self._api_url(''), headers)
+
+    def resolve_applications(self, process_names: List[str]) -> Dict[str, int]:
+        """ID приложений по именам процессов: неизвестные регистрируются на сервере одним запросом"""
+        headers = {}
+        if self.applications.unknown(process_names):
+            headers = self.get_headers()
+            if not headers:
+                logger.warning("Нет действительного токена для регистрации приложений")
+        if not headers:
+            # Без запроса к серверу - только уже известные ID
+            return {name: app_id for name in process_names if (app_id := self.applications.get(name)) is not None}
+        return self.applications.resolve(self.session, self._api_url(''), headers, process_names)
+
+    def get_application_id(self, process_name: str) -> Optional[int]:
+        """ID приложения из локального списка без обращения к серверу"""
+        return self.applications.get(process_name)
+
     def logout(self):
         """Выход из системы"""
         self.token = None
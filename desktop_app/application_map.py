@@ -0,0 +1,136 @@
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+import requests
+
+logger = logging.getLogger("TimeTracker")
+
+
+def application_key(process_name: Optional[str]) -> str:
+    """Ключ соответствия: имя процесса как его хранит сервер (без смены регистра, до 255 символов)."""
+    return str(process_name or '')[:255]
+
+
+def default_application_map_path() -> Path:
+    return Path.home() / '.timetracker' / 'applications.json'
+
+
+class ApplicationMap:
+    """Соответствие имен процессов и ID приложений на сервере, хранится между запусками.
+
+    Загружается из файла при создании, обновляется запросом с If-None-Match
+    (сервер отвечает 304, если список не изменился), а неизвестные имена
+    регистрируются на сервере одним запросом к /tracked-apps/resolve/.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.etag: Optional[str] = None
+        self._ids: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self) -> None:
+        if not self.path.exists():
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            with self._lock:
+                self._ids = {application_key(name): int(app_id) for name, app_id in data.get('applications', {}).items()}
+                self.etag = data.get('etag')
+            logger.info(f"Загружено {len(self._ids)} сохраненных ID приложений")
+        except Exception as e:
+            logger.error(f"Ошибка загрузки списка приложений: {e}")
+            with self._lock:
+                self._ids = {}
+                self.etag = None
+
+    def save(self) -> None:
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with self._lock:
+                data = {'etag': self.etag, 'applications': dict(self._ids)}
+            tmp_file = self.path.with_suffix('.tmp')
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_file, self.path)
+        except Exception as e:
+            logger.error(f"Ошибка сохранения списка приложений: {e}")
+
+    def get(self, process_name: Optional[str]) -> Optional[int]:
+        with self._lock:
+            return self._ids.get(application_key(process_name))
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._ids)
+
+    def unknown(self, process_names: Iterable[Optional[str]]) -> List[str]:
+        """Имена без известного ID, без повторов и пустых."""
+        keys = dict.fromkeys(application_key(name) for name in process_names)
+        with self._lock:
+            return [key for key in keys if key and key not in self._ids]
+
+    def update(self, mapping: Dict[str, int], replace: bool = False, etag: Optional[str] = None) -> bool:
+        """Добавляет ID (replace - заменяет весь список); True, если список изменился."""
+        mapping = {application_key(name): int(app_id) for name, app_id in mapping.items()}
+        with self._lock:
+            if replace:
+                changed = mapping != self._ids
+                self._ids = mapping
+                self.etag = etag
+            else:
+                changed = any(self._ids.get(name) != app_id for name, app_id in mapping.items())
+                self._ids.update(mapping)
+        return changed
+
+    def refresh(self, session: requests.Session, api_url: str, headers: Dict[str, str],
+                timeout=(10, 20)) -> bool:
+        """Обновление списка с сервера; при совпадении ETag сервер отвечает 304 без данных."""
+        headers = dict(headers)
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        try:
+            response = session.get(f"{api_url}tracked-apps/map/", headers=headers, timeout=timeout)
+        except requests.RequestException as e:
+            logger.error(f"Ошибка при обновлении списка приложений: {e}")
+            return False
+        if response.status_code == 304:
+            logger.info("Список приложений не изменился")
+            return True
+        if response.status_code != 200:
+            logger.error(f"Ошибка при обновлении списка приложений: {response.status_code} - {response.text}")
+            return False
+        self.update(response.json().get('applications', {}), replace=True, etag=response.headers.get('ETag'))
+        self.save()
+        logger.info(f"Список приложений обновлен: {len(self._ids)}")
+        return True
+
+    def resolve(self, session: requests.Session, api_url: str, headers: Dict[str, str],
+                process_names: Iterable[Optional[str]], timeout=(10, 30)) -> Dict[str, int]:
+        """ID приложений по именам процессов: неизвестные регистрируются на сервере одним запросом."""
+        process_names = [application_key(name) for name in process_names]
+        unknown = self.unknown(process_names)
+        if unknown:
+            try:
+                response = session.post(
+                    f"{api_url}tracked-apps/resolve/",
+                    json={'process_names': unknown},
+                    headers=headers,
+                    timeout=timeout
+                )
+                if response.status_code == 200:
+                    if self.update(response.json().get('applications', {})):
+                        self.save()
+                else:
+                    logger.error(f"Ошибка при регистрации приложений: {response.status_code} - {response.text}")
+            except requests.RequestException as e:
+                logger.error(f"Ошибка при регистрации приложений: {e}")
+
+        with self._lock:
+            return {name: self._ids[name] for name in process_names if name in self._ids}
@@ -0,0 +1,64 @@
+import time
+from typing import NamedTuple
+
+
+class InputSnapshot(NamedTuple):
+    """Показания счетчиков ввода на момент снимка."""
+    keystrokes: int
+    clicks: int
+    mouse_moves: int
+    last_input: float  # time.monotonic() последнего действия пользователя
+
+
+class InputActivityAggregator:
+    """Счетчики клавиатуры и мыши для обработчиков pynput.
+
+    Каждый счетчик пишет только свой поток слушателя, а остальные потоки
+    лишь читают их, поэтому блокировки не нужны и приращения не теряются.
+    Счетчики только растут: вместо сброса потребитель запоминает снимок
+    в начале сессии и берет разницу через since(). Движения мыши
+    учитываются не чаще раза в move_sample_interval секунд.
+    """
+
+    def __init__(self, move_sample_interval: float = 0.5):
+        self.move_sample_interval = move_sample_interval
+        self._keystrokes = 0
+        self._clicks = 0
+        self._mouse_moves = 0
+        now = time.monotonic()
+        self._last_key = now
+        self._last_mouse = now
+
+    def on_keyboard_press(self, key=None) -> None:
+        self._keystrokes += 1
+        self._last_key = time.monotonic()
+
+    def on_mouse_move(self, x=None, y=None) -> None:
+        now = time.monotonic()
+        if now - self._last_mouse >= self.move_sample_interval:
+            self._mouse_moves += 1
+            self._last_mouse = now
+
+    def on_mouse_click(self, x=None, y=None, button=None, pressed=True) -> None:
+        if pressed:
+            self._clicks += 1
+            self._last_mouse = time.monotonic()
+
+    def last_input(self) -> float:
+        return max(self._last_key, self._last_mouse)
+
+    def idle_seconds(self) -> float:
+        return time.monotonic() - self.last_input()
+
+    def snapshot(self) -> InputSnapshot:
+        return InputSnapshot(self._keystrokes, self._clicks, self._mouse_moves, self.last_input())
+
+    def since(self, start: InputSnapshot) -> InputSnapshot:
+        """Активность, накопленная после снимка start."""
+        current = self.snapshot()
+        return InputSnapshot(
+            current.keystrokes - start.keystrokes,
+            current.clicks - start.clicks,
+            current.mouse_moves - start.mouse_moves,
+            current.last_input,
+        )
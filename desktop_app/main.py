@@ -20,8 +20,6 @@ import configparser
 import os
 import threading
 from logging.handlers import RotatingFileHandler
-import queue
-import sqlite3
 from typing import Dict, List, Optional, Any, Tuple
 import webbrowser
 import re
@@ -76,6 +74,12 @@ logger = setup_logging()
 
 # Импортируем APIClient из api_client.py вместо использования встроенного класса
 from api_client import APIClient
+from outbox import ActivityOutbox, default_outbox_path
+from uploader import ActivityUploader
+from application_map import ApplicationMap, default_application_map_path
+from window_sources import create_window_source
+from process_cache import ProcessNameCache, ProcessSnapshot
+from input_activity import InputActivityAggregator
 
 # Этот класс больше не используется, но оставлен для совместимости с существующим кодом
 # который может ссылаться на него
@@ -488,20 +492,33 @@ class TimeTrackerApp(QMainWindow):
                 # Можно рассмотреть вариант с генерацией временного ID или прерыванием работы
                 self.machine_id = "error_machine_id_" + ''.join(random.choices(string.ascii_lowercase + string.digits, k=16))
 
-        # Очередь для активностей
-        self.activity_queue = queue.Queue()
+        # Очередь неотправленных активностей на диске: переживает падение и перезапуск
+        outbox_path = self.config.get('Settings', 'outbox_path', fallback='') or default_outbox_path()
+        self.activity_outbox = ActivityOutbox(
+            outbox_path,
+            max_rows=self.config.getint('Settings', 'outbox_max_rows', fallback=200000),
+            commit_batch_size=self.config.getint('Settings', 'outbox_commit_batch_size', fallback=20),
+        )
 
         # Атрибуты для отслеживания состояния
         self.current_activity_data = None 
         self.activity_start_time = None 
-        self.last_activity_time = time.time() 
         self.idle_threshold_seconds = self.config.getint('Settings', 'idle_threshold_seconds', fallback=300)
         self.is_idle = False 
-        self.keyboard_press_count = 0  # Счетчик нажатий клавиш
+        # Счетчики клавиатуры и мыши; снимок в начале сессии дает нажатия за сессию
+        self.input_activity = InputActivityAggregator(
+            move_sample_interval=self.config.getfloat('Settings', 'mouse_sample_interval_seconds', fallback=0.5)
+        )
+        self._session_input = self.input_activity.snapshot()
+        self._tracking_stopped = threading.Event()
+        # Имена процессов по PID и таблица процессов без полного обхода на каждом тике
+        self.process_names = ProcessNameCache()
+        self.process_snapshot = ProcessSnapshot(self.process_names)
         # self.active_window_details = {'app_name': '', 'window_title': ''} # Этот атрибут больше не используется
         
-        # Кэш для хранения соответствия имен приложений и их ID на сервере
-        self.app_cache = {}
+        # Соответствие имен процессов и ID приложений на сервере из прошлого запуска;
+        # поток отправки обновляет его с ETag и регистрирует новые приложения пакетом
+        self.application_map = ApplicationMap(default_application_map_path())
         
         # Конфигурация отслеживаемых приложений и игнорируемых процессов
         self.tracked_applications_config = {} 
@@ -565,6 +582,24 @@ class TimeTrackerApp(QMainWindow):
         # Подключаем сигнал для повторной авторизации
         self.login_required_signal.connect(self.show_login_dialog_if_needed)
 
+        # Отправка данных и проверка соединения выполняются в отдельном потоке,
+        # чтобы интерфейс и отслеживание не ждали ответа сервера
+        self.uploader = ActivityUploader(
+            self.activity_outbox,
+            batch_size=self.config.getint('Settings', 'max_send_batch_size', fallback=20),
+            max_in_flight=self.config.getint('Settings', 'max_in_flight_batches', fallback=2),
+            wire_format=self.config.get('Settings', 'upload_format', fallback='columnar'),
+            compress=self.config.getboolean('Settings', 'upload_gzip', fallback=True),
+            poll_interval=send_interval_seconds,
+            max_backoff=self.config.getint('Settings', 'max_send_backoff_seconds', fallback=300),
+            application_map=self.application_map,
+        )
+        self.uploader.batch_sent.connect(self.on_batch_sent)
+        self.uploader.upload_failed.connect(self.on_upload_failed)
+        self.uploader.auth_required.connect(self.on_upload_auth_required)
+        self.uploader.connection_checked.connect(self.on_connection_checked)
+        self.uploader.start()
+
         # Таймер для периодического обновления интерфейса
         self.update_ui_timer = QTimer(self)
         self.update_ui_timer.timeout.connect(self.periodic_ui_update)
@@ -666,6 +701,7 @@ class TimeTrackerApp(QMainWindow):
         config.set('Settings', 'send_interval_seconds', '10')   # 10 секунд по умолчанию
         config.set('Settings', 'max_send_batch_size', '20')     # До 20 записей за раз
         config.set('Settings', 'demo_mode', 'False')            # Демо-режим выключен по умолчанию
+        config.set('Settings', 'window_source', 'auto')         # auto, winevent, x11 или polling
         
         # Секция Applications - для списка отслеживаемых приложений
         config.add_section('Applications')
@@ -698,13 +734,25 @@ class TimeTrackerApp(QMainWindow):
 
     def setup_activity_listeners_and_tracking_timer(self):
         # Настройка слушателей и основного таймера трекинга
-        self.keyboard_listener = keyboard.Listener(on_press=self.on_keyboard_press)
-        self.mouse_listener = mouse.Listener(on_move=self.on_mouse_move, on_click=self.on_mouse_click)
+        # Обработчики только увеличивают счетчики, состояние простоя проверяет таймер
+        self.keyboard_listener = keyboard.Listener(on_press=self.input_activity.on_keyboard_press)
+        self.mouse_listener = mouse.Listener(
+            on_move=self.input_activity.on_mouse_move,
+            on_click=self.input_activity.on_mouse_click
+        )
         
         # Запускаем слушатели
         self.keyboard_listener.start()
         self.mouse_listener.start()
         
+        # Источник смены активного окна: события ОС, а при их недоступности - опрос
+        self.window_source = create_window_source(
+            self.get_active_window_info,
+            preferred=self.config.get('Settings', 'window_source', fallback='auto'),
+            poll_interval=self.config.getfloat('Settings', 'window_poll_interval_seconds', fallback=1.0),
+            process_names=self.process_names
+        )
+        
         # Запускаем поток отслеживания активности
         self.process_activity_thread = threading.Thread(target=self.track_activity, daemon=True)
         self.process_activity_thread.start()
@@ -714,57 +762,19 @@ class TimeTrackerApp(QMainWindow):
         self.idle_check_timer.timeout.connect(self.check_idle_state)
         self.idle_check_timer.start(5000)  # Проверяем каждые 5 секунд
         
-    def on_keyboard_press(self, key):
-        """Обработчик нажатия клавиш."""
-        try:
-            # Обновляем время последней активности
-            self.last_activity_time = time.time()
-            
-            # Если состояние было "простой", меняем на "активно"
-            if self.is_idle:
-                self.is_idle = False
-                logger.info("Пользователь снова активен (нажатие клавиши)")
-                
-            # Увеличиваем счетчик нажатий для текущей активности
-            self.keyboard_press_count += 1
-            
-            # Добавляем отладочную информацию, если нужно
-            # logger.debug(f"Нажата клавиша: {key}. Всего нажатий: {self.keyboard_press_count}")
-        except Exception as e:
-            logger.error(f"Ошибка при обработке нажатия клавиши: {e}", exc_info=True)
+    @property
+    def keyboard_press_count(self) -> int:
+        """Нажатия клавиш в текущей сессии активности."""
+        return self.input_activity.since(self._session_input).keystrokes
     
-    def on_mouse_move(self, x, y):
-        """Обработчик движения мыши."""
-        try:
-            # Обновляем время последней активности
-            self.last_activity_time = time.time()
-            
-            # Если состояние было "простой", меняем на "активно"
-            if self.is_idle:
-                self.is_idle = False
-                logger.info("Пользователь снова активен (движение мыши)")
-        except Exception as e:
-            logger.error(f"Ошибка при обработке движения мыши: {e}", exc_info=True)
-    
-    def on_mouse_click(self, x, y, button, pressed):
-        """Обработчик кликов мыши."""
-        try:
-            if pressed:  # Обрабатываем только нажатия, не отпускания
-                # Обновляем время последней активности
-                self.last_activity_time = time.time()
-                
-                # Если состояние было "простой", меняем на "активно"
-                if self.is_idle:
-                    self.is_idle = False
-                    logger.info("Пользователь снова активен (клик мыши)")
-        except Exception as e:
-            logger.error(f"Ошибка при обработке клика мыши: {e}", exc_info=True)
+    def user_is_idle(self) -> bool:
+        """Простой по последнему действию пользователя, без ожидания таймера проверки."""
+        return self.input_activity.idle_seconds() > self.idle_threshold_seconds
     
     def check_idle_state(self):
         """Проверяет, находится ли пользователь в состоянии простоя."""
         try:
-            current_time = time.time()
-            idle_time = current_time - self.last_activity_time
+            idle_time = self.input_activity.idle_seconds()
             
             # Если превышен порог и пользователь еще не считается неактивным
             if idle_time > self.idle_threshold_seconds and not self.is_idle:
@@ -799,23 +809,18 @@ class TimeTrackerApp(QMainWindow):
         # Задержка перед началом отслеживания, чтобы дать время на инициализацию UI
         time.sleep(1)
         
-        # Инициализируем переменные для отслеживания текущего активного окна
-        current_app_name = None
-        current_window_title = None
-        
-        while True:
+        while not self._tracking_stopped.is_set():
             try:
-                # Если отслеживание на паузе, пропускаем итерацию
+                # Если отслеживание на паузе, пропускаем итерацию.
+                # Смены окна за время паузы источник отдаст после ее снятия
                 if self.tracking_paused:
-                    time.sleep(1)
+                    self._tracking_stopped.wait(1)
                     continue
                 
-                # Получаем информацию о текущем активном окне
-                active_window_info = self.get_active_window_info()
+                # Ждем смены активного окна; пока пользователь в одном окне, поток спит
+                active_window_info = self.window_source.wait_for_change(timeout=5)
                 
                 if not active_window_info:
-                    # Если не удалось получить информацию, ждем и пробуем снова
-                    time.sleep(1)
                     continue
                 
                 app_name = active_window_info.get('app_name', '')
@@ -829,42 +834,34 @@ class TimeTrackerApp(QMainWindow):
                         if self.current_activity_data['app_name'].lower() != app_name.lower():
                             logger.debug(f"Обнаружен игнорируемый процесс: {app_name}. Завершаем текущую сессию.")
                             self.end_current_activity_session(event_type="ignored_process")
-                    time.sleep(1)
                     continue
                 
                 # Если это система или пустое имя, пропускаем итерацию
                 if not app_name or app_name.lower() in ['system', 'system idle process']:
-                    time.sleep(1)
                     continue
                 
-                # Если приложение изменилось
-                if app_name != current_app_name or window_title != current_window_title:
-                    logger.debug(f"Изменилось активное окно: {app_name} ({window_title})")
-                    
-                    # Проверяем, является ли приложение полезным согласно конфигурации
-                    is_useful = self.is_app_useful(app_name)
-                    
-                    # Если текущая сессия существует, завершаем ее
-                    if self.current_activity_data:
-                        self.end_current_activity_session(event_type="switch")
-                    
-                    # Начинаем новую сессию
-                    if not self.is_idle:  # Только если пользователь активен
-                        self.start_new_activity_session(app_name, window_title, is_useful)
-                    
-                    # Обновляем текущие значения
-                    current_app_name = app_name
-                    current_window_title = window_title
-                    
-                    # Обновляем информацию о текущей активности в UI
-                    if hasattr(self, 'current_app_label'):
-                        self.update_status_signal.emit(f"Отслеживается: {app_name}")
+                # Источник возвращает окно только при смене приложения или заголовка
+                logger.debug(f"Изменилось активное окно: {app_name} ({window_title})")
+                
+                # Проверяем, является ли приложение полезным согласно конфигурации
+                is_useful = self.is_app_useful(app_name)
+                
+                # Если текущая сессия существует, завершаем ее
+                if self.current_activity_data:
+                    self.end_current_activity_session(event_type="switch")
                 
-                # Ждем перед следующей проверкой
-                time.sleep(1)
+                # Начинаем новую сессию
+                if not self.user_is_idle():  # Только если пользователь активен
+                    self.start_new_activity_session(app_name, window_title, is_useful)
+                
+                # Обновляем информацию о текущей активности в UI
+                if hasattr(self, 'current_app_label'):
+                    self.update_status_signal.emit(f"Отслеживается: {app_name}")
             except Exception as e:
                 logger.error(f"Ошибка в потоке отслеживания активности: {e}", exc_info=True)
-                time.sleep(5)  # В случае ошибки увеличиваем задержку
+                self._tracking_stopped.wait(5)  # В случае ошибки увеличиваем задержку
+        
+        logger.info("Поток отслеживания активности остановлен")
     
     def init_ui(self):
         """Инициализация пользовательского интерфейса"""
@@ -1283,6 +1280,9 @@ class TimeTrackerApp(QMainWindow):
                     # Перезапускаем таймер отправки данных, если интервал мог измениться
                     send_interval_seconds = self.config.getint('Settings', 'send_interval_seconds', fallback=60)
                     self.send_data_timer.setInterval(send_interval_seconds * 1000)
+                    self.uploader.poll_interval = send_interval_seconds
+                    # Отправляем накопленное сразу после входа
+                    self.send_activity_data()
                     
                     # Обновляем состояние подключения в интерфейсе
                     self.connection_status.setText(f"Статус подключения: Подключено ({self.api_base_url})")
@@ -1461,20 +1461,34 @@ class TimeTrackerApp(QMainWindow):
                     self.ui_update_timer.stop()
                 if hasattr(self, 'idle_check_timer'):
                     self.idle_check_timer.stop()
+                if hasattr(self, 'send_data_timer'):
+                    self.send_data_timer.stop()
             except Exception as e:
                 logger.error(f"Ошибка остановки таймеров: {e}")
             
-            # Очищаем очередь активностей
+            # Останавливаем источник событий окна и поток отслеживания
+            try:
+                self._tracking_stopped.set()
+                if hasattr(self, 'window_source'):
+                    self.window_source.stop()
+            except Exception as e:
+                logger.error(f"Ошибка остановки отслеживания окон: {e}")
+            
+            # Останавливаем поток отправки; начатый запрос ждем недолго, записи все равно останутся в очереди
             try:
-                if hasattr(self, 'activity_queue'):
-                    while not self.activity_queue.empty():
-                        try:
-                            self.activity_queue.get_nowait()
-                            self.activity_queue.task_done()
-                        except:
-                            pass
+                if hasattr(self, 'uploader'):
+                    self.uploader.stop()
+                    self.uploader.wait(5000)
             except Exception as e:
-                logger.error(f"Ошибка очистки очереди: {e}")
+                logger.error(f"Ошибка остановки потока отправки: {e}")
+            
+            # Сохраняем очередь на диск: неотправленные записи уйдут после следующего запуска
+            try:
+                if hasattr(self, 'activity_outbox'):
+                    logger.info(f"Неотправленных записей в очереди: {self.activity_outbox.qsize()}")
+                    self.activity_outbox.close()
+            except Exception as e:
+                logger.error(f"Ошибка сохранения очереди: {e}")
             
             logger.info('Приложение завершает работу корректно.')
         except Exception as e:
@@ -1630,12 +1644,8 @@ class TimeTrackerApp(QMainWindow):
             # Получаем ID процесса
             _, process_id = win32process.GetWindowThreadProcessId(active_window_handle)
             
-            # Получаем имя процесса
-            try:
-                process = psutil.Process(process_id)
-                app_name = process.name()
-            except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
-                app_name = "Unknown"
+            # Получаем имя процесса из кэша, сверяя время запуска процесса
+            app_name = self.process_names.name(process_id) or "Unknown"
             
             # Возвращаем словарь с информацией об активном окне
             return {
@@ -1667,7 +1677,7 @@ class TimeTrackerApp(QMainWindow):
         """Начинает новую сессию активности"""
         try:
             # Проверяем, не находится ли пользователь в состоянии простоя
-            if self.is_idle:
+            if self.user_is_idle():
                 logger.info("Попытка начать сессию активности, но пользователь неактивен.")
                 return False
                 
@@ -1701,8 +1711,8 @@ class TimeTrackerApp(QMainWindow):
             # Запоминаем время начала активности
             self.activity_start_time = start_time
             
-            # Сбрасываем счетчик нажатий клавиш
-            self.keyboard_press_count = 0
+            # Запоминаем показания счетчиков ввода на начало сессии
+            self._session_input = self.input_activity.snapshot()
             
             # Обновляем интерфейс
             status_message = f"Начата сессия для '{app_name}'"
@@ -1739,11 +1749,11 @@ class TimeTrackerApp(QMainWindow):
         activity_entry = self.current_activity_data.copy()
         
         # Добавляем данные о клавиатурной активности
+        session_input = self.input_activity.since(self._session_input)
         if 'keyboard_presses' not in activity_entry or activity_entry['keyboard_presses'] == 0:
-            activity_entry['keyboard_presses'] = self.keyboard_press_count
-            logger.info(f"Добавлено {self.keyboard_press_count} нажатий клавиш в активность")
-            # Сбрасываем счетчик после добавления в активность
-            self.keyboard_press_count = 0
+            activity_entry['keyboard_presses'] = session_input.keystrokes
+            logger.info(f"Добавлено {session_input.keystrokes} нажатий клавиш в активность")
+        activity_entry['mouse_clicks'] = session_input.clicks
         
         activity_entry.update({
             'end_time': end_time,
@@ -1752,24 +1762,24 @@ class TimeTrackerApp(QMainWindow):
             'event_type': event_type
         })
         
-        # Добавляем в очередь для отправки
-        self.activity_queue.put(activity_entry)
+        # Добавляем в очередь на диске для отправки
+        self.activity_outbox.append(activity_entry)
         
         logger.info(
             f"Завершена сессия активности: "
             f"App='{activity_entry['app_name']}', "
             f"Title='{activity_entry['window_title'][:30]}{'...' if len(activity_entry['window_title']) > 30 else ''}, "
-            f"Duration={duration_seconds}s. В очереди: {self.activity_queue.qsize()}"
+            f"Duration={duration_seconds}s. В очереди: {self.activity_outbox.qsize()}"
         )
         
         # Обновление статус-бара и тултипа трея
-        status_message = f"Сессия для '{activity_entry['app_name']}' завершена. В очереди: {self.activity_queue.qsize()}"
+        status_message = f"Сессия для '{activity_entry['app_name']}' завершена. В очереди: {self.activity_outbox.qsize()}"
         self.status_bar.showMessage(status_message)
         if hasattr(self, 'tray_icon') and self.tray_icon:
             # Для тултипа можно показать более общее сообщение после завершения сессии
-            tooltip_message = f"Готов к отслеживанию. В очереди: {self.activity_queue.qsize()}"
+            tooltip_message = f"Готов к отслеживанию. В очереди: {self.activity_outbox.qsize()}"
             if self.is_idle: # Если перешли в idle, то сообщение будет другим из handle_idle_state_change
-                 tooltip_message = f"Пользователь неактивен. В очереди: {self.activity_queue.qsize()}"
+                 tooltip_message = f"Пользователь неактивен. В очереди: {self.activity_outbox.qsize()}"
             self.tray_icon.setToolTip(tooltip_message)
             
         # Очистка данных текущей сессии
@@ -1781,19 +1791,12 @@ class TimeTrackerApp(QMainWindow):
         """Возвращает список уникальных имен запущенных приложений."""
         discovered_apps = set()
         try:
-            for proc in psutil.process_iter(['name']):
-                try:
-                    app_name = proc.info['name']
-                    if app_name and app_name.strip(): # Проверяем, что имя не пустое
-                        # Приводим к нижнему регистру для унификации
-                        discovered_apps.add(app_name.lower())
-                except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
-                    # Эти исключения ожидаемы для некоторых процессов
-                    continue 
-                except Exception as e:
-                    logger.debug(f"Ошибка при получении имени процесса {proc.pid if hasattr(proc, 'pid') else 'N/A'}: {e}")
+            # Таблица процессов обновляется по разнице PID: данные читаются только для новых процессов
+            self.process_snapshot.refresh()
+            # Приводим к нижнему регистру для унификации
+            discovered_apps = {name.lower() for name in self.process_snapshot.names()}
         except Exception as e:
-            logger.error(f"Ошибка при итерации по процессам: {e}", exc_info=True)
+            logger.error(f"Ошибка при обновлении списка процессов: {e}", exc_info=True)
         
         # Можно добавить фильтрацию по self.ignored_processes, если это нужно глобально,
         # или оставить это на усмотрение SettingsDialog
@@ -1858,7 +1861,7 @@ class TimeTrackerApp(QMainWindow):
 
     def send_activity_data(self):
         """Отправляет накопленные данные активности на сервер."""
-        if self.activity_queue.empty():
+        if self.activity_outbox.empty():
             logger.debug("Очередь активностей пуста, нечего отправлять.")
             return
             
@@ -1868,15 +1871,12 @@ class TimeTrackerApp(QMainWindow):
         if demo_mode:
             # В демо-режиме просто очищаем очередь и логируем данные
             max_batch_size = self.config.getint('Settings', 'max_send_batch_size', fallback=20)
-            activities_to_send = []
             
-            # Собираем до max_batch_size активностей из очереди
-            for _ in range(min(max_batch_size, self.activity_queue.qsize())):
-                if not self.activity_queue.empty():
-                    activity = self.activity_queue.get()
-                    activities_to_send.append(activity)
+            # Забираем до max_batch_size активностей из очереди
+            page = self.activity_outbox.peek(max_batch_size)
+            self.activity_outbox.ack(row_id for row_id, _ in page)
             
-            logger.info(f"Демо-режим: Обработано {len(activities_to_send)} записей активности. Данные не отправляются на сервер.")
+            logger.info(f"Демо-режим: Обработано {len(page)} записей активности. Данные не отправляются на сервер.")
             return
         
         # Получаем данные пользователя и токен из конфигурации
@@ -1947,248 +1947,37 @@ class TimeTrackerApp(QMainWindow):
             self._save_config(self.config)
             return
             
-        # Заголовки для запроса
-        headers = {
-            'Content-Type': 'application/json',
-            'Authorization': f'Bearer {auth_token}'
-        }
-        
-        # Обновляем заголовки сессии
-        self.session.headers.update({'Authorization': f'Bearer {auth_token}'})
-        
-        # Собираем пакет данных для отправки
-        max_batch_size = self.config.getint('Settings', 'max_send_batch_size', fallback=20)
-        activities_to_send = []
-        activities_to_send_payload = []
-        
-        try:
-            # Собираем до max_batch_size активностей из очереди
-            for _ in range(min(max_batch_size, self.activity_queue.qsize())):
-                if self.activity_queue.empty():
-                    break
-                activity_dict = self.activity_queue.get_nowait()
-                activities_to_send.append(activity_dict)
-                
-                # Формируем данные для API
-                # Убедимся, что все обязательные поля заполнены
-                start_time = activity_dict.get('start_time_iso_utc', '')
-                end_time = activity_dict.get('end_time_iso_utc', '')
-                
-                # Если поля не заполнены, сгенерируем текущие значения
-                if not start_time:
-                    start_time = datetime.now(tz=datetime.UTC).isoformat()
-                if not end_time:
-                    end_time = datetime.now(tz=datetime.UTC).isoformat()
-                
-                # Сервер ожидает определенный формат данных
-                # Добавляем все обязательные поля
-                duration_seconds = activity_dict.get('duration_seconds', 0)
-                if duration_seconds is None or duration_seconds == 0:
-                    duration_seconds = 1  # Минимальная длительность
-                
-                # Вычисляем длительность на основе start_time и end_time
-                try:
-                    start_dt = datetime.fromisoformat(start_time.replace('Z', '+00:00'))
-                    end_dt = datetime.fromisoformat(end_time.replace('Z', '+00:00'))
-                    # Вычисляем разницу во времени
-                    time_diff = end_dt - start_dt
-                    calculated_seconds = time_diff.total_seconds()
-                    
-                    if calculated_seconds <= 0:
-                        calculated_seconds = duration_seconds if duration_seconds > 0 else 1
-                        # Создаем объект timedelta для поля duration
-                        duration_obj = timedelta(seconds=calculated_seconds)
-                    else:
-                        # Используем реальную разницу во времени
-                        duration_obj = time_diff
-                except Exception as e:
-                    logger.error(f"Ошибка при вычислении длительности: {e}")
-                    calculated_seconds = duration_seconds if duration_seconds > 0 else 1
-                    duration_obj = timedelta(seconds=calculated_seconds)
-                    
-                # Добавляем отладочную информацию
-                logger.info(f"Вычисленная длительность: {calculated_seconds} секунд")
-                
-                # Определяем ID приложения на основе имени процесса
-                app_name = activity_dict.get('app_name', '')
-                
-                # Проверяем, есть ли уже такое приложение в кэше
-                app_id = None
-                if app_name.lower() in self.app_cache:
-                    app_id = self.app_cache[app_name.lower()]
-                    logger.debug(f"Найден ID в кэше для {app_name}: {app_id}")
-                else:
-                    # Если нет в кэше, создаем новое приложение на сервере
-                    try:
-                        # Создаем новое приложение
-                        app_data = {
-                            'name': app_name,
-                            'process_name': app_name,
-                            'is_productive': False  # По умолчанию не продуктивное
-                        }
-                        
-                        # Отправляем запрос на создание приложения
-                        app_url = f"{self.api_base_url}applications/"
-                        logger.info(f"Отправляем запрос на создание приложения: {app_url}")
-                        app_response = self.session.post(app_url, json=app_data)
-                        
-                        if app_response.status_code == 201:  # Создано успешно
-                            app_data = app_response.json()
-                            app_id = app_data.get('id')
-                            # Сохраняем в кэш
-                            self.app_cache[app_name.lower()] = app_id
-                            logger.info(f"Создано новое приложение: {app_name} с ID={app_id}")
-                        else:
-                            # Если не удалось создать, используем ID=1 по умолчанию
-                            app_id = 1
-                            logger.warning(f"Не удалось создать приложение {app_name}, используем ID по умолчанию")
-                    except Exception as e:
-                        # В случае ошибки используем ID=1
-                        app_id = 1
-                        logger.error(f"Ошибка при создании приложения {app_name}: {e}")
-                
-                # Если все равно не получили ID, используем значение по умолчанию
-                if app_id is None:
-                    app_id = 1
-                    
-                # Для отладки выводим информацию о выбранном ID
-                logger.info(f"Для приложения {app_name} выбран ID={app_id}")
-                
-                # Добавляем количество нажатий клавиш в пайлоад
-                keyboard_presses = activity_dict.get('keyboard_presses', 0)
-                if keyboard_presses == 0 and self.keyboard_press_count > 0:
-                    keyboard_presses = self.keyboard_press_count
-                    # Сбрасываем счетчик после отправки
-                    logger.info(f"Отправляем клавиатурную активность: {self.keyboard_press_count} нажатий")
-                    self.keyboard_press_count = 0
-                    
-                api_payload = {
-                    'application': app_id,  # Используем правильный ID приложения
-                    'title': activity_dict.get('window_title', ''),
-                    'start_time': start_time,
-                    'end_time': end_time,
-                    # Не отправляем duration, так как сервер вычислит его автоматически
-                    'is_productive': activity_dict.get('is_useful', False),
-                    'app_name': app_name,
-                    'keyboard_presses': keyboard_presses  # Добавляем количество нажатий клавиш
-                    # Удаляем поле user, так как пользователь определяется по токену на сервере
-                }
-                
-                # Добавляем отладочную информацию
-                logger.info(f"Отправка активности: start_time={start_time}, end_time={end_time}, длительность={calculated_seconds} секунд")
-                activities_to_send_payload.append(api_payload)
+        # Передаем адрес и токен потоку отправки и будим его; сеть на GUI-потоке не используется
+        self.uploader.configure(api_url + 'bulk/', auth_token)
+        self.uploader.wake()
 
-            if not activities_to_send_payload:
-                logger.debug("Нет данных для отправки после фильтрации.")
-                return
-                
-            # Отправляем данные на сервер
-            logger.info(f"Отправка {len(activities_to_send_payload)} записей активности на сервер.")
-            logger.info(f"API URL: {api_url}, Токен: {auth_token[:10]}...")
-            
-            # Сервер ожидает отдельные записи, а не массив
-            # Отправляем каждую запись по отдельности
-            success_count = 0
-            for payload in activities_to_send_payload:
-                try:
-                    # Добавляем отладочную информацию о пайлоаде
-                    logger.info(f"Отправляем пайлоад: {payload}")
-                    response = self.session.post(api_url, json=payload, headers=headers, timeout=30)
-                    if response.status_code in [200, 201]:
-                        success_count += 1
-                        logger.info(f"Успешно отправлено: {response.status_code} - {response.text}")
-                    elif response.status_code == 401:
-                        # Ошибка авторизации - токен недействителен
-                        logger.error(f"Ошибка авторизации: {response.status_code} - {response.text}")
-                        
-                        # Удаляем недействительный токен из конфигурации
-                        if self.config.has_section('Credentials') and self.config.has_option('Credentials', 'auth_token'):
-                            self.config.set('Credentials', 'auth_token', '')
-                        if self.config.has_section('Server') and self.config.has_option('Server', 'token'):
-                            self.config.set('Server', 'token', '')
-                        if self.config.has_section('API') and self.config.has_option('API', 'token'):
-                            self.config.set('API', 'token', '')
-                        if self.config.has_option('DEFAULT', 'token'):
-                            self.config.set('DEFAULT', 'token', '')
-                            
-                        # Сохраняем обновленную конфигурацию
-                        self._save_config(self.config)
-                        
-                        # Запрашиваем повторную авторизацию
-                        logger.info("Требуется повторная авторизация. Запрашиваем новый токен...")
-                        
-                        # Сигнал для показа диалога авторизации
-                        self.login_required_signal.emit()
-                        
-                        # Возвращаем все активности обратно в очередь для повторной отправки
-                        for activity in activities_to_send:
-                            self.activity_queue.put(activity)
-                        
-                        # Прерываем отправку
-                        return
-                    else:
-                        logger.error(f"Ошибка при отправке записи: {response.status_code} - {response.text}")
-                        # Возвращаем активность обратно в очередь
-                        for i, activity in enumerate(activities_to_send):
-                            if activity.get('app_name') == payload.get('app_name') and activity.get('start_time_iso_utc') == payload.get('start_time'):
-                                self.activity_queue.put(activity)
-                                break
-                except Exception as e:
-                    logger.error(f"Ошибка при отправке записи: {e}")
-            
-            # Создаем фиктивный ответ для обработки в основном коде
-            class DummyResponse:
-                def __init__(self, status_code):
-                    self.status_code = status_code
-                    self.text = f"Успешно отправлено {success_count} из {len(activities_to_send_payload)} записей"
-            
-            response = DummyResponse(200 if success_count > 0 else 400)
-            
-            if response.status_code == 200 or response.status_code == 201:
-                logger.info(f"Успешно отправлено {len(activities_to_send_payload)} записей активности.")
-                self.status_bar.showMessage(f"Отправлено {len(activities_to_send_payload)} записей активности.")
-            elif response.status_code == 401:
-                logger.warning("Токен недействителен, требуется повторная авторизация.")
-                # Удаляем устаревший токен из секций Credentials, Server, API и DEFAULT
-                if self.config.has_section('Credentials') and self.config.has_option('Credentials', 'auth_token'):
-                    self.config.remove_option('Credentials', 'auth_token')
-                if self.config.has_section('Server') and self.config.has_option('Server', 'token'):
-                    self.config.remove_option('Server', 'token')
-                if self.config.has_section('API') and self.config.has_option('API', 'token'):
-                    self.config.remove_option('API', 'token')
-                if self.config.has_option(self.config.default_section, 'token'):
-                    self.config.remove_option(self.config.default_section, 'token')
-                # Включаем демо-режим до повторной авторизации
-                if not self.config.has_section('Settings'):
-                    self.config.add_section('Settings')
-                self.config.set('Settings', 'demo_mode', 'True')
-                # Сохраняем конфигурацию и очищаем заголовок авторизации
-                self._save_config(self.config)
-                self.session.headers.pop('Authorization', None)
-                # Запрашиваем повторную авторизацию
-                QTimer.singleShot(0, self.show_login_dialog_if_needed)
-                # Возвращаем активности обратно в очередь
-                for activity in activities_to_send:
-                    self.activity_queue.put(activity)
-                return
-            else:
-                logger.error(f"Ошибка при отправке данных: {response.status_code} - {response.text}")
-                self.status_bar.showMessage(f"Ошибка отправки данных: {response.status_code}")
-                # Возвращаем активности обратно в очередь
-                for activity in activities_to_send:
-                    self.activity_queue.put(activity)
-        except requests.RequestException as e:
-            logger.error(f"Ошибка сети при отправке данных: {e}", exc_info=True)
-            self.status_bar.showMessage(f"Ошибка сети: {str(e)[:50]}...")
-            # Возвращаем активности обратно в очередь
-            for activity in activities_to_send:
-                self.activity_queue.put(activity)
-        except Exception as e:
-            logger.error(f"Непредвиденная ошибка при отправке данных: {e}", exc_info=True)
-            self.status_bar.showMessage(f"Ошибка: {str(e)[:50]}...")
-            # Возвращаем активности обратно в очередь
-            for activity in activities_to_send:
-                self.activity_queue.put(activity)
+    def on_batch_sent(self, sent_count: int, remaining: int):
+        """Обрабатывает подтверждение пакета потоком отправки."""
+        self.status_bar.showMessage(f"Отправлено {sent_count} записей активности. В очереди: {remaining}")
+
+    def on_upload_failed(self, message: str):
+        """Показывает ошибку отправки; повтор поток отправки выполнит сам."""
+        self.status_bar.showMessage(message)
+
+    def on_upload_auth_required(self):
+        """Сервер отклонил токен: удаляем его и запрашиваем повторную авторизацию."""
+        # Удаляем недействительный токен из конфигурации
+        if self.config.has_section('Credentials') and self.config.has_option('Credentials', 'auth_token'):
+            self.config.set('Credentials', 'auth_token', '')
+        if self.config.has_section('Server') and self.config.has_option('Server', 'token'):
+            self.config.set('Server', 'token', '')
+        if self.config.has_section('API') and self.config.has_option('API', 'token'):
+            self.config.set('API', 'token', '')
+        if self.config.has_option('DEFAULT', 'token'):
+            self.config.set('DEFAULT', 'token', '')
+            
+        # Сохраняем обновленную конфигурацию
+        self._save_config(self.config)
+        self.session.headers.pop('Authorization', None)
+        
+        # Запрашиваем повторную авторизацию, записи остаются в очереди
+        logger.info("Требуется повторная авторизация. Запрашиваем новый токен...")
+        self.login_required_signal.emit()
 
     def show_settings_dialog(self):
         dialog = SettingsDialog(self) # Передаем ссылку на главное окно
@@ -2218,33 +2007,33 @@ class TimeTrackerApp(QMainWindow):
         else:
             api_url = 'http://localhost:8000/api'
             
-        try:
-            # Проверяем соединение напрямую через запрос
-            headers = {'Authorization': f'Bearer {auth_token}'} if auth_token else {}
-            response = requests.get(f"{api_url}/", headers=headers, timeout=(3, 5))
+        # Запрос выполняется в потоке отправки, результат придет в on_connection_checked
+        self.uploader.check_connection(api_url, auth_token)
+
+    def on_connection_checked(self, status_code: int, detail: str):
+        """Обновляет статус подключения по результату проверки из потока отправки."""
+        if status_code == 200:
+            self.connection_status.setText(f"Статус подключения: Подключено ({detail})")
+            self.connection_status.setStyleSheet("QLabel { color: green; }")
+            logger.info(f"Проверка соединения: успешно")
+        elif status_code == 401:
+            self.connection_status.setText("Статус подключения: Ошибка авторизации")
+            self.connection_status.setStyleSheet("QLabel { color: red; }")
+            logger.warning(f"Ошибка проверки соединения: Недействительный токен (401)")
             
-            if response.status_code == 200:
-                self.connection_status.setText(f"Статус подключения: Подключено ({api_url})")
-                self.connection_status.setStyleSheet("QLabel { color: green; }")
-                logger.info(f"Проверка соединения: успешно")
-            elif response.status_code == 401:
-                self.connection_status.setText("Статус подключения: Ошибка авторизации")
-                self.connection_status.setStyleSheet("QLabel { color: red; }")
-                logger.warning(f"Ошибка проверки соединения: Недействительный токен (401)")
-                
-                # Планируем показ диалога авторизации с задержкой
-                QTimer.singleShot(1000, self.login_required_signal.emit)
-            else:
-                self.connection_status.setText("Статус подключения: Ошибка")
-                self.connection_status.setStyleSheet("QLabel { color: red; }")
-                logger.warning(f"Ошибка проверки соединения: {response.status_code}")
-        except Exception as e:
+            # Планируем показ диалога авторизации с задержкой
+            QTimer.singleShot(1000, self.login_required_signal.emit)
+        elif status_code:
+            self.connection_status.setText("Статус подключения: Ошибка")
+            self.connection_status.setStyleSheet("QLabel { color: red; }")
+            logger.warning(f"Ошибка проверки соединения: {status_code}")
+        else:
             self.connection_status.setText("Статус подключения: Ошибка")
             self.connection_status.setStyleSheet("QLabel { color: red; }")
-            logger.error(f"Ошибка при проверке соединения: {e}")
+            logger.error(f"Ошибка при проверке соединения: {detail}")
             
             # Отображаем информацию об ошибке
-            self.status_bar.showMessage(f"Ошибка соединения: {str(e)[:100]}")
+            self.status_bar.showMessage(f"Ошибка соединения: {detail[:100]}")
             
             # Планируем показ диалога авторизации с задержкой
             QTimer.singleShot(1000, self.login_required_signal.emit)
@@ -0,0 +1,150 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Tuple
+
+logger = logging.getLogger("TimeTracker")
+
+
+class ActivityOutbox:
+    """Очередь неотправленных активностей на диске (SQLite в режиме WAL).
+
+    Записи переживают падение и перезапуск приложения. Добавление
+    коммитится пакетами, чтение идет страницами, а удаление выполняется
+    только после подтверждения приема сервером.
+    """
+
+    def __init__(self, path: Path, max_rows: int = 200000,
+                 commit_batch_size: int = 20, commit_interval: float = 5.0):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_rows = max_rows
+        self.commit_batch_size = commit_batch_size
+        self.commit_interval = commit_interval
+
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._last_commit = time.monotonic()
+
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level='DEFERRED')
+        # auto_vacuum действует только до создания первой таблицы
+        self._conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS outbox ('
+            'id INTEGER PRIMARY KEY AUTOINCREMENT, '
+            'created_at REAL NOT NULL, '
+            'attempts INTEGER NOT NULL DEFAULT 0, '
+            'payload TEXT NOT NULL)'
+        )
+        self._conn.commit()
+        self._count = self._conn.execute('SELECT COUNT(*) FROM outbox').fetchone()[0]
+        if self._count:
+            logger.info(f"В очереди на диске найдено {self._count} неотправленных записей")
+
+    def append(self, entry: Dict[str, Any]) -> None:
+        """Добавляет запись. Коммит выполняется пакетом или по истечении интервала."""
+        with self._lock:
+            self._conn.execute(
+                'INSERT INTO outbox (created_at, payload) VALUES (?, ?)',
+                (time.time(), json.dumps(entry, ensure_ascii=False))
+            )
+            self._count += 1
+            self._pending += 1
+            if (self._pending >= self.commit_batch_size
+                    or time.monotonic() - self._last_commit >= self.commit_interval):
+                self._commit()
+
+    def flush(self) -> None:
+        """Принудительно записывает на диск добавленные записи."""
+        with self._lock:
+            self._commit()
+
+    def peek(self, limit: int, after_id: int = 0) -> List[Tuple[int, Dict[str, Any]]]:
+        """Возвращает страницу самых старых записей без удаления."""
+        with self._lock:
+            self._commit()
+            rows = self._conn.execute(
+                'SELECT id, payload FROM outbox WHERE id > ? ORDER BY id LIMIT ?',
+                (after_id, limit)
+            ).fetchall()
+
+        page = []
+        for row_id, payload in rows:
+            try:
+                page.append((row_id, json.loads(payload)))
+            except ValueError:
+                logger.error(f"Поврежденная запись в очереди на диске (id={row_id}), удаляется")
+                self.ack([row_id])
+        return page
+
+    def ack(self, ids: Iterable[int]) -> None:
+        """Удаляет записи, прием которых подтвержден сервером."""
+        ids = list(ids)
+        if not ids:
+            return
+        with self._lock:
+            self._conn.executemany('DELETE FROM outbox WHERE id = ?', [(row_id,) for row_id in ids])
+            self._commit()
+            self._count = self._conn.execute('SELECT COUNT(*) FROM outbox').fetchone()[0]
+            if self._count == 0:
+                self._compact()
+
+    def mark_failed(self, ids: Iterable[int]) -> None:
+        """Увеличивает счетчик попыток для записей, которые не удалось отправить."""
+        ids = list(ids)
+        if not ids:
+            return
+        with self._lock:
+            self._conn.executemany(
+                'UPDATE outbox SET attempts = attempts + 1 WHERE id = ?',
+                [(row_id,) for row_id in ids]
+            )
+            self._commit()
+
+    def qsize(self) -> int:
+        return self._count
+
+    def empty(self) -> bool:
+        return self._count == 0
+
+    def close(self) -> None:
+        """Сохраняет несохраненные записи и закрывает базу. Записи остаются для следующего запуска."""
+        with self._lock:
+            try:
+                self._commit()
+                self._conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+            finally:
+                self._conn.close()
+
+    def _commit(self) -> None:
+        if self._pending:
+            self._enforce_limit()
+        self._conn.commit()
+        self._pending = 0
+        self._last_commit = time.monotonic()
+
+    def _enforce_limit(self) -> None:
+        # Ограничиваем размер очереди: при переполнении теряются самые старые записи
+        overflow = self._count - self.max_rows
+        if overflow > 0:
+            self._conn.execute(
+                'DELETE FROM outbox WHERE id IN (SELECT id FROM outbox ORDER BY id LIMIT ?)',
+                (overflow,)
+            )
+            self._count -= overflow
+            logger.warning(f"Очередь на диске переполнена, удалено {overflow} самых старых записей")
+
+    def _compact(self) -> None:
+        # После полной отправки возвращаем место на диске
+        self._conn.execute('PRAGMA incremental_vacuum')
+        self._conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+
+def default_outbox_path() -> Path:
+    return Path.home() / '.timetracker' / 'outbox.db'
+
@@ -0,0 +1,127 @@
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Set, Tuple
+
+import psutil
+
+logger = logging.getLogger("TimeTracker")
+
+PROCESS_ERRORS = (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess)
+
+
+class ProcessNameCache:
+    """LRU-кэш PID -> (имя процесса, время запуска).
+
+    PID может быть переиспользован системой, поэтому запись считается
+    верной, только пока совпадает время запуска процесса. Время запуска
+    psutil получает при создании объекта Process, а более дорогой
+    запрос имени выполняется только для новых процессов.
+    """
+
+    def __init__(self, max_size: int = 512):
+        self.max_size = max_size
+        self._entries: "OrderedDict[int, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def name(self, pid: int) -> Optional[str]:
+        """Имя процесса по PID или None, если процесс недоступен."""
+        entry = self.lookup(pid)
+        return entry[0] if entry else None
+
+    def lookup(self, pid: int) -> Optional[Tuple[str, float]]:
+        try:
+            process = psutil.Process(pid)
+            create_time = process.create_time()
+        except PROCESS_ERRORS:
+            self.discard(pid)
+            return None
+
+        with self._lock:
+            entry = self._entries.get(pid)
+            if entry and entry[1] == create_time:
+                self._entries.move_to_end(pid)
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        try:
+            entry = (process.name(), create_time)
+        except PROCESS_ERRORS:
+            self.discard(pid)
+            return None
+        self.put(pid, *entry)
+        return entry
+
+    def put(self, pid: int, name: str, create_time: float) -> None:
+        with self._lock:
+            self._entries[pid] = (name, create_time)
+            self._entries.move_to_end(pid)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def discard(self, pid: int) -> None:
+        with self._lock:
+            self._entries.pop(pid, None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class ProcessSnapshot:
+    """Таблица запущенных процессов, обновляемая по разнице PID.
+
+    refresh запрашивает только список PID и читает данные лишь о новых
+    процессах, завершившиеся удаляются из таблицы. Раз в full_refresh_every
+    обновлений (и при первом вызове) таблица перечитывается целиком, чтобы учесть PID,
+    переиспользованные между обновлениями.
+    """
+
+    def __init__(self, name_cache: Optional[ProcessNameCache] = None, full_refresh_every: int = 30):
+        self.name_cache = name_cache if name_cache is not None else ProcessNameCache()
+        self.full_refresh_every = max(full_refresh_every, 1)
+        self._processes: Dict[int, str] = {}
+        self._refresh_count = 0
+        self._lock = threading.Lock()
+
+    def refresh(self) -> Tuple[Set[int], Set[int]]:
+        """Обновляет таблицу, возвращает множества новых и завершившихся PID."""
+        with self._lock:
+            self._refresh_count += 1
+            if not self._processes or self._refresh_count % self.full_refresh_every == 0:
+                return self._full_refresh()
+
+            current = set(psutil.pids())
+            known = set(self._processes)
+            started = current - known
+            exited = known - current
+
+            for pid in exited:
+                del self._processes[pid]
+                self.name_cache.discard(pid)
+            for pid in started:
+                # Недоступные процессы запоминаем с пустым именем, чтобы не опрашивать их каждый раз
+                self._processes[pid] = self.name_cache.name(pid) or ''
+            return started, exited
+
+    def _full_refresh(self) -> Tuple[Set[int], Set[int]]:
+        processes = {}
+        for proc in psutil.process_iter(['name', 'create_time']):
+            name, create_time = proc.info['name'], proc.info['create_time']
+            processes[proc.pid] = name or ''
+            if name and create_time is not None:
+                self.name_cache.put(proc.pid, name, create_time)
+
+        started = set(processes) - set(self._processes)
+        exited = set(self._processes) - set(processes)
+        for pid in exited:
+            self.name_cache.discard(pid)
+        self._processes = processes
+        return started, exited
+
+    def names(self) -> Set[str]:
+        """Уникальные непустые имена запущенных процессов."""
+        with self._lock:
+            return {name for name in self._processes.values() if name and name.strip()}
@@ -0,0 +1,345 @@
+import gzip
+import json
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import requests
+from PyQt5.QtCore import QThread, pyqtSignal
+
+from application_map import ApplicationMap, application_key
+
+logger = logging.getLogger("TimeTracker")
+
+
+def build_activity_payload(activity: Dict[str, Any], application_id: Optional[int] = None) -> Dict[str, Any]:
+    """Формирует элемент пакета для /api/activities/bulk/ из записи очереди."""
+    # Если поля не заполнены, подставляем текущее время
+    start_time = activity.get('start_time_iso_utc') or datetime.utcnow().isoformat() + 'Z'
+    end_time = activity.get('end_time_iso_utc') or datetime.utcnow().isoformat() + 'Z'
+    app_name = activity.get('app_name', '')
+    return {
+        # Известный ID отправляем сразу, иначе сервер находит или создает приложение по имени процесса
+        'process_name': application_id if application_id is not None else app_name,
+        'app_name': app_name,
+        'title': activity.get('window_title', ''),
+        'start_time': start_time,
+        'end_time': end_time,
+        'is_productive': activity.get('is_useful', False),
+        'keyboard_presses': activity.get('keyboard_presses', 0)
+        # Поле user не отправляем, так как пользователь определяется по токену на сервере
+    }
+
+
+def build_columnar_payload(activities: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Формирует колоночный пакет: словарь приложений и параллельные массивы значений."""
+    apps: Dict[str, int] = {}
+    app_column, start_column, duration_column, keystroke_column = [], [], [], []
+    for activity in activities:
+        app_name = activity.get('app_name', '')
+        start = activity.get('start_time') or time.time()
+        end = activity.get('end_time') or start
+        app_column.append(apps.setdefault(app_name, len(apps)))
+        start_column.append(round(start, 3))
+        duration_column.append(round(max(end - start, 0), 3))
+        keystroke_column.append(activity.get('keyboard_presses', 0))
+    return {
+        'format': 'columnar',
+        'apps': list(apps),
+        'app': app_column,
+        'start': start_column,
+        'duration': duration_column,
+        'keystrokes': keystroke_column,
+    }
+
+
+# Коды ошибок, с которыми сервер отклоняет пакет целиком из-за формата или сжатия.
+# Числовой код - ошибка разбора тела у сервера без поддержки сжатия, invalid_activity_data -
+# ответ старого сервера на колоночный пакет
+FORMAT_ERROR_CODES = ('invalid_activity_format', 'invalid_content_encoding', 'invalid_activity_data', 400)
+
+
+def _format_rejected(status_code: Optional[int], body: Any) -> bool:
+    """Отклонен ли пакет из-за формата, а не из-за ошибок в отдельных записях."""
+    if status_code == 415:
+        return True
+    if status_code != 400 or not isinstance(body, dict) or 'results' in body:
+        # Ошибки отдельных записей сервер возвращает по элементам в results
+        return False
+    return body.get('code') in FORMAT_ERROR_CODES
+
+
+class ActivityUploader(QThread):
+    """Фоновая отправка очереди активностей на сервер.
+
+    Работает в отдельном потоке, поэтому интерфейс и отслеживание не ждут сеть.
+    Пакеты уходят в колоночном формате со сжатием gzip (wire_format='json'
+    и compress=False включают прежний формат для старых серверов).
+    Одновременно в полете не больше max_in_flight пакетов, после ошибок
+    отправка откладывается с экспоненциальной задержкой и случайным разбросом.
+    Перед отправкой неизвестные имена приложений регистрируются одним запросом
+    через ApplicationMap; список обновляется с ETag при каждом новом токене.
+    О результатах поток сообщает в интерфейс сигналами.
+    """
+
+    batch_sent = pyqtSignal(int, int)  # принято сервером, осталось в очереди
+    upload_failed = pyqtSignal(str)
+    auth_required = pyqtSignal()
+    connection_checked = pyqtSignal(int, str)  # код ответа (0 - ошибка сети), адрес или текст ошибки
+
+    def __init__(self, outbox, batch_size: int = 20, max_in_flight: int = 2,
+                 poll_interval: float = 10.0, base_backoff: float = 2.0,
+                 max_backoff: float = 300.0, request_timeout: Tuple[int, int] = (5, 30),
+                 wire_format: str = 'columnar', compress: bool = True,
+                 application_map: Optional[ApplicationMap] = None, parent=None):
+        super().__init__(parent)
+        self.outbox = outbox
+        self.application_map = application_map
+        self.wire_format = wire_format
+        self.compress = compress
+        self.batch_size = max(batch_size, 1)
+        self.max_in_flight = max(max_in_flight, 1)
+        self.poll_interval = poll_interval
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.request_timeout = request_timeout
+
+        self._lock = threading.Lock()
+        self._wake_event = threading.Event()
+        self._stopping = False
+        self._bulk_url: Optional[str] = None
+        self._token: Optional[str] = None
+        self._connection_check: Optional[Tuple[str, str]] = None
+        self._failures = 0
+        self._retry_at = 0.0
+        self._map_token: Optional[str] = None
+        self._local = threading.local()
+
+    def configure(self, bulk_url: str, token: str) -> None:
+        """Задает адрес и токен. Новый токен снимает паузу после ошибок."""
+        with self._lock:
+            if token != self._token:
+                self._failures = 0
+                self._retry_at = 0.0
+            self._bulk_url = bulk_url
+            self._token = token
+
+    def wake(self) -> None:
+        """Просит поток проверить очередь, не дожидаясь очередного интервала."""
+        self._wake_event.set()
+
+    def check_connection(self, api_url: str, token: str) -> None:
+        """Ставит проверку соединения в очередь потока; результат придет сигналом connection_checked."""
+        with self._lock:
+            self._connection_check = (api_url, token)
+        self._wake_event.set()
+
+    def stop(self) -> None:
+        self._stopping = True
+        self._wake_event.set()
+
+    def run(self):
+        executor = ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix='uploader')
+        try:
+            while not self._stopping:
+                self._wake_event.wait(self._wait_timeout())
+                self._wake_event.clear()
+                if self._stopping:
+                    break
+                try:
+                    self._run_connection_check()
+                    if time.monotonic() >= self._retry_at:
+                        self._drain(executor)
+                except Exception as e:
+                    logger.error(f"Непредвиденная ошибка в потоке отправки: {e}", exc_info=True)
+                    self._schedule_retry()
+        finally:
+            executor.shutdown(wait=False)
+
+    def _wait_timeout(self) -> float:
+        delay = self._retry_at - time.monotonic()
+        return delay if delay > 0 else self.poll_interval
+
+    def _session(self) -> requests.Session:
+        # requests.Session не потокобезопасна, поэтому у каждого потока своя
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            session.headers.update({'Content-Type': 'application/json'})
+            self._local.session = session
+        return session
+
+    def _run_connection_check(self) -> None:
+        with self._lock:
+            check, self._connection_check = self._connection_check, None
+        if not check:
+            return
+        api_url, token = check
+        try:
+            response = self._session().get(
+                f"{api_url}/", headers={'Authorization': f'Bearer {token}'}, timeout=(3, 5)
+            )
+            self.connection_checked.emit(response.status_code, api_url)
+        except requests.RequestException as e:
+            self.connection_checked.emit(0, str(e))
+
+    def _drain(self, executor: ThreadPoolExecutor) -> None:
+        with self._lock:
+            bulk_url, token = self._bulk_url, self._token
+        if not bulk_url or not token:
+            return
+
+        while not self._stopping:
+            # Окно отправки: до max_in_flight последовательных страниц очереди
+            pages = []
+            after_id = 0
+            for _ in range(self.max_in_flight):
+                page = self.outbox.peek(self.batch_size, after_id)
+                if not page:
+                    break
+                pages.append(page)
+                after_id = page[-1][0]
+            if not pages:
+                return
+
+            self._sync_applications(bulk_url, token, pages)
+            futures = [executor.submit(self._post_with_fallback, bulk_url, token, page) for page in pages]
+            outcomes = [self._handle_result(page, *future.result()) for page, future in zip(pages, futures)]
+
+            if 'retry' in outcomes:
+                delay = self._schedule_retry()
+                self.upload_failed.emit(f"Сервер недоступен. Повтор через {delay:.0f} с")
+                return
+            if 'auth' in outcomes:
+                return
+            self._failures = 0
+            if len(pages[-1]) < self.batch_size:
+                return
+
+    def _sync_applications(self, bulk_url: str, token: str, pages) -> None:
+        """Обновляет список приложений после смены токена и регистрирует новые имена одним запросом."""
+        if self.application_map is None:
+            return
+        api_url = bulk_url.split('activities/bulk/')[0]
+        headers = {'Authorization': f'Bearer {token}'}
+        if token != self._map_token and self.application_map.refresh(self._session(), api_url, headers):
+            self._map_token = token
+        names = [activity.get('app_name') for page in pages for _, activity in page]
+        if self.application_map.unknown(names):
+            self.application_map.resolve(self._session(), api_url, headers, names, timeout=self.request_timeout)
+
+    def _post_with_fallback(self, bulk_url: str, token: str, page: List[Tuple[int, Dict[str, Any]]]):
+        """
+        Отправляет страницу; если сервер отклонил сам формат колоночного или сжатого пакета,
+        повторяет ее один раз в прежнем формате JSON без сжатия. Если прежний формат принят,
+        сервер новый не понимает, и до перезапуска программы используется прежний формат
+        (настройки upload_format и upload_gzip не меняются).
+        """
+        wire_format, compress = self.wire_format, self.compress
+        result = self._post_page(bulk_url, token, page, wire_format, compress)
+        if not _format_rejected(*result[:2]) or (wire_format == 'json' and not compress):
+            return result
+
+        logger.warning(f"Сервер отклонил пакет в формате {wire_format}, повтор в формате json без сжатия: {result[1]}")
+        fallback = self._post_page(bulk_url, token, page, 'json', False)
+        if fallback[0] is not None and fallback[0] != 400:
+            self.wire_format, self.compress = 'json', False
+            logger.warning("Сервер не поддерживает колоночный формат, далее пакеты отправляются в формате json")
+        return fallback
+
+    def _post_page(self, bulk_url: str, token: str, page: List[Tuple[int, Dict[str, Any]]],
+                   wire_format: str, compress: bool):
+        activities = [activity for _, activity in page]
+        if wire_format == 'columnar':
+            payload = build_columnar_payload(activities)
+        else:
+            application_ids = self.application_map.snapshot() if self.application_map is not None else {}
+            payload = [
+                build_activity_payload(activity, application_ids.get(application_key(activity.get('app_name'))))
+                for activity in activities
+            ]
+        body = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        headers = {'Authorization': f'Bearer {token}'}
+        if compress:
+            body = gzip.compress(body)
+            headers['Content-Encoding'] = 'gzip'
+        try:
+            response = self._session().post(
+                bulk_url,
+                data=body,
+                headers=headers,
+                timeout=self.request_timeout
+            )
+        except requests.RequestException as e:
+            return None, None, str(e)
+
+        try:
+            body = response.json()
+        except ValueError:
+            body = response.text
+        return response.status_code, body, None
+
+    def _handle_result(self, page, status_code, body, error) -> str:
+        """Обрабатывает ответ на одну страницу: 'ok', 'auth' или 'retry'."""
+        row_ids = [row_id for row_id, _ in page]
+
+        if status_code in (200, 201, 207):
+            sent_count = 0
+            app_ids = {}
+            results = body.get('results', []) if isinstance(body, dict) else []
+            for result in results:
+                index = result.get('index')
+                if index is None or index >= len(page):
+                    continue
+                activity = page[index][1]
+                if result.get('status') == 'created':
+                    sent_count += 1
+                    # Запоминаем ID приложения, назначенный сервером
+                    if result.get('application'):
+                        app_ids[application_key(activity.get('app_name'))] = result['application']
+                else:
+                    # Сервер отклонил запись как некорректную, повторная отправка не поможет
+                    logger.error(f"Сервер отклонил запись активности {activity.get('app_name')}: {result.get('detail')}")
+
+            # Сервер ответил по каждой записи, поэтому вся страница подтверждена
+            self.outbox.ack(row_ids)
+            if app_ids and self.application_map is not None and self.application_map.update(app_ids):
+                self.application_map.save()
+            logger.info(f"Успешно отправлено {sent_count} из {len(page)} записей активности. В очереди: {self.outbox.qsize()}")
+            self.batch_sent.emit(sent_count, self.outbox.qsize())
+            return 'ok'
+
+        if status_code == 401:
+            logger.error(f"Ошибка авторизации: {status_code} - {body}")
+            # До нового токена отправка приостановлена, записи остаются в очереди
+            with self._lock:
+                self._token = None
+            self.auth_required.emit()
+            return 'auth'
+
+        if status_code == 400:
+            # Весь пакет отклонен и в прежнем формате (_post_with_fallback), повторная отправка не поможет
+            logger.error(f"Сервер отклонил пакет активностей: {status_code} - {body}")
+            self.outbox.ack(row_ids)
+            self.upload_failed.emit(f"Ошибка отправки данных: {status_code}")
+            return 'ok'
+
+        # Ошибка сети или сервера: записи остаются в очереди для повторной отправки
+        self.outbox.mark_failed(row_ids)
+        if error:
+            logger.error(f"Ошибка сети при отправке данных: {error}")
+        else:
+            logger.error(f"Ошибка при отправке данных: {status_code} - {body}")
+        return 'retry'
+
+    def _schedule_retry(self) -> float:
+        # Экспоненциальная задержка со случайным разбросом, чтобы клиенты не стучались одновременно
+        self._failures += 1
+        delay = min(self.max_backoff, self.base_backoff * 2 ** (self._failures - 1))
+        delay = random.uniform(delay / 2, delay)
+        self._retry_at = time.monotonic() + delay
+        return delay
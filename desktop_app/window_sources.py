@@ -0,0 +1,348 @@
+import logging
+import queue
+import select
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from process_cache import ProcessNameCache
+
+logger = logging.getLogger("TimeTracker")
+
+WindowInfo = Dict[str, Any]
+
+
+def _window_key(info: Optional[WindowInfo]):
+    if not info:
+        return None
+    return info.get('app_name'), info.get('window_title')
+
+
+class WindowChangeSource:
+    """Источник смены активного окна.
+
+    wait_for_change блокируется, пока активное окно (приложение или заголовок)
+    не изменится, и возвращает новое окно; по истечении timeout возвращает None.
+    Первый вызов сразу возвращает текущее окно.
+    """
+
+    name = 'base'
+
+    def __init__(self, get_info: Callable[[], Optional[WindowInfo]]):
+        self.get_info = get_info
+        self._last_key = None
+
+    def start(self) -> None:
+        pass
+
+    def stop(self) -> None:
+        pass
+
+    def wait_for_change(self, timeout: float) -> Optional[WindowInfo]:
+        raise NotImplementedError
+
+    def _changed(self, info: Optional[WindowInfo]) -> bool:
+        key = _window_key(info)
+        if key is None or key == self._last_key:
+            return False
+        self._last_key = key
+        return True
+
+
+class PollingWindowSource(WindowChangeSource):
+    """Запасной вариант: опрос активного окна с фиксированным интервалом."""
+
+    name = 'polling'
+
+    def __init__(self, get_info: Callable[[], Optional[WindowInfo]], interval: float = 1.0):
+        super().__init__(get_info)
+        self.interval = interval
+        self._stopped = threading.Event()
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    def wait_for_change(self, timeout: float) -> Optional[WindowInfo]:
+        deadline = time.monotonic() + timeout
+        while not self._stopped.is_set():
+            info = self.get_info()
+            if self._changed(info):
+                return info
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            self._stopped.wait(min(self.interval, remaining))
+        return None
+
+
+class EventWindowSource(WindowChangeSource):
+    """Основа для источников на событиях ОС: поток-наблюдатель кладет уведомления в очередь."""
+
+    def __init__(self, get_info: Callable[[], Optional[WindowInfo]]):
+        super().__init__(get_info)
+        self._events: "queue.Queue[Optional[str]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        self._initial = True
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name=f'{self.name}-window-events', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._events.put(None)
+
+    def notify(self, reason: str = 'change') -> None:
+        self._events.put(reason)
+
+    def wait_for_change(self, timeout: float) -> Optional[WindowInfo]:
+        if self._initial:
+            self._initial = False
+            info = self.get_info()
+            if self._changed(info):
+                return info
+
+        deadline = time.monotonic() + timeout
+        while not self._stopped.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            try:
+                reason = self._events.get(timeout=remaining)
+            except queue.Empty:
+                return None
+            if reason is None:
+                return None
+            # Пачку событий (например, серию переименований окна) обрабатываем одним запросом
+            while True:
+                try:
+                    if self._events.get_nowait() is None:
+                        return None
+                except queue.Empty:
+                    break
+            info = self.get_info()
+            if self._changed(info):
+                return info
+        return None
+
+    def _run(self) -> None:
+        raise NotImplementedError
+
+
+class WinEventWindowSource(EventWindowSource):
+    """Windows: хуки SetWinEventHook на смену активного окна и его заголовка."""
+
+    name = 'winevent'
+
+    EVENT_SYSTEM_FOREGROUND = 0x0003
+    EVENT_OBJECT_NAMECHANGE = 0x800C
+    WINEVENT_OUTOFCONTEXT = 0x0000
+    WINEVENT_SKIPOWNPROCESS = 0x0002
+    OBJID_WINDOW = 0
+    WM_QUIT = 0x0012
+
+    def __init__(self, get_info: Callable[[], Optional[WindowInfo]]):
+        super().__init__(get_info)
+        import ctypes
+        from ctypes import wintypes
+
+        self._ctypes = ctypes
+        self._wintypes = wintypes
+        self._user32 = ctypes.windll.user32
+        self._kernel32 = ctypes.windll.kernel32
+        self._thread_id = None
+        self._ready = threading.Event()
+
+    def start(self) -> None:
+        super().start()
+        self._ready.wait(5)
+        if not self._thread_id:
+            raise OSError("Не удалось установить WinEvent-хуки")
+
+    def stop(self) -> None:
+        super().stop()
+        if self._thread_id:
+            self._user32.PostThreadMessageW(self._thread_id, self.WM_QUIT, 0, 0)
+
+    def _run(self) -> None:
+        ctypes, wintypes, user32 = self._ctypes, self._wintypes, self._user32
+        WinEventProc = ctypes.WINFUNCTYPE(
+            None, wintypes.HANDLE, wintypes.DWORD, wintypes.HWND,
+            wintypes.LONG, wintypes.LONG, wintypes.DWORD, wintypes.DWORD
+        )
+
+        def callback(hook, event, hwnd, id_object, id_child, event_thread, event_time):
+            if event == self.EVENT_OBJECT_NAMECHANGE:
+                # Интересны только переименования самого активного окна
+                if id_object != self.OBJID_WINDOW or hwnd != user32.GetForegroundWindow():
+                    return
+            self.notify()
+
+        # Ссылку на callback храним, пока работает цикл сообщений
+        self._callback = WinEventProc(callback)
+        flags = self.WINEVENT_OUTOFCONTEXT | self.WINEVENT_SKIPOWNPROCESS
+        hooks = [
+            user32.SetWinEventHook(event, event, 0, self._callback, 0, 0, flags)
+            for event in (self.EVENT_SYSTEM_FOREGROUND, self.EVENT_OBJECT_NAMECHANGE)
+        ]
+        if not all(hooks):
+            self._ready.set()
+            return
+
+        self._thread_id = self._kernel32.GetCurrentThreadId()
+        self._ready.set()
+        try:
+            msg = wintypes.MSG()
+            while user32.GetMessageW(ctypes.byref(msg), 0, 0, 0) > 0:
+                user32.TranslateMessage(ctypes.byref(msg))
+                user32.DispatchMessageW(ctypes.byref(msg))
+        finally:
+            for hook in hooks:
+                user32.UnhookWinEvent(hook)
+
+
+class X11WindowSource(EventWindowSource):
+    """Linux/X11: уведомления PropertyNotify для _NET_ACTIVE_WINDOW и заголовка активного окна.
+
+    Имя процесса по _NET_WM_PID берется из общего ProcessNameCache приложения.
+    """
+
+    name = 'x11'
+
+    def __init__(self, get_info: Optional[Callable[[], Optional[WindowInfo]]] = None,
+                 process_names: Optional[ProcessNameCache] = None):
+        from Xlib import X, display
+
+        self.process_names = process_names if process_names is not None else ProcessNameCache()
+        self._X = X
+        # Отдельные соединения для потока событий и для запросов, Xlib не потокобезопасен
+        self._event_display = display.Display()
+        self._query_display = display.Display()
+        self._query_lock = threading.Lock()
+        self._atoms = {
+            name: self._event_display.intern_atom(name)
+            for name in ('_NET_ACTIVE_WINDOW', '_NET_WM_NAME', 'WM_NAME', '_NET_WM_PID')
+        }
+        super().__init__(get_info or self.active_window_info)
+
+    def active_window_info(self) -> Optional[WindowInfo]:
+        with self._query_lock:
+            root = self._query_display.screen().root
+            window = self._active_window(self._query_display, root)
+            if window is None:
+                return None
+            try:
+                title = window.get_full_text_property(self._atoms['_NET_WM_NAME']) \
+                    or window.get_wm_name() or ''
+                pid_property = window.get_full_property(self._atoms['_NET_WM_PID'], self._X.AnyPropertyType)
+            except Exception:
+                return None
+
+        process_id = pid_property.value[0] if pid_property else None
+        app_name = (self.process_names.name(process_id) if process_id else None) or "Unknown"
+        return {'app_name': app_name, 'window_title': title, 'process_id': process_id}
+
+    def _active_window(self, disp, root):
+        prop = root.get_full_property(self._atoms['_NET_ACTIVE_WINDOW'], self._X.AnyPropertyType)
+        if not prop or not prop.value or not prop.value[0]:
+            return None
+        return disp.create_resource_object('window', prop.value[0])
+
+    def _run(self) -> None:
+        X = self._X
+        disp = self._event_display
+        root = disp.screen().root
+        root.change_attributes(event_mask=X.PropertyChangeMask)
+        title_atoms = (self._atoms['_NET_WM_NAME'], self._atoms['WM_NAME'])
+        watched = self._watch_active(disp, root, None)
+
+        while not self._stopped.is_set():
+            if not disp.pending_events():
+                # Ждем данных от X-сервера, периодически проверяя флаг остановки
+                select.select([disp.fileno()], [], [], 0.5)
+                if not disp.pending_events():
+                    continue
+            event = disp.next_event()
+            if event.type != X.PropertyNotify:
+                continue
+            if event.window == root and event.atom == self._atoms['_NET_ACTIVE_WINDOW']:
+                watched = self._watch_active(disp, root, watched)
+                self.notify()
+            elif watched is not None and event.window == watched and event.atom in title_atoms:
+                self.notify()
+
+    def _watch_active(self, disp, root, previous):
+        window = self._active_window(disp, root)
+        if window is None:
+            return None
+        if previous is None or previous.id != window.id:
+            try:
+                window.change_attributes(event_mask=self._X.PropertyChangeMask)
+                disp.flush()
+            except Exception:
+                return None
+        return window
+
+
+class FakeWindowSource(WindowChangeSource):
+    """Источник для тестов: окна задаются вызовами switch_to."""
+
+    name = 'fake'
+
+    def __init__(self):
+        super().__init__(lambda: self._current)
+        self._current: Optional[WindowInfo] = None
+        self._events: "queue.Queue[Optional[WindowInfo]]" = queue.Queue()
+
+    def switch_to(self, app_name: str, window_title: str = '', process_id: Optional[int] = None) -> None:
+        info = {'app_name': app_name, 'window_title': window_title, 'process_id': process_id}
+        self._current = info
+        self._events.put(info)
+
+    def stop(self) -> None:
+        self._events.put(None)
+
+    def wait_for_change(self, timeout: float) -> Optional[WindowInfo]:
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            try:
+                info = self._events.get(timeout=remaining)
+            except queue.Empty:
+                return None
+            if info is None:
+                return None
+            if self._changed(info):
+                return info
+
+
+def create_window_source(get_info: Callable[[], Optional[WindowInfo]],
+                         preferred: str = 'auto', poll_interval: float = 1.0,
+                         process_names: Optional[ProcessNameCache] = None) -> WindowChangeSource:
+    """Выбирает источник событий для текущей платформы, при ошибке возвращает опрос."""
+    preferred = (preferred or 'auto').lower()
+    candidates = []
+    if preferred in ('auto', 'winevent') and sys.platform == 'win32':
+        candidates.append(lambda: WinEventWindowSource(get_info))
+    if preferred in ('auto', 'x11') and sys.platform.startswith('linux'):
+        # get_info приложения работает через win32, под X11 окно читается самим источником
+        candidates.append(lambda: X11WindowSource(process_names=process_names))
+
+    if preferred != 'polling':
+        for factory in candidates:
+            try:
+                source = factory()
+                source.start()
+                logger.info(f"Отслеживание активного окна по событиям: {source.name}")
+                return source
+            except Exception as e:
+                logger.warning(f"Источник событий окна недоступен, используем опрос: {e}")
+
+    source = PollingWindowSource(get_info, interval=poll_interval)
+    source.start()
+    logger.info(f"Отслеживание активного окна опросом раз в {poll_interval} с")
+    return source
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Application, UserActivity, KeyboardActivity
+from .models import Application, UserActivity, KeyboardActivity, KeyboardActivityBucket, DailyAppUsage, PerformanceSummary
 
 @admin.register(Application)
 class ApplicationAdmin(admin.ModelAdmin):
@@ -19,3 +19,22 @@ class KeyboardActivityAdmin(admin.ModelAdmin):
     list_display = ('user', 'application', 'timestamp', 'key_pressed')
     list_filter = ('user', 'application', 'timestamp')
     search_fields = ('user__username', 'application__name', 'key_pressed')
+
+@admin.register(KeyboardActivityBucket)
+class KeyboardActivityBucketAdmin(admin.ModelAdmin):
+    list_display = ('user', 'application', 'minute', 'key_count')
+    list_filter = ('user', 'application', 'minute')
+    search_fields = ('user__username', 'application__name')
+
+@admin.register(DailyAppUsage)
+class DailyAppUsageAdmin(admin.ModelAdmin):
+    list_display = ('user', 'application', 'date', 'total_seconds', 'keystrokes', 'session_count')
+    list_filter = ('user', 'date')
+    search_fields = ('user__username', 'application__name')
+
+@admin.register(PerformanceSummary)
+class PerformanceSummaryAdmin(admin.ModelAdmin):
+    list_display = ('view_name', 'hour', 'requests', 'errors', 'p50', 'p95', 'p99')
+    list_filter = ('view_name', 'hour')
+    search_fields = ('view_name',)
+    exclude = ('latency_histogram',)
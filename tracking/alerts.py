@@ -5,8 +5,166 @@ from django.conf import settings
 from django.core.mail import send_mail
 from django.template.loader import render_to_string
 import json
+import logging
+import queue
+import threading
+import time
 import requests
 
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """
+    Ограничение частоты: rate токенов в секунду, не больше capacity подряд
+    """
+
+    def __init__(self, rate, capacity, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.clock = clock
+        self.updated = clock()
+
+    def consume(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+class AlertDispatcher:
+    """
+    Фоновая отправка уведомлений.
+    Потоки запросов только ставят уведомление в ограниченную очередь.
+    Поток-отправитель пропускает не больше одного уведомления с одной сигнатурой
+    за dedup_window секунд и не чаще, чем позволяет TokenBucket; остальные
+    копятся и раз в digest_interval секунд уходят одной сводкой.
+    """
+
+    def __init__(self, send, queue_size=1000, dedup_window=300, rate_per_minute=6, burst=3,
+                 digest_interval=300, clock=time.monotonic):
+        self.send = send
+        self.dedup_window = dedup_window
+        self.digest_interval = digest_interval
+        self.clock = clock
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._bucket = TokenBucket(rate_per_minute / 60, burst, clock)
+        self._last_sent = {}
+        self._suppressed = {}
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='alert-dispatcher', daemon=True)
+                self._thread.start()
+
+    def enqueue(self, signature, message, level='INFO', channels=None):
+        """
+        Ставит уведомление в очередь без ожидания.
+        При переполненной очереди уведомление отбрасывается и учитывается в сводке.
+        """
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((signature, message, level, channels))
+            return True
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+
+    def process(self, signature, message, level='INFO', channels=None):
+        now = self.clock()
+        last_sent = self._last_sent.get(signature)
+        if (last_sent is None or now - last_sent >= self.dedup_window) and self._bucket.consume():
+            self._last_sent[signature] = now
+            self.send(message, level, channels)
+            return
+
+        entry = self._suppressed.setdefault(signature, {'count': 0, 'level': level, 'channels': set()})
+        entry['count'] += 1
+        entry['message'] = message
+        entry['channels'].update(channels or ['email', 'slack'])
+        if AlertManager.ALERT_LEVELS.get(level, 0) > AlertManager.ALERT_LEVELS.get(entry['level'], 0):
+            entry['level'] = level
+
+    def flush_digest(self):
+        """
+        Отправляет сводку подавленных уведомлений одним сообщением
+        """
+        with self._lock:
+            dropped, self.dropped = self.dropped, 0
+        suppressed, self._suppressed = self._suppressed, {}
+
+        now = self.clock()
+        self._last_sent = {
+            signature: sent for signature, sent in self._last_sent.items()
+            if now - sent < self.dedup_window
+        }
+
+        if not suppressed and not dropped:
+            return
+
+        lines = [f"Alert digest: {sum(entry['count'] for entry in suppressed.values())} suppressed alerts"]
+        for signature, entry in sorted(suppressed.items(), key=lambda item: -item[1]['count']):
+            lines.append(f"- {signature} x{entry['count']}: {(entry['message'].splitlines() or [''])[0]}")
+        if dropped:
+            lines.append(f"Dropped on full queue: {dropped}")
+
+        level = max(
+            (entry['level'] for entry in suppressed.values()),
+            key=lambda value: AlertManager.ALERT_LEVELS.get(value, 0),
+            default='WARNING',
+        )
+        channels = set().union(*(entry['channels'] for entry in suppressed.values())) or None
+        self.send('\n'.join(lines), level, sorted(channels) if channels else None)
+
+    def _run(self):
+        next_digest = self.clock() + self.digest_interval
+        while True:
+            try:
+                item = self._queue.get(timeout=max(next_digest - self.clock(), 0))
+            except queue.Empty:
+                item = None
+            try:
+                if item is not None:
+                    self.process(*item)
+                if self.clock() >= next_digest:
+                    next_digest = self.clock() + self.digest_interval
+                    self.flush_digest()
+            except Exception:
+                # Ошибка отправки не должна останавливать поток
+                logger.exception('Alert dispatch failed')
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def alert_dispatcher():
+    global _dispatcher
+    if _dispatcher is None:
+        with _dispatcher_lock:
+            if _dispatcher is None:
+                _dispatcher = AlertDispatcher(
+                    send=AlertManager.deliver,
+                    queue_size=settings.ALERT_QUEUE_SIZE,
+                    dedup_window=settings.ALERT_DEDUP_WINDOW,
+                    rate_per_minute=settings.ALERT_RATE_PER_MINUTE,
+                    burst=settings.ALERT_RATE_BURST,
+                    digest_interval=settings.ALERT_DIGEST_INTERVAL,
+                )
+    return _dispatcher
+
+
 class AlertManager:
     ALERT_LEVELS = {
         'INFO': 0,
@@ -32,8 +190,8 @@ class AlertManager:
                 fail_silently=False,
             )
             return True
-        except Exception as e:
-            print(f"Failed to send email alert: {str(e)}")
+        except Exception:
+            logger.exception('Failed to send email alert')
             return False
 
     @staticmethod
@@ -58,11 +216,12 @@ class AlertManager:
             response = requests.post(
                 settings.SLACK_WEBHOOK_URL,
                 data=json.dumps(payload),
-                headers={'Content-Type': 'application/json'}
+                headers={'Content-Type': 'application/json'},
+                timeout=getattr(settings, 'ALERT_HTTP_TIMEOUT', 5)
             )
             return response.status_code == 200
-        except Exception as e:
-            print(f"Failed to send Slack alert: {str(e)}")
+        except Exception:
+            logger.exception('Failed to send Slack alert')
             return False
 
     @staticmethod
@@ -79,7 +238,17 @@ class AlertManager:
         return emoji_map.get(level.upper(), ':information_source:')
 
     @classmethod
-    def alert(cls, message, level='INFO', channels=None):
+    def alert(cls, message, level='INFO', channels=None, signature=None):
+        """
+        Ставит уведомление в очередь фоновой отправки.
+        Уведомления с одной сигнатурой (по умолчанию - текст) дедуплицируются.
+        """
+        if not getattr(settings, 'ALERTS_ASYNC', True):
+            return cls.deliver(message, level, channels)
+        return alert_dispatcher().enqueue(signature or message, message, level, channels)
+
+    @classmethod
+    def deliver(cls, message, level='INFO', channels=None):
         """
         Отправляет уведомление по всем доступным каналам
         """
@@ -100,16 +269,18 @@ class AlertManager:
         return alert_sent
 
     @classmethod
-    def performance_alert(cls, view_name, response_time, threshold):
+    def performance_alert(cls, view_name, response_time, threshold, kind='request'):
         """
-        Отправляет уведомление о проблемах с производительностью
+        Отправляет уведомление о проблемах с производительностью.
+        kind - 'request' (медленный ответ) или 'query' (медленный запрос к БД):
+        у них разные сигнатуры, чтобы одно уведомление не подавляло другое
         """
         message = (
-            f"Performance Alert: {view_name}\n"
-            f"Response time: {response_time:.2f}s\n"
+            f"Performance Alert ({kind}): {view_name}\n"
+            f"{'Query' if kind == 'query' else 'Response'} time: {response_time:.2f}s\n"
             f"Threshold: {threshold:.2f}s"
         )
-        return cls.alert(message, level='WARNING')
+        return cls.alert(message, level='WARNING', signature=f'performance:{kind}:{view_name}')
 
     @classmethod
     def error_alert(cls, error_type, error_message, details=None):
@@ -122,7 +293,7 @@ class AlertManager:
         )
         if details:
             message += f"Details: {json.dumps(details, indent=2)}"
-        return cls.alert(message, level='ERROR')
+        return cls.alert(message, level='ERROR', signature=f'error:{error_type}')
 
     @classmethod
     def security_alert(cls, event_type, details):
@@ -133,4 +304,4 @@ class AlertManager:
             f"Security Alert: {event_type}\n"
             f"Details: {json.dumps(details, indent=2)}"
         )
-        return cls.alert(message, level='CRITICAL', channels=['email', 'slack']) 
\ No newline at end of file
+        return cls.alert(message, level='CRITICAL', channels=['email', 'slack'], signature=f'security:{event_type}')
@@ -0,0 +1,60 @@
+# Понятные названия приложений по имени процесса в нижнем регистре
+APP_DISPLAY_NAMES = {
+    'browser.exe': 'Yandex Браузер',
+    'chrome.exe': 'Google Chrome',
+    'firefox.exe': 'Mozilla Firefox',
+    'msedge.exe': 'Microsoft Edge',
+    'opera.exe': 'Opera',
+    'safari.exe': 'Safari',
+    'brave.exe': 'Brave Browser',
+    'vivaldi.exe': 'Vivaldi',
+    'iexplore.exe': 'Internet Explorer',
+    'word.exe': 'Microsoft Word',
+    'excel.exe': 'Microsoft Excel',
+    'powerpnt.exe': 'Microsoft PowerPoint',
+    'outlook.exe': 'Microsoft Outlook',
+    'winword.exe': 'Microsoft Word',
+    'notepad.exe': 'Notepad',
+    'notepad++.exe': 'Notepad++',
+    'code.exe': 'Visual Studio Code',
+    'devenv.exe': 'Visual Studio',
+    'pycharm64.exe': 'PyCharm',
+    'idea64.exe': 'IntelliJ IDEA',
+    'photoshop.exe': 'Adobe Photoshop',
+    'illustrator.exe': 'Adobe Illustrator',
+    'acrobat.exe': 'Adobe Acrobat',
+    'acrord32.exe': 'Adobe Reader',
+    'slack.exe': 'Slack',
+    'teams.exe': 'Microsoft Teams',
+    'discord.exe': 'Discord',
+    'telegram.exe': 'Telegram',
+    'whatsapp.exe': 'WhatsApp',
+    'skype.exe': 'Skype',
+    'zoom.exe': 'Zoom',
+    'steam.exe': 'Steam',
+    'spotify.exe': 'Spotify',
+    'vlc.exe': 'VLC Media Player',
+    'wmplayer.exe': 'Windows Media Player',
+    'explorer.exe': 'Windows Explorer',
+    'cmd.exe': 'Командная строка',
+    'powershell.exe': 'PowerShell',
+    'python.exe': 'Python',
+    'javaw.exe': 'Java',
+    'node.exe': 'Node.js',
+}
+
+
+def display_name(process_name, name=None):
+    """
+    Название приложения для отображения: известное по имени процесса или name
+    """
+    return APP_DISPLAY_NAMES.get((process_name or '').lower(), name)
+
+
+def apply_display_names(apps):
+    """
+    Подставляет понятные названия в объекты приложений только в памяти, без записи в базу
+    """
+    for app in apps:
+        app.name = display_name(app.process_name, app.name)
+    return apps
@@ -1,6 +1,21 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
 
 
 class TrackingConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'tracking'
+
+    def ready(self):
+        from django.conf import settings
+
+        from .logging import start_log_listener
+        from .signals import application_changed
+        from .sqlite_tuning import configure_sqlite_connection
+
+        connection_created.connect(configure_sqlite_connection, dispatch_uid='tracking_sqlite_tuning')
+        post_save.connect(application_changed, sender='tracking.Application', dispatch_uid='tracking_application_saved')
+        post_delete.connect(application_changed, sender='tracking.Application', dispatch_uid='tracking_application_deleted')
+        if settings.LOG_QUEUE_ENABLED:
+            start_log_listener()
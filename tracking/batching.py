@@ -0,0 +1,199 @@
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+
+from .exceptions import IngestUnavailable
+from .ingest import ingest_activities, parse_activity_item
+from .middleware import QueryTimer
+from .rollups import add_activities
+
+
+class _IngestJob:
+    QUEUED = 'queued'
+    WRITING = 'writing'
+    CANCELLED = 'cancelled'
+
+    def __init__(self, user, items, parse_item):
+        self.user = user
+        self.items = items
+        self.parse_item = parse_item
+        self.results = None
+        self.error = None
+        self.state = self.QUEUED
+        self.query_timer = None
+        self.done = threading.Event()
+        self._lock = threading.Lock()
+
+    def _transition(self, state):
+        with self._lock:
+            if self.state != self.QUEUED:
+                return False
+            self.state = state
+            return True
+
+    def start(self):
+        """
+        Переводит пакет в запись; False, если запрос уже отменил его по таймауту
+        """
+        return self._transition(self.WRITING)
+
+    def cancel(self):
+        """
+        Отменяет пакет, только если писатель еще не начал его записывать
+        """
+        return self._transition(self.CANCELLED)
+
+
+class IngestWriteBatcher:
+    """
+    Групповая фиксация пакетов активностей.
+    Потоки запросов ставят пакеты в очередь, один поток-писатель забирает
+    все накопившиеся пакеты и сохраняет их одной транзакцией.
+    Писатели одного процесса не соревнуются за блокировку SQLite,
+    а число fsync сокращается до одного на группу.
+    """
+
+    def __init__(self, window=0.0, max_items=5000, timeout=30.0):
+        self.window = window
+        self.max_items = max_items
+        self.timeout = timeout
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='ingest-writer', daemon=True)
+                self._thread.start()
+
+    def submit(self, user, items, parse_item=parse_activity_item):
+        """
+        Сохраняет пакет и возвращает статусы элементов, как ingest_activities.
+        Если писатель не взялся за пакет за timeout секунд, пакет отменяется
+        и вызывается IngestUnavailable (503).
+        """
+        job = _IngestJob(user, items, parse_item)
+        self._ensure_started()
+        self._queue.put(job)
+        if not job.done.wait(self.timeout):
+            if job.cancel():
+                # Писатель пропустит отмененный пакет, повтор клиента не создаст дубликатов
+                raise IngestUnavailable()
+            # Запись уже началась: ответ должен отражать ее результат
+            job.done.wait()
+        self._add_query_time(job.query_timer)
+        if job.error is not None:
+            raise job.error
+        if job.results is None:
+            raise IngestUnavailable()
+        return job.results
+
+    @staticmethod
+    def _add_query_time(writer_timer):
+        """
+        Запросы писателя идут через его собственное соединение, поэтому их число
+        и время переносятся в QueryTimer запроса (PerformanceMonitoringMiddleware).
+        Пакет получает замер своей точки сохранения; общие запросы группы
+        учитываются один раз, у первого записанного пакета.
+        """
+        if writer_timer is None:
+            return
+        for wrapper in connection.execute_wrappers:
+            if isinstance(wrapper, QueryTimer):
+                wrapper.merge(writer_timer)
+
+    def _collect(self, first):
+        batch = [first]
+        size = len(first.items)
+        deadline = time.monotonic() + self.window
+        while size < self.max_items:
+            timeout = deadline - time.monotonic()
+            try:
+                job = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(job)
+            size += len(job.items)
+        return batch
+
+    @staticmethod
+    def _query_timer():
+        return QueryTimer(
+            threshold=getattr(settings, 'SLOW_QUERY_THRESHOLD', 0.1),
+            top_n=getattr(settings, 'SLOW_QUERY_TOP_N', 5),
+        )
+
+    def _write(self, batch):
+        try:
+            close_old_connections()
+            group_timer = self._query_timer()
+            # Запрос засчитывается таймеру пакета, который сейчас пишется, остальные - группе
+            current = [group_timer]
+            written = []
+            with connection.execute_wrapper(lambda *args: current[0](*args)), transaction.atomic():
+                created = []
+                for job in batch:
+                    if not job.start():
+                        continue
+                    written.append(job)
+                    job.query_timer = current[0] = self._query_timer()
+                    job_created = []
+                    try:
+                        # Каждый пакет в своей точке сохранения: ошибка одного не откатывает остальные
+                        job.results = ingest_activities(job.user, job.items, job.parse_item, job_created.extend)
+                    except Exception as e:
+                        job.error = e
+                    else:
+                        created.extend(job_created)
+                    finally:
+                        current[0] = group_timer
+                # Дневная сводка обновляется один раз на группу, а не на каждый пакет
+                add_activities(created)
+            if written:
+                written[0].query_timer.merge(group_timer)
+        except Exception as e:
+            # Не удалась сама фиксация - ошибка у всех пакетов группы
+            for job in batch:
+                job.results = None
+                job.error = job.error or e
+
+    def _run(self):
+        while True:
+            batch = self._collect(self._queue.get())
+            try:
+                self._write(batch)
+            finally:
+                for job in batch:
+                    job.done.set()
+
+
+_batcher = None
+_batcher_lock = threading.Lock()
+
+
+def ingest_batcher():
+    global _batcher
+    if _batcher is None:
+        with _batcher_lock:
+            if _batcher is None:
+                _batcher = IngestWriteBatcher(
+                    window=settings.INGEST_BATCH_WINDOW_MS / 1000,
+                    max_items=settings.INGEST_BATCH_MAX_ITEMS,
+                    timeout=settings.INGEST_BATCH_TIMEOUT,
+                )
+    return _batcher
+
+
+def submit_activities(user, items, parse_item=parse_activity_item):
+    """
+    Сохраняет пакет активностей через групповую фиксацию, если она включена
+    """
+    if settings.INGEST_WRITE_BATCHING:
+        return ingest_batcher().submit(user, items, parse_item)
+    return ingest_activities(user, items, parse_item)
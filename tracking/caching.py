@@ -0,0 +1,218 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+STATS_FIELDS = ('hits', 'misses', 'evictions')
+STATS_PREFIX_COUNT_KEY = 'cache_stats_prefix_count'
+
+# Префиксы, уже зарегистрированные этим процессом: регистрация не повторяется на каждом промахе
+_registered_prefixes = set()
+
+
+def _generation_key(user_id):
+    return f'cache_generation_{user_id}'
+
+
+def get_cache_generation(user_id):
+    """
+    Текущее поколение кэша пользователя.
+    Начальное значение берется от времени, чтобы после вытеснения счетчика
+    ключи старых поколений не стали снова актуальными.
+    """
+    key = _generation_key(user_id)
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, time.time_ns(), timeout=None)
+        generation = cache.get(key, 0)
+    return generation
+
+
+def bump_cache_generation(user_id):
+    """
+    Переводит кэш пользователя на новое поколение.
+    Все ранее закэшированные данные пользователя перестают читаться.
+    """
+    key = _generation_key(user_id)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        generation = time.time_ns()
+        cache.set(key, generation, timeout=None)
+        return generation
+
+
+def user_cache_key(user_id, prefix, *parts):
+    """
+    Ключ кэша с номером поколения пользователя
+    """
+    suffix = '_'.join(str(part) for part in parts)
+    return f'{prefix}_{user_id}_{get_cache_generation(user_id)}_{suffix}'
+
+
+def _application_map_key(user_id):
+    return f'application_map_{user_id}'
+
+
+def get_application_map(user_id):
+    """
+    Соответствие process_name -> ID приложения пользователя или None, если его нет в кэше.
+    Не зависит от поколения кэша: поколение меняется при каждой загрузке активностей.
+    """
+    return cache.get(_application_map_key(user_id))
+
+
+def set_application_map(user_id, mapping):
+    cache.set(_application_map_key(user_id), mapping, settings.CACHE_TTL)
+
+
+def invalidate_application_map(user_id):
+    """
+    Сбрасывает кэш приложений пользователя после изменения или удаления приложений
+    """
+    cache.delete(_application_map_key(user_id))
+
+
+def _stats_key(prefix, field):
+    return f'cache_stats_{prefix}_{field}'
+
+
+def _stats_enabled():
+    return getattr(settings, 'CACHE_STATS_ENABLED', False)
+
+
+def _register_prefix(prefix):
+    """
+    Добавляет префикс в список статистики без гонок между процессами:
+    cache.add пропускает только первого, он получает номер через incr
+    и записывает префикс в отдельный ключ с этим номером
+    """
+    if prefix in _registered_prefixes:
+        return
+    if cache.add(f'cache_stats_prefix_{prefix}', True, timeout=None):
+        cache.add(STATS_PREFIX_COUNT_KEY, 0, timeout=None)
+        slot = cache.incr(STATS_PREFIX_COUNT_KEY)
+        cache.set(f'cache_stats_prefix_slot_{slot}', prefix, timeout=None)
+    _registered_prefixes.add(prefix)
+
+
+def _stats_prefixes():
+    count = cache.get(STATS_PREFIX_COUNT_KEY, 0)
+    slots = cache.get_many([f'cache_stats_prefix_slot_{slot}' for slot in range(1, count + 1)])
+    return sorted(set(slots.values()))
+
+
+def _record(prefix, *fields):
+    for field in fields:
+        key = _stats_key(prefix, field)
+        try:
+            cache.incr(key)
+        except ValueError:
+            if not cache.add(key, 1, timeout=None):
+                cache.incr(key)
+
+
+def get_or_build(user_id, prefix, parts, builder, timeout=None):
+    """
+    Возвращает данные из кэша текущего поколения или строит и сохраняет их.
+    Рядом с данными хранится маркер записи: если маркер на месте, а данных нет,
+    значит бэкенд вытеснил запись раньше срока, и промах считается вытеснением.
+    Счетчики ведутся только при CACHE_STATS_ENABLED: каждый стоит запроса к бэкенду.
+    """
+    key = user_cache_key(user_id, prefix, *parts)
+    marker = f'{key}_stored'
+    values = cache.get_many([key, marker])
+    stats = _stats_enabled()
+    if key in values:
+        if stats:
+            _record(prefix, 'hits')
+        return values[key]
+
+    if stats:
+        _register_prefix(prefix)
+        if marker in values:
+            _record(prefix, 'misses', 'evictions')
+        else:
+            _record(prefix, 'misses')
+
+    payload = builder()
+    cache.set_many(
+        {key: payload, marker: True},
+        settings.CACHE_TTL if timeout is None else timeout,
+    )
+    return payload
+
+
+def cache_stats():
+    """
+    Счетчики попаданий, промахов и вытеснений по префиксам ключей
+    """
+    prefixes = _stats_prefixes()
+    counters = cache.get_many([
+        _stats_key(prefix, field) for prefix in prefixes for field in STATS_FIELDS
+    ])
+    stats = {}
+    for prefix in prefixes:
+        row = {field: counters.get(_stats_key(prefix, field), 0) for field in STATS_FIELDS}
+        requests = row['hits'] + row['misses']
+        row['hit_rate'] = round(row['hits'] / requests * 100, 1) if requests else 0
+        stats[prefix] = row
+    return stats
+
+
+def reset_cache_stats():
+    """
+    Обнуляет счетчики статистики кэша
+    """
+    prefixes = _stats_prefixes()
+    cache.delete_many([
+        _stats_key(prefix, field) for prefix in prefixes for field in STATS_FIELDS
+    ])
+
+
+def cache_backend_info():
+    """
+    Сведения о бэкенде кэша для оценки нужного объема
+    """
+    config = settings.CACHES['default']
+    info = {
+        'backend': config['BACKEND'],
+        'location': config.get('LOCATION', ''),
+        'max_entries': config.get('OPTIONS', {}).get('MAX_ENTRIES'),
+        'ttl': settings.CACHE_TTL,
+    }
+    backend = getattr(settings, 'CACHE_BACKEND', 'locmem')
+
+    try:
+        if backend == 'redis':
+            from django_redis import get_redis_connection
+
+            server = get_redis_connection('default').info()
+            info.update({
+                'used_memory': server.get('used_memory'),
+                'maxmemory': server.get('maxmemory'),
+                'evicted_keys': server.get('evicted_keys'),
+                'keyspace_hits': server.get('keyspace_hits'),
+                'keyspace_misses': server.get('keyspace_misses'),
+            })
+        elif backend == 'file':
+            entries = [
+                entry for entry in os.scandir(info['location'])
+                if entry.is_file() and entry.name.endswith('.djcache')
+            ] if os.path.isdir(info['location']) else []
+            info.update({
+                'entries': len(entries),
+                'size_bytes': sum(entry.stat().st_size for entry in entries),
+            })
+        elif backend == 'db':
+            table = connection.ops.quote_name(info['location'])
+            with connection.cursor() as cursor:
+                cursor.execute(f'SELECT COUNT(*) FROM {table}')
+                info['entries'] = cursor.fetchone()[0]
+    except Exception as e:
+        # Недоступность бэкенда не должна ломать страницу статистики
+        info['error'] = str(e)
+
+    return info
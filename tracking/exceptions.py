@@ -24,4 +24,14 @@ class UserActivityNotFound(APIException):
 class InvalidActivityData(APIException):
     status_code = status.HTTP_400_BAD_REQUEST
     default_detail = 'Неверные данные активности.'
-    default_code = 'invalid_activity_data' 
\ No newline at end of file
+    default_code = 'invalid_activity_data'
+
+class InvalidActivityFormat(APIException):
+    status_code = status.HTTP_400_BAD_REQUEST
+    default_detail = 'Формат пакета активностей не поддерживается.'
+    default_code = 'invalid_activity_format'
+
+class IngestUnavailable(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Запись активностей временно недоступна, повторите запрос позже.'
+    default_code = 'ingest_unavailable'
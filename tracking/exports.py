@@ -0,0 +1,139 @@
+import csv
+import json
+import zlib
+
+from django.conf import settings
+
+from .models import UserActivity
+
+EXPORT_FORMATS = ('csv', 'ndjson', 'columnar')
+
+CSV_HEADER = ['Дата', 'Время начала', 'Время окончания', 'Длительность', 'Приложение', 'Процесс', 'Нажатия клавиш', 'Продуктивное']
+
+EXPORT_FIELDS = (
+    'start_time',
+    'end_time',
+    'duration',
+    'application__name',
+    'application__process_name',
+    'keyboard_presses',
+    'application__is_productive',
+)
+
+COLUMNS = ('start_time', 'end_time', 'duration_seconds', 'application', 'process_name', 'keyboard_presses', 'is_productive')
+
+
+class Echo:
+    """
+    Псевдо-файл для csv.writer: возвращает строку вместо записи в буфер
+    """
+    def write(self, value):
+        return value
+
+
+def export_rows(user, date_from, date_to, chunk_size=None):
+    """
+    Строки экспорта за период без загрузки всей выборки в память.
+    На PostgreSQL iterator использует серверный курсор, на SQLite читает порциями.
+    """
+    return UserActivity.objects.filter(
+        user=user,
+        start_time__date__gte=date_from,
+        start_time__date__lte=date_to
+    ).order_by('start_time', 'id').values_list(*EXPORT_FIELDS).iterator(
+        chunk_size=chunk_size or settings.EXPORT_CHUNK_SIZE
+    )
+
+
+def _duration(start_time, end_time, duration):
+    if duration:
+        return duration
+    if start_time and end_time:
+        return end_time - start_time
+    return None
+
+
+def _chunked(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def csv_stream(rows, chunk_size=None):
+    """
+    CSV с BOM и разделителем ';' для совместимости с Excel
+    """
+    writer = csv.writer(Echo(), delimiter=';')
+    yield '\ufeff' + writer.writerow(CSV_HEADER)
+
+    for chunk in _chunked(rows, chunk_size or settings.EXPORT_CHUNK_SIZE):
+        lines = []
+        for start_time, end_time, duration, name, process_name, keyboard_presses, is_productive in chunk:
+            duration = _duration(start_time, end_time, duration)
+            lines.append(writer.writerow([
+                start_time.strftime('%Y-%m-%d'),
+                start_time.strftime('%H:%M:%S'),
+                end_time.strftime('%H:%M:%S') if end_time else '',
+                str(duration) if duration else '00:00:00',
+                name,
+                process_name,
+                keyboard_presses,
+                'Да' if is_productive else 'Нет'
+            ]))
+        yield ''.join(lines)
+
+
+def _record(start_time, end_time, duration, name, process_name, keyboard_presses, is_productive):
+    duration = _duration(start_time, end_time, duration)
+    return (
+        start_time.isoformat(),
+        end_time.isoformat() if end_time else None,
+        duration.total_seconds() if duration else 0,
+        name,
+        process_name,
+        keyboard_presses,
+        is_productive,
+    )
+
+
+def ndjson_stream(rows, chunk_size=None):
+    """
+    Одна JSON-запись на строку
+    """
+    for chunk in _chunked(rows, chunk_size or settings.EXPORT_CHUNK_SIZE):
+        yield ''.join(
+            json.dumps(dict(zip(COLUMNS, _record(*row))), ensure_ascii=False) + '\n'
+            for row in chunk
+        )
+
+
+def columnar_stream(rows, chunk_size=None):
+    """
+    Колоночный формат по аналогии с группами строк Parquet.
+    Первая строка содержит схему, каждая следующая - группу строк
+    в виде параллельных массивов значений по колонкам.
+    """
+    yield json.dumps({'columns': COLUMNS}) + '\n'
+    for chunk in _chunked(rows, chunk_size or settings.EXPORT_CHUNK_SIZE):
+        records = [_record(*row) for row in chunk]
+        yield json.dumps({
+            'rows': len(records),
+            'data': dict(zip(COLUMNS, (list(column) for column in zip(*records)))),
+        }, ensure_ascii=False) + '\n'
+
+
+def gzip_stream(chunks, encoding='utf-8'):
+    """
+    Потоковое gzip-сжатие без буферизации всего файла
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode(encoding))
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,302 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .app_names import display_name
+from .caching import get_application_map, set_application_map
+from .models import Application, UserActivity
+from .rollups import add_activities
+
+UNKNOWN_APPLICATION_NAME = 'Неизвестное приложение'
+# Самая длинная допустимая активность: агент закрывает запись не реже раза в сутки
+MAX_ACTIVITY_DURATION = timedelta(hours=24)
+
+
+class ActivityItemError(ValueError):
+    """Ошибка разбора одного элемента пакета активностей."""
+
+
+def _parse_timestamp(value, field_name):
+    """
+    Приводит значение из запроса к aware datetime
+    """
+    if isinstance(value, datetime):
+        parsed = value
+    elif isinstance(value, str) and value:
+        try:
+            parsed = parse_datetime(value.replace('Z', '+00:00'))
+        except ValueError:
+            parsed = None
+    else:
+        parsed = None
+
+    if parsed is None:
+        raise ActivityItemError(f'Поле {field_name} отсутствует или имеет неверный формат.')
+
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def _parse_keyboard_presses(value):
+    try:
+        return max(int(value or 0), 0)
+    except (ValueError, TypeError):
+        return 0
+
+
+def parse_activity_item(item):
+    """
+    Разбирает один элемент пакета в словарь с нормализованными полями.
+    Приложение определяется так же, как в UserActivityViewSet.perform_create:
+    по числовому ID или по имени процесса.
+    """
+    if not isinstance(item, dict):
+        raise ActivityItemError('Элемент пакета должен быть объектом.')
+
+    process_name = item.get('process_name', item.get('application', ''))
+    app_name = str(item.get('app_name', '') or '')[:255]
+
+    application_id = None
+    if isinstance(process_name, int) or (isinstance(process_name, str) and process_name.isdigit()):
+        application_id = int(process_name)
+        process_name = ''
+    process_name = str(process_name) if process_name is not None else ''
+    if not process_name and application_id is None:
+        process_name = app_name or UNKNOWN_APPLICATION_NAME
+    process_name = process_name[:255]
+
+    start_time = _parse_timestamp(item.get('start_time'), 'start_time')
+    end_time = _parse_timestamp(item.get('end_time'), 'end_time')
+    if end_time < start_time:
+        raise ActivityItemError('Время окончания раньше времени начала.')
+    if end_time - start_time > MAX_ACTIVITY_DURATION:
+        raise ActivityItemError('Длительность активности больше 24 часов.')
+
+    return {
+        'application_id': application_id,
+        'process_name': process_name,
+        'app_name': app_name,
+        'start_time': start_time,
+        'end_time': end_time,
+        'duration': end_time - start_time,
+        'keyboard_presses': _parse_keyboard_presses(item.get('keyboard_presses', 0)),
+    }
+
+
+COLUMNAR_FIELDS = ('app', 'start', 'duration', 'keystrokes')
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def columnar_rows(batch):
+    """
+    Разворачивает колоночный пакет в строки для parse_columnar_row.
+    Формат: словарь приложений "apps" (имена процессов, необязательно "app_names")
+    и параллельные массивы "app" (индекс в apps), "start" (эпоха, секунды),
+    "duration" (секунды) и "keystrokes".
+    """
+    apps = batch.get('apps')
+    if not isinstance(apps, list) or not all(isinstance(name, str) for name in apps):
+        raise ActivityItemError('Поле apps должно быть массивом имен процессов.')
+    app_names = batch.get('app_names') or apps
+    if not isinstance(app_names, list) or len(app_names) != len(apps):
+        raise ActivityItemError('Поле app_names должно совпадать по длине с apps.')
+
+    columns = []
+    for field in COLUMNAR_FIELDS:
+        column = batch.get(field, [] if field == 'keystrokes' else None)
+        if not isinstance(column, list):
+            raise ActivityItemError(f'Поле {field} должно быть массивом.')
+        columns.append(column)
+
+    size = len(columns[0])
+    if not columns[3]:
+        columns[3] = [0] * size
+    if any(len(column) != size for column in columns):
+        raise ActivityItemError('Массивы app, start, duration и keystrokes должны быть одной длины.')
+
+    dictionary = [(str(name)[:255], str(app_name or name)[:255]) for name, app_name in zip(apps, app_names)]
+    return [(dictionary, *row) for row in zip(*columns)]
+
+
+def parse_columnar_row(row):
+    """
+    Разбирает строку колоночного пакета в тот же словарь, что и parse_activity_item
+    """
+    dictionary, app_index, start, duration, keystrokes = row
+    if not isinstance(app_index, int) or isinstance(app_index, bool) or not 0 <= app_index < len(dictionary):
+        raise ActivityItemError('Неверный индекс приложения.')
+    if not _is_number(start) or not _is_number(duration):
+        raise ActivityItemError('Поля start и duration должны быть числами.')
+    if duration < 0:
+        raise ActivityItemError('Время окончания раньше времени начала.')
+    if duration > MAX_ACTIVITY_DURATION.total_seconds():
+        raise ActivityItemError('Длительность активности больше 24 часов.')
+
+    # Экстремальные значения не должны превращаться в 500 на весь пакет
+    try:
+        start_time = datetime.fromtimestamp(start, tz=dt_timezone.utc)
+        duration = timedelta(seconds=duration)
+        end_time = start_time + duration
+    except (OverflowError, OSError, ValueError):
+        raise ActivityItemError('Поля start и duration имеют неверное значение.')
+
+    process_name, app_name = dictionary[app_index]
+    return {
+        'application_id': None,
+        'process_name': process_name or app_name or UNKNOWN_APPLICATION_NAME,
+        'app_name': app_name,
+        'start_time': start_time,
+        'end_time': end_time,
+        'duration': duration,
+        'keyboard_presses': _parse_keyboard_presses(keystrokes),
+    }
+
+
+def application_map(user):
+    """
+    Соответствие process_name -> ID приложений пользователя.
+    При первом обращении загружается одним запросом и сохраняется в кэше.
+    """
+    mapping = get_application_map(user.id)
+    if mapping is None:
+        mapping = dict(Application.objects.filter(user=user).values_list('process_name', 'id'))
+        set_application_map(user.id, mapping)
+    return mapping
+
+
+def resolve_applications(user, parsed_items):
+    """
+    Находит или создает все приложения, на которые ссылается пакет,
+    и проставляет application_id каждому элементу.
+    Известные приложения берутся из кэша без запросов к базе.
+    """
+    mapping = application_map(user)
+    known_ids = set(mapping.values())
+
+    # Элементы с неизвестным ID обрабатываются по имени приложения, как в perform_create
+    for parsed in parsed_items:
+        if parsed['application_id'] is not None and parsed['application_id'] not in known_ids:
+            parsed['process_name'] = parsed['app_name'] or str(parsed['application_id'])
+            parsed['application_id'] = None
+
+    missing = {}
+    for parsed in parsed_items:
+        name = parsed['process_name']
+        if parsed['application_id'] is None and name and name not in mapping and name not in missing:
+            missing[name] = Application(
+                user=user,
+                name=display_name(name, parsed['app_name'] or name),
+                process_name=name,
+            )
+
+    if missing:
+        # Семантика get_or_create на уровне пакета: unique_together (user, process_name)
+        # с ignore_conflicts защищает от гонки с параллельным запросом того же агента
+        Application.objects.bulk_create(missing.values(), ignore_conflicts=True)
+        mapping = {
+            **mapping,
+            **dict(Application.objects.filter(
+                user=user, process_name__in=missing.keys()
+            ).values_list('process_name', 'id')),
+        }
+        # Новые ID попадают в кэш только после фиксации транзакции
+        transaction.on_commit(lambda: set_application_map(user.id, mapping))
+
+    for parsed in parsed_items:
+        if parsed['application_id'] is None:
+            parsed['application_id'] = mapping.get(parsed['process_name'])
+
+
+def resolve_application_id(user, process_name, app_name=''):
+    """
+    ID приложения для одиночной активности: по числовому ID или по имени процесса
+    """
+    parsed = {'application_id': None, 'process_name': process_name, 'app_name': str(app_name or '')[:255]}
+    if isinstance(process_name, int) or (isinstance(process_name, str) and process_name.isdigit()):
+        parsed['application_id'] = int(process_name)
+        parsed['process_name'] = ''
+    else:
+        parsed['process_name'] = str(process_name or '') or parsed['app_name'] or UNKNOWN_APPLICATION_NAME
+    parsed['process_name'] = parsed['process_name'][:255]
+    resolve_applications(user, [parsed])
+    return parsed['application_id']
+
+
+def resolve_process_names(user, names):
+    """
+    ID приложений по списку имен процессов, недостающие приложения создаются одним запросом.
+    Возвращает словарь имя процесса -> ID.
+    """
+    parsed_items = [
+        {'application_id': None, 'process_name': name[:255], 'app_name': name[:255]}
+        for name in dict.fromkeys(names) if name
+    ]
+    with transaction.atomic():
+        resolve_applications(user, parsed_items)
+    return {parsed['process_name']: parsed['application_id'] for parsed in parsed_items}
+
+
+def ingest_activities(user, items, parse_item=parse_activity_item, rollup=add_activities):
+    """
+    Сохраняет пакет активностей одной транзакцией.
+    rollup получает созданные активности для дневной сводки.
+    Возвращает список статусов в порядке элементов запроса.
+    """
+    results = [None] * len(items)
+    parsed_items = []
+    positions = []
+
+    for index, item in enumerate(items):
+        try:
+            parsed_items.append(parse_item(item))
+            positions.append(index)
+        except ActivityItemError as e:
+            results[index] = {'index': index, 'status': 'error', 'detail': str(e)}
+
+    with transaction.atomic():
+        resolve_applications(user, parsed_items)
+
+        activities = []
+        activity_positions = []
+        for index, parsed in zip(positions, parsed_items):
+            if parsed['application_id'] is None:
+                results[index] = {'index': index, 'status': 'error', 'detail': 'Приложение не найдено.'}
+                continue
+
+            activities.append(UserActivity(
+                user=user,
+                application_id=parsed['application_id'],
+                start_time=parsed['start_time'],
+                end_time=parsed['end_time'],
+                duration=parsed['duration'],
+                keyboard_presses=parsed['keyboard_presses'],
+            ))
+            activity_positions.append(index)
+
+        created = UserActivity.objects.bulk_create(
+            activities,
+            batch_size=getattr(settings, 'BULK_INGEST_BATCH_SIZE', 500),
+        )
+        rollup(created)
+
+    for index, activity in zip(activity_positions, created):
+        results[index] = {
+            'index': index,
+            'status': 'created',
+            'id': activity.pk,
+            'application': activity.application_id,
+        }
+
+    if created:
+        # bulk_create не вызывает UserActivity.save, поэтому кэш сбрасываем один раз на пакет,
+        # после фиксации внешней транзакции (при групповой записи)
+        transaction.on_commit(lambda: UserActivity.invalidate_user_cache(user.id))
+
+    return results
@@ -0,0 +1,144 @@
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import KeyboardActivity, KeyboardActivityBucket
+
+
+def bucket_minute(timestamp):
+    """
+    Начало минуты, к которой относится нажатие
+    """
+    return timestamp.replace(second=0, microsecond=0)
+
+
+def _histogram_enabled():
+    return getattr(settings, 'KEYBOARD_KEY_HISTOGRAM', True)
+
+
+def _fold(events):
+    """
+    Сворачивает нажатия (user_id, application_id, timestamp, key) в счетчики по минутам
+    """
+    deltas = defaultdict(Counter)
+    for user_id, application_id, timestamp, key in events:
+        deltas[(user_id, application_id, bucket_minute(timestamp))][key or ''] += 1
+    return deltas
+
+
+def _merge(deltas, sign=1):
+    """
+    Прибавляет счетчики к существующим минутным сводкам или создает новые.
+    При sign=-1 счетчики вычитаются, опустевшие сводки удаляются
+    """
+    if not deltas:
+        return
+    histogram = _histogram_enabled()
+
+    existing = {
+        (bucket.user_id, bucket.application_id, bucket.minute): bucket
+        for bucket in KeyboardActivityBucket.objects.select_for_update().filter(
+            user_id__in={key[0] for key in deltas},
+            application_id__in={key[1] for key in deltas},
+            minute__in={key[2] for key in deltas},
+        )
+    }
+
+    to_update, to_create, to_delete = [], [], []
+    for (user_id, application_id, minute), keys in deltas.items():
+        bucket = existing.get((user_id, application_id, minute))
+        if bucket is None and sign < 0:
+            continue
+        if bucket is None:
+            bucket = KeyboardActivityBucket(
+                user_id=user_id,
+                application_id=application_id,
+                minute=minute,
+                key_count=0,
+                key_histogram={},
+            )
+            to_create.append(bucket)
+        else:
+            to_update.append(bucket)
+
+        bucket.key_count += sign * sum(keys.values())
+        if histogram:
+            merged = Counter(bucket.key_histogram)
+            if sign < 0:
+                merged.subtract(keys)
+                merged = +merged
+            else:
+                merged.update(keys)
+            bucket.key_histogram = dict(merged)
+        if bucket.key_count <= 0:
+            to_update.remove(bucket)
+            to_delete.append(bucket.pk)
+
+    if to_delete:
+        KeyboardActivityBucket.objects.filter(pk__in=to_delete).delete()
+    if to_update:
+        KeyboardActivityBucket.objects.bulk_update(to_update, ['key_count', 'key_histogram'])
+    if to_create:
+        KeyboardActivityBucket.objects.bulk_create(to_create)
+
+
+def merge_into_buckets(events):
+    """
+    Учитывает нажатия в минутных сводках.
+    Если параллельный запрос успел создать ту же сводку, слияние повторяется
+    уже с обновлением существующей строки.
+    """
+    deltas = _fold(events)
+    for attempt in range(2):
+        try:
+            with transaction.atomic():
+                _merge(deltas)
+            return
+        except IntegrityError:
+            if attempt:
+                raise
+
+
+def subtract_from_buckets(events):
+    """
+    Убирает нажатия из минутных сводок, например при изменении или удалении сырой строки
+    """
+    with transaction.atomic():
+        _merge(_fold(events), sign=-1)
+
+
+def compact_keyboard_activity(older_than_days=None, batch_size=5000):
+    """
+    Переносит сырые нажатия старше N дней в минутные сводки и удаляет их.
+    Нажатия, уже учтенные при записи, только удаляются.
+    Возвращает пару (перенесено в сводки, удалено сырых строк).
+    """
+    if older_than_days is None:
+        older_than_days = settings.KEYBOARD_RAW_RETENTION_DAYS
+    cutoff = timezone.now() - timedelta(days=older_than_days)
+
+    moved = deleted = 0
+    last_pk = 0
+    while True:
+        # Проход по первичному ключу: каждая пачка продолжает предыдущую без повторного сканирования
+        rows = list(
+            KeyboardActivity.objects.filter(pk__gt=last_pk, timestamp__lt=cutoff)
+            .order_by('pk')
+            .values_list('pk', 'user_id', 'application_id', 'timestamp', 'key_pressed', 'bucketed')[:batch_size]
+        )
+        if not rows:
+            break
+        last_pk = rows[-1][0]
+
+        events = [row[1:5] for row in rows if not row[5]]
+        with transaction.atomic():
+            if events:
+                _merge(_fold(events))
+            KeyboardActivity.objects.filter(pk__in=[row[0] for row in rows]).delete()
+        moved += len(events)
+        deleted += len(rows)
+
+    return moved, deleted
@@ -1,13 +1,128 @@
+import atexit
 import logging
 import json
+import queue
+import random
+import threading
+from logging.handlers import QueueHandler, QueueListener
 from django.conf import settings
-from datetime import datetime
+from datetime import datetime, timezone
 
 # Создаем логгеры для разных типов событий
 activity_logger = logging.getLogger('tracking.activity')
 performance_logger = logging.getLogger('tracking.performance')
 error_logger = logging.getLogger('tracking.error')
 
+QUEUED_LOGGERS = ('tracking.activity', 'tracking.performance', 'tracking.error')
+
+
+class JsonMessage:
+    """
+    Сообщение лога, которое сериализуется в JSON только при форматировании,
+    то есть в потоке записи, а не в потоке запроса
+    """
+    __slots__ = ('data',)
+
+    def __init__(self, data):
+        self.data = data
+
+    def __str__(self):
+        return json.dumps(self.data, default=str)
+
+
+class BoundedQueueHandler(QueueHandler):
+    """
+    Кладет записи в ограниченную очередь без форматирования.
+    При переполнении записи ниже ERROR отбрасываются сразу, ошибки ждут
+    место не дольше block_timeout секунд. Отброшенные записи считаются в dropped.
+    """
+
+    def __init__(self, log_queue, block_timeout=0.1):
+        super().__init__(log_queue)
+        self.block_timeout = block_timeout
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Очередь внутри процесса: форматирование откладывается до потока записи
+        return record
+
+    def enqueue(self, record):
+        try:
+            if record.levelno >= logging.ERROR:
+                self.queue.put(record, timeout=self.block_timeout)
+            else:
+                self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class RoutingQueueListener(QueueListener):
+    """
+    Один поток записи для всех логгеров: запись передается
+    обработчикам того логгера, который ее создал
+    """
+
+    def __init__(self, log_queue, routes):
+        super().__init__(log_queue, respect_handler_level=True)
+        self.routes = routes
+
+    def handle(self, record):
+        for handler in self.routes.get(record.name, ()):
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+
+_listener = None
+_listener_lock = threading.Lock()
+
+
+def start_log_listener():
+    """
+    Переносит файловые обработчики логгеров tracking.* в фоновый поток.
+    Логгеры получают общий BoundedQueueHandler, а обработчики из settings.LOGGING
+    вызываются слушателем очереди.
+    """
+    global _listener
+    with _listener_lock:
+        if _listener is not None:
+            return _listener
+
+        log_queue = queue.Queue(maxsize=getattr(settings, 'LOG_QUEUE_SIZE', 10000))
+        queue_handler = BoundedQueueHandler(log_queue, getattr(settings, 'LOG_QUEUE_BLOCK_TIMEOUT', 0.1))
+        routes = {}
+        for name in QUEUED_LOGGERS:
+            logger = logging.getLogger(name)
+            routes[name] = list(logger.handlers)
+            for handler in routes[name]:
+                logger.removeHandler(handler)
+            logger.addHandler(queue_handler)
+
+        _listener = RoutingQueueListener(log_queue, routes)
+        _listener.queue_handler = queue_handler
+        _listener.start()
+        # Дописываем очередь при завершении процесса
+        atexit.register(stop_log_listener)
+        return _listener
+
+
+def stop_log_listener():
+    global _listener
+    with _listener_lock:
+        if _listener is None:
+            return
+        _listener.stop()
+        for name, handlers in _listener.routes.items():
+            logger = logging.getLogger(name)
+            logger.removeHandler(_listener.queue_handler)
+            for handler in handlers:
+                logger.addHandler(handler)
+        _listener = None
+
+
+def _performance_sample_rate(view_name):
+    rates = getattr(settings, 'PERFORMANCE_LOG_SAMPLE_RATES', {})
+    return rates.get(view_name, getattr(settings, 'PERFORMANCE_LOG_SAMPLE_RATE', 1.0))
+
 class ActivityLogger:
     @staticmethod
     def log_user_activity(user, activity_type, details):
@@ -15,13 +130,13 @@ class ActivityLogger:
         Логирует активность пользователя
         """
         log_data = {
-            'timestamp': datetime.now().isoformat(),
+            'timestamp': datetime.now(timezone.utc).isoformat(),
             'user_id': user.id,
             'username': user.username,
             'activity_type': activity_type,
             'details': details
         }
-        activity_logger.info(json.dumps(log_data))
+        activity_logger.info(JsonMessage(log_data))
 
     @staticmethod
     def log_application_activity(user, application, action):
@@ -29,14 +144,14 @@ class ActivityLogger:
         Логирует действия с приложениями
         """
         log_data = {
-            'timestamp': datetime.now().isoformat(),
+            'timestamp': datetime.now(timezone.utc).isoformat(),
             'user_id': user.id,
             'username': user.username,
             'application_id': application.id,
             'application_name': application.name,
             'action': action
         }
-        activity_logger.info(json.dumps(log_data))
+        activity_logger.info(JsonMessage(log_data))
 
 class PerformanceLogger:
     @staticmethod
@@ -45,26 +160,39 @@ class PerformanceLogger:
         Логирует производительность запросов
         """
         log_data = {
-            'timestamp': datetime.now().isoformat(),
+            'timestamp': datetime.now(timezone.utc).isoformat(),
             'view_name': view_name,
             'query_time': query_time,
             'query_type': query_type,
             'details': details
         }
-        performance_logger.info(json.dumps(log_data))
+        performance_logger.info(JsonMessage(log_data))
 
     @staticmethod
-    def log_view_performance(view_name, response_time, status_code):
+    def log_view_performance(view_name, response_time, status_code, n_queries=None, db_time=None):
         """
-        Логирует производительность представлений
+        Логирует производительность представлений.
+        Медленные и ошибочные ответы пишутся всегда, остальные - с долей sample_rate.
         """
+        sample_rate = _performance_sample_rate(view_name)
+        is_notable = status_code >= 500 or response_time > getattr(settings, 'SLOW_REQUEST_THRESHOLD', 1.0)
+        if sample_rate < 1.0 and not is_notable:
+            if random.random() >= sample_rate:
+                return
+        else:
+            sample_rate = 1.0
+
         log_data = {
-            'timestamp': datetime.now().isoformat(),
+            'timestamp': datetime.now(timezone.utc).isoformat(),
             'view_name': view_name,
             'response_time': response_time,
-            'status_code': status_code
+            'status_code': status_code,
+            'sample_rate': sample_rate
         }
-        performance_logger.info(json.dumps(log_data))
+        if n_queries is not None:
+            log_data['n_queries'] = n_queries
+            log_data['db_time'] = db_time
+        performance_logger.info(JsonMessage(log_data))
 
 class ErrorLogger:
     @staticmethod
@@ -73,12 +201,12 @@ class ErrorLogger:
         Логирует ошибки
         """
         log_data = {
-            'timestamp': datetime.now().isoformat(),
+            'timestamp': datetime.now(timezone.utc).isoformat(),
             'error_type': error_type,
             'error_message': str(error_message),
             'details': details
         }
-        error_logger.error(json.dumps(log_data))
+        error_logger.error(JsonMessage(log_data))
 
     @staticmethod
     def log_validation_error(model_name, field_name, error_message):
@@ -86,10 +214,10 @@ class ErrorLogger:
         Логирует ошибки валидации
         """
         log_data = {
-            'timestamp': datetime.now().isoformat(),
+            'timestamp': datetime.now(timezone.utc).isoformat(),
             'error_type': 'ValidationError',
             'model': model_name,
             'field': field_name,
             'message': str(error_message)
         }
-        error_logger.error(json.dumps(log_data)) 
\ No newline at end of file
+        error_logger.error(JsonMessage(log_data)) 
\ No newline at end of file
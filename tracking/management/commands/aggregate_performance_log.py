@@ -0,0 +1,47 @@
+import time
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from tracking.performance_log import collect_performance_log, default_log_files, store_performance_summary
+
+
+class Command(BaseCommand):
+    help = 'Собирает журнал производительности (вместе с ротированными файлами) в часовую сводку PerformanceSummary'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'files',
+            nargs='*',
+            help='Файлы журнала (по умолчанию logs/performance.log и его ротированные копии, включая .gz). '
+                 'Затронутые ими часы пересчитываются по всем файлам журнала',
+        )
+        parser.add_argument('--date-from', help='Учитывать записи начиная с даты YYYY-MM-DD')
+        parser.add_argument('--days', type=int, help='Учитывать только последние N дней')
+        parser.add_argument('--batch-size', type=int, default=500, help='Размер пакета при вставке')
+
+    def handle(self, *args, **options):
+        since = None
+        if options['date_from']:
+            try:
+                since = datetime.strptime(options['date_from'], '%Y-%m-%d')
+            except ValueError:
+                raise CommandError(f"Неверный формат --date-from: {options['date_from']}. Используйте YYYY-MM-DD.")
+        if options['days']:
+            since = timezone.now().replace(minute=0, second=0, microsecond=0) - timedelta(days=options['days'])
+
+        files = options['files'] or default_log_files()
+        if not files:
+            raise CommandError('Файлы журнала производительности не найдены')
+
+        started = time.perf_counter()
+        try:
+            stats, entries = collect_performance_log(options['files'], since=since)
+        except OSError as e:
+            raise CommandError(f'Ошибка чтения журнала: {e}')
+        created = store_performance_summary(stats, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Файлов: {len(files)}, записей: {entries}, строк сводки: {created}, '
+            f'за {time.perf_counter() - started:.1f} с'
+        ))
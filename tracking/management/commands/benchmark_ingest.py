@@ -0,0 +1,126 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+from django.utils import timezone
+
+# Режимы сравнения: исходная конфигурация SQLite и настроенная (PRAGMA + групповая фиксация)
+MODES = {
+    'baseline': {'SQLITE_TUNING': 'False', 'INGEST_WRITE_BATCHING': 'False'},
+    'tuned': {'SQLITE_TUNING': 'True', 'SQLITE_JOURNAL_MODE': 'WAL', 'INGEST_WRITE_BATCHING': 'True'},
+}
+
+
+class Command(BaseCommand):
+    help = 'Замеряет скорость записи UserActivity при множестве параллельных писателей на временной базе SQLite'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=50, help='Количество параллельных писателей')
+        parser.add_argument('--requests', type=int, default=20, help='Запросов на одного писателя')
+        parser.add_argument('--items', type=int, default=5, help='Активностей в одном запросе')
+        parser.add_argument('--mode', choices=[*MODES, 'both'], default='both', help='Какую конфигурацию замерить')
+        parser.add_argument('--worker', action='store_true', help='Внутренний режим: выполнить замер в текущем процессе')
+
+    def handle(self, *args, **options):
+        if options['worker']:
+            self.stdout.write(json.dumps(self._run_worker(options)))
+            return
+
+        modes = list(MODES) if options['mode'] == 'both' else [options['mode']]
+        results = []
+        with tempfile.TemporaryDirectory() as directory:
+            for mode in modes:
+                results.append((mode, self._spawn(mode, directory, options)))
+
+        self.stdout.write(f"{'Режим':<10} {'Записей':>8} {'Ошибок':>7} {'Секунд':>8} {'Записей/с':>10}")
+        for mode, result in results:
+            self.stdout.write(
+                f"{mode:<10} {result['rows']:>8} {result['errors']:>7} "
+                f"{result['elapsed']:>8.2f} {result['rows_per_second']:>10.0f}"
+            )
+
+    def _spawn(self, mode, directory, options):
+        """
+        Каждый режим запускается отдельным процессом на своем файле базы,
+        чтобы настройки соединений и журнал WAL не влияли друг на друга
+        """
+        env = dict(
+            os.environ,
+            DB_ENGINE='sqlite',
+            DB_NAME=os.path.join(directory, f'{mode}.sqlite3'),
+            DEBUG='False',
+            **MODES[mode],
+        )
+        command = [
+            sys.executable, str(settings.BASE_DIR / 'manage.py'), 'benchmark_ingest', '--worker',
+            '--writers', str(options['writers']),
+            '--requests', str(options['requests']),
+            '--items', str(options['items']),
+        ]
+        process = subprocess.run(command, env=env, capture_output=True, text=True)
+        lines = [line for line in process.stdout.splitlines() if line.startswith('{')]
+        if process.returncode != 0 or not lines:
+            raise CommandError(f'Замер {mode} завершился с ошибкой:\n{process.stderr[-2000:]}')
+        return json.loads(lines[-1])
+
+    def _run_worker(self, options):
+        from tracking.batching import submit_activities
+        from tracking.models import UserActivity
+        from users.models import CustomUser
+
+        if connection.vendor != 'sqlite':
+            raise CommandError('Замер предназначен для SQLite')
+
+        call_command('migrate', verbosity=0, interactive=False)
+        user = CustomUser.objects.create_user(
+            username='benchmark', password=None, department='benchmark', position='benchmark'
+        )
+
+        start = timezone.now() - timedelta(days=1)
+        errors = []
+        barrier = threading.Barrier(options['writers'])
+
+        def writer(number):
+            barrier.wait()
+            for request in range(options['requests']):
+                offset = (number * options['requests'] + request) * options['items']
+                items = [
+                    {
+                        'process_name': f'app{(offset + i) % 10}.exe',
+                        'start_time': (start + timedelta(seconds=offset + i)).isoformat(),
+                        'end_time': (start + timedelta(seconds=offset + i + 1)).isoformat(),
+                        'keyboard_presses': 1,
+                    }
+                    for i in range(options['items'])
+                ]
+                try:
+                    submit_activities(user, items)
+                except OperationalError as e:
+                    # Обычно "database is locked" - писатель не дождался блокировки
+                    errors.append(str(e))
+            connection.close()
+
+        threads = [threading.Thread(target=writer, args=(n,)) for n in range(options['writers'])]
+        began = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - began
+
+        rows = UserActivity.objects.filter(user=user).count()
+        return {
+            'rows': rows,
+            'errors': len(errors),
+            'elapsed': elapsed,
+            'rows_per_second': rows / elapsed if elapsed else 0,
+        }
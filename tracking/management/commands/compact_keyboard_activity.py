@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from tracking.keyboard import compact_keyboard_activity
+
+
+class Command(BaseCommand):
+    help = 'Переносит сырые нажатия клавиш старше N дней в минутные сводки и удаляет их'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=settings.KEYBOARD_RAW_RETENTION_DAYS,
+            help='Сколько дней хранить сырые нажатия',
+        )
+        parser.add_argument('--batch-size', type=int, default=5000, help='Строк в одном пакете')
+
+    def handle(self, *args, **options):
+        if options['days'] < 0:
+            raise CommandError('--days не может быть отрицательным')
+
+        moved, deleted = compact_keyboard_activity(
+            older_than_days=options['days'],
+            batch_size=options['batch_size'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Перенесено в сводки: {moved}, удалено сырых строк: {deleted}'
+        ))
@@ -0,0 +1,48 @@
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from tracking.rollups import rebuild_daily_usage
+from users.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = 'Заполняет или перестраивает дневную сводку DailyAppUsage по сырым активностям'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Имя пользователя (по умолчанию все пользователи)')
+        parser.add_argument('--date-from', help='Начальная дата в формате YYYY-MM-DD')
+        parser.add_argument('--date-to', help='Конечная дата в формате YYYY-MM-DD')
+        parser.add_argument('--days', type=int, help='Перестроить только последние N дней')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Размер пакета при вставке')
+
+    def _parse_date(self, value, option):
+        if not value:
+            return None
+        try:
+            return datetime.strptime(value, '%Y-%m-%d').date()
+        except ValueError:
+            raise CommandError(f'Неверный формат {option}: {value}. Используйте YYYY-MM-DD.')
+
+    def handle(self, *args, **options):
+        user = None
+        if options['user']:
+            try:
+                user = CustomUser.objects.get(username=options['user'])
+            except CustomUser.DoesNotExist:
+                raise CommandError(f"Пользователь {options['user']} не найден")
+
+        date_from = self._parse_date(options['date_from'], '--date-from')
+        date_to = self._parse_date(options['date_to'], '--date-to')
+        if options['days']:
+            date_to = timezone.localdate()
+            date_from = date_to - timedelta(days=options['days'] - 1)
+
+        created = rebuild_daily_usage(
+            user=user,
+            date_from=date_from,
+            date_to=date_to,
+            batch_size=options['batch_size'],
+        )
+        self.stdout.write(self.style.SUCCESS(f'Создано строк сводки: {created}'))
@@ -0,0 +1,408 @@
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from functools import partial
+
+from django.conf import settings
+
+# Границы бакетов для экспорта в Prometheus: точные бакеты гистограммы
+# сворачиваются в этот фиксированный набор, чтобы ряды складывались между серверами
+LATENCY_BOUNDS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+QUERY_COUNT_BOUNDS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+METRICS = {
+    'tracker_http_request_duration_seconds': ('Время обработки запроса', LATENCY_BOUNDS),
+    'tracker_db_queries_per_request': ('Количество запросов к БД на запрос', QUERY_COUNT_BOUNDS),
+    'tracker_db_time_seconds': ('Время запросов к БД на запрос', LATENCY_BOUNDS),
+}
+
+_BOUNDS_TABLES = {}
+
+# Снимок, который не обновлялся дольше стольких интервалов сохранения, считается
+# оставленным завершившимся процессом и не учитывается
+STALE_FLUSH_INTERVALS = 6
+
+
+class Histogram:
+    """
+    Гистограмма с логарифмическими бакетами в духе HDR Histogram:
+    бакет i покрывает (lowest * growth^(i-1), lowest * growth^i],
+    значения не больше lowest попадают в бакет 0, нулевые - в бакет -1.
+    При growth=1.05 ошибка квантиля не больше 5% при любом масштабе значений,
+    а память - только под непустые бакеты.
+    """
+
+    def __init__(self, lowest=1e-4, growth=1.05):
+        self.lowest = lowest
+        self.growth = growth
+        self._log_growth = math.log(growth)
+        self.counts = {}
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def _index(self, value):
+        if value <= 0:
+            return -1
+        if value <= self.lowest:
+            return 0
+        return math.ceil(math.log(value / self.lowest) / self._log_growth)
+
+    def upper_bound(self, index):
+        if index < 0:
+            return 0.0
+        return self.lowest * self.growth ** index
+
+    def record(self, value):
+        index = self._index(value)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def _bounds(self):
+        # Верхние границы первых 400 бакетов: при настройках по умолчанию - до ~8 часов
+        key = (self.lowest, self.growth)
+        bounds = _BOUNDS_TABLES.get(key)
+        if bounds is None:
+            bounds = _BOUNDS_TABLES[key] = [self.upper_bound(index) for index in range(400)]
+        return bounds
+
+    def record_many(self, values, weight=1):
+        """
+        Учитывает список значений с одинаковым весом. Бакеты ищутся двоичным
+        поиском по таблице границ, а не логарифмом для каждого значения
+        """
+        if not values:
+            return
+        bounds = self._bounds()
+        counts = self.counts
+        for index, count in Counter(map(partial(bisect_left, bounds), values)).items():
+            if index == 0 or index == len(bounds):
+                # Нули и значения за пределами таблицы - через общий расчет номера
+                for value in values:
+                    if (value <= bounds[0]) if index == 0 else (value > bounds[-1]):
+                        exact = self._index(value)
+                        counts[exact] = counts.get(exact, 0) + weight
+                continue
+            counts[index] = counts.get(index, 0) + count * weight
+        self.count += len(values) * weight
+        self.sum += sum(values) * weight
+        self.max = max(self.max, max(values))
+
+    def merge(self, other):
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.count += other.count
+        self.sum += other.sum
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q):
+        """
+        Значение квантиля q (0..1) - верхняя граница бакета, не больше максимума
+        """
+        if not self.count:
+            return 0.0
+        rank = max(math.ceil(q * self.count), 1)
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(self.upper_bound(index), self.max)
+        return self.max
+
+    def cumulative(self, bounds):
+        """
+        Накопленные количества для границ le (формат бакетов Prometheus)
+        """
+        result = []
+        items = sorted(self.counts.items())
+        position = seen = 0
+        for bound in bounds:
+            while position < len(items) and self.upper_bound(items[position][0]) <= bound * (1 + 1e-9):
+                seen += items[position][1]
+                position += 1
+            result.append(seen)
+        return result
+
+    def to_dict(self):
+        return {
+            'counts': dict(self.counts),
+            'count': self.count,
+            'sum': self.sum,
+            'max': self.max,
+        }
+
+    def load(self, data):
+        self.counts = {int(index): count for index, count in data['counts'].items()}
+        self.count = data['count']
+        self.sum = data['sum']
+        self.max = data['max']
+        return self
+
+
+class CountHistogram(Histogram):
+    """
+    Точная гистограмма небольших целых значений: бакет - само значение
+    """
+
+    def _index(self, value):
+        return int(value)
+
+    def upper_bound(self, index):
+        return index
+
+
+def _pid_alive(pid):
+    if os.name == 'nt':
+        # В Windows os.kill завершает процесс, поэтому там проверяется только время снимка
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _histogram_for(metric):
+    if metric == 'tracker_db_queries_per_request':
+        return CountHistogram()
+    return Histogram()
+
+
+class MetricsRegistry:
+    """
+    Гистограммы процесса по (метрика, метки).
+    Запись защищена блокировкой, а фоновый поток периодически сохраняет снимок
+    в файл <pid>.json общего каталога. Сборщик складывает снимки всех процессов,
+    поэтому /metrics на любом воркере отдает сумму по серверу.
+    Снимки завершившихся процессов удаляются при запуске и при сборе.
+    """
+
+    def __init__(self, directory, flush_interval=5.0):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._series = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._dirty = False
+        self.purge_stale(include_own=True)
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='metrics-flush', daemon=True)
+                self._thread.start()
+
+    def observe(self, metric, labels, value):
+        key = (metric, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._series.get(key)
+            if histogram is None:
+                histogram = self._series[key] = _histogram_for(metric)
+            histogram.record(value)
+            self._dirty = True
+        self._ensure_started()
+
+    def _snapshot(self):
+        with self._lock:
+            self._dirty = False
+            return [
+                [metric, dict(labels), histogram.to_dict()]
+                for (metric, labels), histogram in self._series.items()
+            ]
+
+    def _path(self, pid=None):
+        return os.path.join(self.directory, f'{pid or os.getpid()}.json')
+
+    def flush(self):
+        """
+        Атомарно сохраняет снимок процесса: читатели не увидят недописанный файл
+        """
+        if not self._dirty and os.path.exists(self._path()):
+            # Без новых данных только обновляется время файла: снимок живого процесса не устаревает
+            os.utime(self._path())
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        snapshot = self._snapshot()
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as file:
+            json.dump(snapshot, file)
+        os.replace(temp_path, self._path())
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except OSError:
+                pass
+
+    def _is_stale(self, name, now):
+        pid = name.partition('.')[0]
+        try:
+            if now - os.path.getmtime(os.path.join(self.directory, name)) > self.flush_interval * STALE_FLUSH_INTERVALS:
+                return True
+        except OSError:
+            return True
+        return name.endswith('.json') and pid.isdigit() and not _pid_alive(int(pid))
+
+    def purge_stale(self, include_own=False):
+        """
+        Удаляет снимки завершившихся процессов и недописанные временные файлы.
+        include_own - удалить и файл с PID текущего процесса: его мог оставить
+        прежний процесс с тем же PID
+        """
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        now = time.time()
+        own = os.path.basename(self._path())
+        live = []
+        for name in names:
+            if not name.endswith(('.json', '.tmp')):
+                continue
+            if name == own and not include_own:
+                live.append(name)
+            elif (name == own and include_own) or self._is_stale(name, now):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+            elif name.endswith('.json'):
+                live.append(name)
+        return live
+
+    def collect(self):
+        """
+        Сумма гистограмм всех процессов: {(метрика, метки): Histogram}
+        """
+        self.flush()
+        merged = {}
+        for name in self.purge_stale():
+            try:
+                with open(os.path.join(self.directory, name)) as file:
+                    snapshot = json.load(file)
+            except (OSError, ValueError):
+                continue
+            for metric, labels, data in snapshot:
+                key = (metric, tuple(sorted(labels.items())))
+                histogram = _histogram_for(metric).load(data)
+                if key in merged:
+                    merged[key].merge(histogram)
+                else:
+                    merged[key] = histogram
+        return merged
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def metrics_registry():
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = MetricsRegistry(settings.METRICS_DIR, settings.METRICS_FLUSH_INTERVAL)
+    return _registry
+
+
+def status_class(status_code):
+    return f'{status_code // 100}xx'
+
+
+def record_request(view_name, status_code, duration, n_queries, db_time):
+    """
+    Учитывает обработанный запрос в гистограммах времени ответа и запросов к БД
+    """
+    registry = metrics_registry()
+    registry.observe(
+        'tracker_http_request_duration_seconds',
+        {'view': view_name, 'status': status_class(status_code)},
+        duration,
+    )
+    registry.observe('tracker_db_queries_per_request', {'view': view_name}, n_queries)
+    registry.observe('tracker_db_time_seconds', {'view': view_name}, db_time)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels, extra=None):
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def prometheus_text(series=None):
+    """
+    Гистограммы в текстовом формате Prometheus 0.0.4
+    """
+    if series is None:
+        series = metrics_registry().collect()
+    lines = []
+    for metric, (description, bounds) in METRICS.items():
+        lines.append(f'# HELP {metric} {description}')
+        lines.append(f'# TYPE {metric} histogram')
+        for (name, labels), histogram in sorted(series.items()):
+            if name != metric:
+                continue
+            for bound, count in zip(bounds, histogram.cumulative(bounds)):
+                lines.append(f'{metric}_bucket{_labels(labels, ("le", bound))} {count}')
+            lines.append(f'{metric}_bucket{_labels(labels, ("le", "+Inf"))} {histogram.count}')
+            lines.append(f'{metric}_sum{_labels(labels)} {histogram.sum}')
+            lines.append(f'{metric}_count{_labels(labels)} {histogram.count}')
+    return '\n'.join(lines) + '\n'
+
+
+def latency_summary(series=None):
+    """
+    Строки для страницы метрик: квантили времени ответа по представлению и классу статуса
+    вместе со средним числом и временем запросов к БД
+    """
+    if series is None:
+        series = metrics_registry().collect()
+    db_queries = {}
+    db_time = {}
+    for (metric, labels), histogram in series.items():
+        view = dict(labels).get('view')
+        if metric == 'tracker_db_queries_per_request':
+            db_queries[view] = histogram
+        elif metric == 'tracker_db_time_seconds':
+            db_time[view] = histogram
+
+    rows = []
+    for (metric, labels), histogram in series.items():
+        if metric != 'tracker_http_request_duration_seconds':
+            continue
+        labels = dict(labels)
+        queries = db_queries.get(labels['view'])
+        query_time = db_time.get(labels['view'])
+        rows.append({
+            'view': labels['view'],
+            'status': labels['status'],
+            'count': histogram.count,
+            'p50': histogram.quantile(0.5) * 1000,
+            'p95': histogram.quantile(0.95) * 1000,
+            'p99': histogram.quantile(0.99) * 1000,
+            'max': histogram.max * 1000,
+            'avg_queries': queries.sum / queries.count if queries and queries.count else 0,
+            'queries_p95': queries.quantile(0.95) if queries else 0,
+            'avg_db_time': query_time.sum / query_time.count * 1000 if query_time and query_time.count else 0,
+        })
+    rows.sort(key=lambda row: row['p95'], reverse=True)
+    return rows
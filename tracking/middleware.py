@@ -8,36 +8,88 @@ from .exceptions import (
     InvalidTimeRange,
     ApplicationNotFound,
     UserActivityNotFound,
-    InvalidActivityData
+    InvalidActivityData,
+    InvalidActivityFormat
 )
 from .logging import PerformanceLogger, ErrorLogger
 from .alerts import AlertManager
+from .metrics import record_request
+import heapq
+import io
 import time
+import zlib
 from django.db import connection
 from django.conf import settings
+from django.http import JsonResponse
+
+class QueryTimer:
+    """
+    Обертка для connection.execute_wrapper: измеряет каждый запрос к БД
+    через perf_counter и хранит только счетчики и top_n самых медленных SQL.
+    В отличие от connection.queries работает при DEBUG=False
+    и не копит все запросы в памяти.
+    """
+
+    def __init__(self, threshold, top_n=5):
+        self.threshold = threshold
+        self.top_n = top_n
+        self.count = 0
+        self.total_time = 0.0
+        self.slow_count = 0
+        self._slowest = []  # min-куча (время, порядковый номер, sql)
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            self.count += 1
+            self.total_time += duration
+            if duration > self.threshold:
+                self.slow_count += 1
+                item = (duration, self.slow_count, sql)
+                if len(self._slowest) < self.top_n:
+                    heapq.heappush(self._slowest, item)
+                else:
+                    heapq.heappushpop(self._slowest, item)
+
+    def merge(self, other):
+        """
+        Добавляет замеры другого таймера, например потока-писателя с отдельным соединением
+        """
+        self.count += other.count
+        self.total_time += other.total_time
+        self.slow_count += other.slow_count
+        for item in other._slowest:
+            if len(self._slowest) < self.top_n:
+                heapq.heappush(self._slowest, item)
+            else:
+                heapq.heappushpop(self._slowest, item)
+
+    @property
+    def slow_queries(self):
+        return [{'sql': sql, 'time': duration} for duration, _, sql in sorted(self._slowest, reverse=True)]
 
 class PerformanceMonitoringMiddleware:
     def __init__(self, get_response):
         self.get_response = get_response
 
     def __call__(self, request):
-        # Время начала обработки запроса
-        start_time = time.time()
-
-        # Количество запросов к БД до обработки запроса
-        n_queries_before = len(connection.queries)
-
-        response = self.get_response(request)
+        query_timer = QueryTimer(
+            threshold=getattr(settings, 'SLOW_QUERY_THRESHOLD', 0.1),
+            top_n=getattr(settings, 'SLOW_QUERY_TOP_N', 5),
+        )
 
-        # Время окончания обработки запроса
-        end_time = time.time()
+        # Время начала обработки запроса
+        start_time = time.perf_counter()
 
-        # Количество запросов к БД после обработки запроса
-        n_queries_after = len(connection.queries)
+        with connection.execute_wrapper(query_timer):
+            response = self.get_response(request)
 
         # Вычисляем время выполнения и количество запросов
-        execution_time = end_time - start_time
-        n_queries = n_queries_after - n_queries_before
+        execution_time = time.perf_counter() - start_time
+        n_queries = query_timer.count
 
         # Логируем информацию о производительности
         if hasattr(request, 'resolver_match') and request.resolver_match:
@@ -48,16 +100,22 @@ class PerformanceMonitoringMiddleware:
         PerformanceLogger.log_view_performance(
             view_name=view_name,
             response_time=execution_time,
-            status_code=response.status_code
+            status_code=response.status_code,
+            n_queries=n_queries,
+            db_time=query_timer.total_time
         )
 
+        if getattr(settings, 'METRICS_ENABLED', True):
+            record_request(view_name, response.status_code, execution_time, n_queries, query_timer.total_time)
+
         # Если время выполнения превышает порог, логируем предупреждение и отправляем алерт
         if execution_time > getattr(settings, 'SLOW_REQUEST_THRESHOLD', 1.0):
             details = {
                 'view_name': view_name,
                 'method': request.method,
                 'path': request.path,
-                'n_queries': n_queries
+                'n_queries': n_queries,
+                'db_time': query_timer.total_time
             }
             
             ErrorLogger.log_error(
@@ -72,31 +130,65 @@ class PerformanceMonitoringMiddleware:
                 threshold=settings.SLOW_REQUEST_THRESHOLD
             )
 
-        # Проверяем медленные запросы к БД
-        slow_queries = []
-        for query in connection.queries[n_queries_before:]:
-            query_time = float(query.get('time', 0))
-            if query_time > getattr(settings, 'SLOW_QUERY_THRESHOLD', 0.1):
-                slow_queries.append({
-                    'sql': query.get('sql'),
-                    'time': query_time
-                })
-
-        if slow_queries:
+        # Медленные запросы к БД уже отобраны оберткой
+        if query_timer.slow_count:
+            slow_queries = query_timer.slow_queries
             ErrorLogger.log_error(
                 error_type='SlowQueries',
-                error_message=f'Detected {len(slow_queries)} slow queries',
+                error_message=f'Detected {query_timer.slow_count} slow queries',
                 details={'queries': slow_queries}
             )
 
             AlertManager.performance_alert(
                 view_name=view_name,
-                response_time=max(q['time'] for q in slow_queries),
-                threshold=settings.SLOW_QUERY_THRESHOLD
+                response_time=slow_queries[0]['time'],
+                threshold=settings.SLOW_QUERY_THRESHOLD,
+                kind='query'
             )
 
         return response
 
+class RequestDecompressionMiddleware:
+    """
+    Распаковывает тела запросов с Content-Encoding: gzip или deflate.
+    Размер распакованных данных ограничен, чтобы маленький архив
+    не раздулся в памяти сервера.
+    """
+    DECODERS = {
+        'gzip': zlib.MAX_WBITS | 16,
+        'deflate': zlib.MAX_WBITS,
+    }
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        encoding = request.META.get('HTTP_CONTENT_ENCODING', '').strip().lower()
+        if encoding in self.DECODERS:
+            max_size = getattr(settings, 'MAX_DECOMPRESSED_REQUEST_SIZE', 50 * 1024 * 1024)
+            decompressor = zlib.decompressobj(self.DECODERS[encoding])
+            try:
+                body = decompressor.decompress(request.body, max_size + 1)
+            except zlib.error:
+                return self._error('invalid_content_encoding', 'Не удалось распаковать тело запроса.', 400)
+
+            if len(body) > max_size or decompressor.unconsumed_tail:
+                return self._error('request_too_large', 'Распакованное тело запроса слишком велико.', 413)
+            if not decompressor.eof:
+                return self._error('invalid_content_encoding', 'Сжатое тело запроса обрезано.', 400)
+
+            # Дальше запрос обрабатывается как обычный несжатый
+            request._body = body
+            request._stream = io.BytesIO(body)
+            request.META['CONTENT_LENGTH'] = str(len(body))
+            del request.META['HTTP_CONTENT_ENCODING']
+
+        return self.get_response(request)
+
+    @staticmethod
+    def _error(code, detail, status_code):
+        return JsonResponse({'status': 'error', 'code': code, 'detail': detail}, status=status_code)
+
 def custom_exception_handler(exc, context):
     # Сначала вызываем стандартный обработчик исключений DRF
     response = exception_handler(exc, context)
@@ -126,7 +218,8 @@ def custom_exception_handler(exc, context):
 
     # Если это одно из наших пользовательских исключений
     if isinstance(exc, (ApplicationAlreadyExists, InvalidTimeRange, 
-                       ApplicationNotFound, UserActivityNotFound, InvalidActivityData)):
+                       ApplicationNotFound, UserActivityNotFound, InvalidActivityData,
+                       InvalidActivityFormat)):
         data = {
             'status': 'error',
             'code': exc.default_code,
@@ -0,0 +1,74 @@
+# Generated by Django 5.0.2 on 2026-10-18 16:11
+
+from itertools import islice
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, DurationField, ExpressionWrapper, F, Sum
+from django.db.models.functions import Coalesce, TruncDate
+
+
+def backfill_daily_usage(apps, schema_editor):
+    UserActivity = apps.get_model('tracking', 'UserActivity')
+    DailyAppUsage = apps.get_model('tracking', 'DailyAppUsage')
+
+    rows = UserActivity.objects.annotate(
+        day=TruncDate('start_time')
+    ).values('user_id', 'application_id', 'day').annotate(
+        total=Sum(Coalesce(
+            'duration',
+            ExpressionWrapper(F('end_time') - F('start_time'), output_field=DurationField()),
+        )),
+        keystrokes=Sum('keyboard_presses'),
+        sessions=Count('id'),
+    ).order_by()
+
+    # Строки сводки создаются пачками, без списка на всю таблицу
+    usage = (
+        DailyAppUsage(
+            user_id=row['user_id'],
+            application_id=row['application_id'],
+            date=row['day'],
+            total_seconds=row['total'].total_seconds() if row['total'] else 0,
+            keystrokes=row['keystrokes'] or 0,
+            session_count=row['sessions'],
+        )
+        for row in rows.iterator(chunk_size=1000)
+    )
+    while True:
+        batch = list(islice(usage, 1000))
+        if not batch:
+            break
+        DailyAppUsage.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0003_useractivity_keyboard_presses'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyAppUsage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Дата')),
+                ('total_seconds', models.FloatField(default=0, verbose_name='Общее время (секунды)')),
+                ('keystrokes', models.BigIntegerField(default=0, verbose_name='Количество нажатий клавиш')),
+                ('session_count', models.IntegerField(default=0, verbose_name='Количество сессий')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('application', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_usage', to='tracking.application', verbose_name='Приложение')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_usage', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Дневная сводка по приложению',
+                'verbose_name_plural': 'Дневные сводки по приложениям',
+                'indexes': [models.Index(fields=['user', 'date'], name='tracking_da_user_id_eba91b_idx')],
+                'unique_together': {('user', 'application', 'date')},
+            },
+        ),
+        migrations.RunPython(backfill_daily_usage, migrations.RunPython.noop),
+    ]
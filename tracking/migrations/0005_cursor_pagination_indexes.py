@@ -0,0 +1,35 @@
+# Generated by Django 5.0.2 on 2026-10-18 16:30
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0004_dailyappusage'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='keyboardactivity',
+            name='tracking_ke_user_id_1e5cee_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='useractivity',
+            name='tracking_us_user_id_2e59e4_idx',
+        ),
+        migrations.AddIndex(
+            model_name='keyboardactivity',
+            index=models.Index(fields=['user', 'timestamp', 'id'], name='tracking_ke_user_id_015a22_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='useractivity',
+            index=models.Index(fields=['user', 'start_time', 'id'], name='tracking_us_user_id_5d3b37_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='useractivity',
+            index=models.Index(fields=['start_time', 'id'], name='tracking_us_start_t_221502_idx'),
+        ),
+    ]
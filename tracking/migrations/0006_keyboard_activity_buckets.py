@@ -0,0 +1,100 @@
+# Generated by Django 5.0.2 on 2026-10-18 16:33
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+CHUNK_SIZE = 5000
+
+
+def _merge_buckets(KeyboardActivityBucket, buckets):
+    """
+    Складывает сводки пачки с уже записанными: минута может попасть в несколько пачек
+    """
+    minutes = [minute for _, _, minute in buckets]
+    existing = KeyboardActivityBucket.objects.filter(
+        user_id__in={user_id for user_id, _, _ in buckets},
+        minute__gte=min(minutes),
+        minute__lte=max(minutes),
+    )
+    to_update = []
+    for bucket in existing:
+        new = buckets.pop((bucket.user_id, bucket.application_id, bucket.minute), None)
+        if new is None:
+            continue
+        bucket.key_count += new.key_count
+        for key, count in new.key_histogram.items():
+            bucket.key_histogram[key] = bucket.key_histogram.get(key, 0) + count
+        to_update.append(bucket)
+    KeyboardActivityBucket.objects.bulk_update(to_update, ['key_count', 'key_histogram'], batch_size=1000)
+    KeyboardActivityBucket.objects.bulk_create(buckets.values(), batch_size=1000)
+
+
+def backfill_keyboard_buckets(apps, schema_editor):
+    KeyboardActivity = apps.get_model('tracking', 'KeyboardActivity')
+    KeyboardActivityBucket = apps.get_model('tracking', 'KeyboardActivityBucket')
+
+    # Проход пачками по первичному ключу: в памяти только сводки одной пачки
+    last_pk = 0
+    while True:
+        rows = list(
+            KeyboardActivity.objects.filter(pk__gt=last_pk)
+            .order_by('pk')
+            .values_list('pk', 'user_id', 'application_id', 'timestamp', 'key_pressed')[:CHUNK_SIZE]
+        )
+        if not rows:
+            break
+        last_pk = rows[-1][0]
+
+        buckets = {}
+        for _, user_id, application_id, timestamp, key in rows:
+            minute = timestamp.replace(second=0, microsecond=0)
+            bucket = buckets.get((user_id, application_id, minute))
+            if bucket is None:
+                bucket = buckets[(user_id, application_id, minute)] = KeyboardActivityBucket(
+                    user_id=user_id,
+                    application_id=application_id,
+                    minute=minute,
+                    key_count=0,
+                    key_histogram={},
+                )
+            bucket.key_count += 1
+            bucket.key_histogram[key or ''] = bucket.key_histogram.get(key or '', 0) + 1
+        _merge_buckets(KeyboardActivityBucket, buckets)
+
+    KeyboardActivity.objects.update(bucketed=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0005_cursor_pagination_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='keyboardactivity',
+            name='bucketed',
+            field=models.BooleanField(default=False, verbose_name='Учтено в минутной сводке'),
+        ),
+        migrations.CreateModel(
+            name='KeyboardActivityBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('minute', models.DateTimeField(verbose_name='Минута')),
+                ('key_count', models.IntegerField(default=0, verbose_name='Количество нажатий')),
+                ('key_histogram', models.JSONField(blank=True, default=dict, verbose_name='Нажатия по клавишам')),
+                ('application', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='keyboard_buckets', to='tracking.application', verbose_name='Приложение')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='keyboard_buckets', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Минутная сводка клавиатуры',
+                'verbose_name_plural': 'Минутные сводки клавиатуры',
+                'indexes': [models.Index(fields=['user', 'minute', 'id'], name='tracking_ke_user_id_7b9757_idx')],
+                'unique_together': {('user', 'application', 'minute')},
+            },
+        ),
+        migrations.RunPython(backfill_keyboard_buckets, migrations.RunPython.noop),
+    ]
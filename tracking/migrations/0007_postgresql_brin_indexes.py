@@ -0,0 +1,40 @@
+# Generated by Django 5.0.2 on 2026-10-18 16:34
+
+from django.db import migrations
+
+# Таблицы пишутся в порядке времени, поэтому BRIN-индекс по времени
+# в сотни раз меньше B-tree и подходит для выборок по периодам.
+# В SQLite BRIN нет - там хватает составных индексов из 0005.
+BRIN_INDEXES = [
+    ('tracking_useractivity_start_brin', 'tracking_useractivity', 'start_time'),
+    ('tracking_keyboardactivity_ts_brin', 'tracking_keyboardactivity', 'timestamp'),
+    ('tracking_keyboardbucket_minute_brin', 'tracking_keyboardactivitybucket', 'minute'),
+]
+
+
+def create_brin_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    quote = schema_editor.quote_name
+    for name, table, column in BRIN_INDEXES:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {quote(name)} ON {quote(table)} USING brin ({quote(column)})'
+        )
+
+
+def drop_brin_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, _table, _column in BRIN_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {schema_editor.quote_name(name)}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0006_keyboard_activity_buckets'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_brin_indexes, drop_brin_indexes),
+    ]
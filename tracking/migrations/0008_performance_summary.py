@@ -0,0 +1,37 @@
+# Generated by Django 5.0.2 on 2026-10-18 16:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0007_postgresql_brin_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PerformanceSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('view_name', models.CharField(max_length=200, verbose_name='Представление')),
+                ('hour', models.DateTimeField(verbose_name='Час')),
+                ('requests', models.FloatField(default=0, verbose_name='Запросов (с учетом выборки)')),
+                ('sampled', models.IntegerField(default=0, verbose_name='Записей в логе')),
+                ('errors', models.FloatField(default=0, verbose_name='Ответов 5xx')),
+                ('p50', models.FloatField(default=0, verbose_name='p50, мс')),
+                ('p95', models.FloatField(default=0, verbose_name='p95, мс')),
+                ('p99', models.FloatField(default=0, verbose_name='p99, мс')),
+                ('max_time', models.FloatField(default=0, verbose_name='Максимум, мс')),
+                ('avg_queries', models.FloatField(blank=True, null=True, verbose_name='Запросов к БД в среднем')),
+                ('avg_db_time', models.FloatField(blank=True, null=True, verbose_name='Время БД в среднем, мс')),
+                ('latency_histogram', models.JSONField(blank=True, default=dict, verbose_name='Гистограмма времени ответа')),
+            ],
+            options={
+                'verbose_name': 'Сводка производительности',
+                'verbose_name_plural': 'Сводки производительности',
+                'indexes': [models.Index(fields=['hour'], name='tracking_pe_hour_909c29_idx')],
+                'unique_together': {('view_name', 'hour')},
+            },
+        ),
+    ]
@@ -0,0 +1,65 @@
+from django.db import migrations
+
+# Копия tracking.app_names.APP_DISPLAY_NAMES на момент миграции: последующие
+# изменения словаря не должны менять результат миграции
+APP_DISPLAY_NAMES = {
+    'browser.exe': 'Yandex Браузер',
+    'chrome.exe': 'Google Chrome',
+    'firefox.exe': 'Mozilla Firefox',
+    'msedge.exe': 'Microsoft Edge',
+    'opera.exe': 'Opera',
+    'safari.exe': 'Safari',
+    'brave.exe': 'Brave Browser',
+    'vivaldi.exe': 'Vivaldi',
+    'iexplore.exe': 'Internet Explorer',
+    'word.exe': 'Microsoft Word',
+    'excel.exe': 'Microsoft Excel',
+    'powerpnt.exe': 'Microsoft PowerPoint',
+    'outlook.exe': 'Microsoft Outlook',
+    'winword.exe': 'Microsoft Word',
+    'notepad.exe': 'Notepad',
+    'notepad++.exe': 'Notepad++',
+    'code.exe': 'Visual Studio Code',
+    'devenv.exe': 'Visual Studio',
+    'pycharm64.exe': 'PyCharm',
+    'idea64.exe': 'IntelliJ IDEA',
+    'photoshop.exe': 'Adobe Photoshop',
+    'illustrator.exe': 'Adobe Illustrator',
+    'acrobat.exe': 'Adobe Acrobat',
+    'acrord32.exe': 'Adobe Reader',
+    'slack.exe': 'Slack',
+    'teams.exe': 'Microsoft Teams',
+    'discord.exe': 'Discord',
+    'telegram.exe': 'Telegram',
+    'whatsapp.exe': 'WhatsApp',
+    'skype.exe': 'Skype',
+    'zoom.exe': 'Zoom',
+    'steam.exe': 'Steam',
+    'spotify.exe': 'Spotify',
+    'vlc.exe': 'VLC Media Player',
+    'wmplayer.exe': 'Windows Media Player',
+    'explorer.exe': 'Windows Explorer',
+    'cmd.exe': 'Командная строка',
+    'powershell.exe': 'PowerShell',
+    'python.exe': 'Python',
+    'javaw.exe': 'Java',
+    'node.exe': 'Node.js',
+}
+
+
+def normalize_application_names(apps, schema_editor):
+    # Раньше названия переписывались при каждом открытии статистики и дашборда
+    Application = apps.get_model('tracking', 'Application')
+    for process_name, name in APP_DISPLAY_NAMES.items():
+        Application.objects.filter(process_name__iexact=process_name).exclude(name=name).update(name=name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0008_performance_summary'),
+    ]
+
+    operations = [
+        migrations.RunPython(normalize_application_names, migrations.RunPython.noop),
+    ]
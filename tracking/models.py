@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from users.models import CustomUser
 from django.utils import timezone
 
@@ -25,6 +25,49 @@ class Application(models.Model):
     def __str__(self):
         return f"{self.name} ({self.process_name})"
 
+class UserActivityQuerySet(models.QuerySet):
+    """
+    Массовые delete() и update() (в том числе действия админки) минуют save() и delete()
+    модели, поэтому дневная сводка пересчитывается здесь по затронутым ключам.
+    При каскадном удалении пользователя или приложения строки сводки удаляются каскадом сами
+    """
+
+    def _usage_keys(self):
+        return {
+            (user_id, application_id, timezone.localtime(start_time).date())
+            for user_id, application_id, start_time in self.values_list('user_id', 'application_id', 'start_time')
+        }
+
+    def _refresh_usage(self, keys):
+        from .rollups import refresh_daily_usage
+
+        refresh_daily_usage(keys)
+        for user_id in {key[0] for key in keys}:
+            UserActivity.invalidate_user_cache(user_id)
+
+    def delete(self):
+        with transaction.atomic():
+            keys = self._usage_keys()
+            result = super().delete()
+            self._refresh_usage(keys)
+        return result
+
+    delete.alters_data = True
+    delete.queryset_only = True
+
+    def update(self, **kwargs):
+        with transaction.atomic():
+            pks = list(self.values_list('pk', flat=True))
+            keys = self._usage_keys()
+            rows = super().update(**kwargs)
+            # Ключи после изменения: активность могла перейти в другой день или приложение
+            keys |= UserActivity.objects.filter(pk__in=pks)._usage_keys()
+            self._refresh_usage(keys)
+        return rows
+
+    update.alters_data = True
+
+
 class UserActivity(models.Model):
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, verbose_name='Пользователь')
     application = models.ForeignKey(Application, on_delete=models.CASCADE, verbose_name='Приложение')
@@ -32,39 +75,58 @@ class UserActivity(models.Model):
     end_time = models.DateTimeField(verbose_name='Время окончания')
     duration = models.DurationField(verbose_name='Длительность', null=True, blank=True)
     keyboard_presses = models.IntegerField(default=0, verbose_name='Количество нажатий клавиш')
+
+    objects = UserActivityQuerySet.as_manager()
     
     def save(self, *args, **kwargs):
+        from .rollups import add_activities, refresh_daily_usage, usage_key
+
         # Автоматически вычисляем duration при сохранении
         if self.start_time and self.end_time and (self.duration is None):
             self.duration = self.end_time - self.start_time
+
+        # При изменении существующей записи запоминаем ее прежний день для пересчета сводки
+        previous = None
+        if self.pk and not self._state.adding:
+            previous = UserActivity.objects.filter(pk=self.pk).only(
+                'user_id', 'application_id', 'start_time'
+            ).first()
+
         super().save(*args, **kwargs)
-        
-        # Полная очистка кэша после сохранения
-        from django.core.cache import cache
-        
-        # Очищаем кэш пользователя
-        cache.delete(f'user_activity_{self.user.id}')
-        
-        # Очищаем кэш за сегодня и вчера (на случай данных, пересекающих полночь)
-        today = timezone.now().date()
-        yesterday = today - timezone.timedelta(days=1)
-        
-        cache.delete(f'dashboard_{self.user.id}_{today}')
-        cache.delete(f'dashboard_{self.user.id}_{yesterday}')
-        
-        # Очищаем все возможные кэши статистики
-        cache.delete(f'statistics_{self.user.id}_None_')
-        for days in [7, 14, 30, 90]:
-            cache.delete(f'statistics_{self.user.id}_{days}_')
-        
-        # Очищаем списки приложений
-        cache.delete(f'application_list_{self.user.id}')
+
+        # Поддерживаем дневную сводку DailyAppUsage в актуальном состоянии
+        if previous is None:
+            add_activities([self])
+        else:
+            refresh_daily_usage({usage_key(previous), usage_key(self)})
+
+        self.invalidate_user_cache(self.user_id)
+
+    def delete(self, *args, **kwargs):
+        from .rollups import refresh_daily_usage, usage_key
+
+        key = usage_key(self)
+        result = super().delete(*args, **kwargs)
+        refresh_daily_usage({key})
+        self.invalidate_user_cache(self.user_id)
+        return result
+
+    @staticmethod
+    def invalidate_user_cache(user_id):
+        """
+        Сбрасывает кэш пользователя переходом на новое поколение ключей
+        """
+        from .caching import bump_cache_generation
+
+        bump_cache_generation(user_id)
 
     class Meta:
         verbose_name = 'Активность пользователя'
         verbose_name_plural = 'Активности пользователей'
         indexes = [
-            models.Index(fields=['user', 'start_time']),
+            # Составные ключи (время, id) для постраничного вывода по курсору
+            models.Index(fields=['user', 'start_time', 'id']),
+            models.Index(fields=['start_time', 'id']),
             models.Index(fields=['user', 'end_time']),
             models.Index(fields=['application', 'start_time']),
             models.Index(fields=['application', 'end_time']),
@@ -73,23 +135,76 @@ class UserActivity(models.Model):
     def __str__(self):
         return f"{self.user.username} - {self.application.name}"
 
+class DailyAppUsage(models.Model):
+    """
+    Дневная сводка использования приложения, обновляется при записи активностей
+    """
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='daily_usage', verbose_name='Пользователь')
+    application = models.ForeignKey(Application, on_delete=models.CASCADE, related_name='daily_usage', verbose_name='Приложение')
+    date = models.DateField(verbose_name='Дата')
+    total_seconds = models.FloatField(default=0, verbose_name='Общее время (секунды)')
+    keystrokes = models.BigIntegerField(default=0, verbose_name='Количество нажатий клавиш')
+    session_count = models.IntegerField(default=0, verbose_name='Количество сессий')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Дневная сводка по приложению'
+        verbose_name_plural = 'Дневные сводки по приложениям'
+        unique_together = ('user', 'application', 'date')
+        indexes = [
+            models.Index(fields=['user', 'date']),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} - {self.application_id} - {self.date}"
+
 class KeyboardActivity(models.Model):
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, verbose_name='Пользователь')
     timestamp = models.DateTimeField(verbose_name='Время')
     key_pressed = models.CharField(max_length=50, verbose_name='Нажатая клавиша')
     application = models.ForeignKey(Application, on_delete=models.CASCADE, verbose_name='Приложение')
+    bucketed = models.BooleanField(default=False, verbose_name='Учтено в минутной сводке')
 
     class Meta:
         verbose_name = 'Активность клавиатуры'
         verbose_name_plural = 'Активности клавиатуры'
         indexes = [
-            models.Index(fields=['user', 'timestamp']),
+            models.Index(fields=['user', 'timestamp', 'id']),
             models.Index(fields=['application', 'timestamp']),
         ]
 
     def __str__(self):
         return f"{self.user.username} - {self.key_pressed}"
 
+class KeyboardActivityBucket(models.Model):
+    """
+    Нажатия клавиш за минуту по приложению - компактная форма KeyboardActivity
+    """
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='keyboard_buckets', verbose_name='Пользователь')
+    application = models.ForeignKey(Application, on_delete=models.CASCADE, related_name='keyboard_buckets', verbose_name='Приложение')
+    minute = models.DateTimeField(verbose_name='Минута')
+    key_count = models.IntegerField(default=0, verbose_name='Количество нажатий')
+    key_histogram = models.JSONField(default=dict, blank=True, verbose_name='Нажатия по клавишам')
+
+    class Meta:
+        verbose_name = 'Минутная сводка клавиатуры'
+        verbose_name_plural = 'Минутные сводки клавиатуры'
+        unique_together = ('user', 'application', 'minute')
+        indexes = [
+            models.Index(fields=['user', 'minute', 'id']),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} - {self.application_id} - {self.minute}"
+
+    @property
+    def top_keys(self):
+        """
+        Самые частые клавиши минуты, не больше пяти
+        """
+        keys = sorted(self.key_histogram.items(), key=lambda item: item[1], reverse=True)[:5]
+        return ', '.join(f'{key} ({count})' for key, count in keys)
+
 class TimeLog(models.Model):
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='timelogs')
     start_time = models.DateTimeField()
@@ -115,3 +230,32 @@ class TimeLog(models.Model):
             hours = duration.total_seconds() / 3600
             return f"{round(hours, 2)} hours"
         return "N/A"
+
+class PerformanceSummary(models.Model):
+    """
+    Часовая сводка журнала производительности по представлению,
+    заполняется командой aggregate_performance_log
+    """
+    view_name = models.CharField(max_length=200, verbose_name='Представление')
+    hour = models.DateTimeField(verbose_name='Час')
+    requests = models.FloatField(default=0, verbose_name='Запросов (с учетом выборки)')
+    sampled = models.IntegerField(default=0, verbose_name='Записей в логе')
+    errors = models.FloatField(default=0, verbose_name='Ответов 5xx')
+    p50 = models.FloatField(default=0, verbose_name='p50, мс')
+    p95 = models.FloatField(default=0, verbose_name='p95, мс')
+    p99 = models.FloatField(default=0, verbose_name='p99, мс')
+    max_time = models.FloatField(default=0, verbose_name='Максимум, мс')
+    avg_queries = models.FloatField(null=True, blank=True, verbose_name='Запросов к БД в среднем')
+    avg_db_time = models.FloatField(null=True, blank=True, verbose_name='Время БД в среднем, мс')
+    latency_histogram = models.JSONField(default=dict, blank=True, verbose_name='Гистограмма времени ответа')
+
+    class Meta:
+        verbose_name = 'Сводка производительности'
+        verbose_name_plural = 'Сводки производительности'
+        unique_together = ('view_name', 'hour')
+        indexes = [
+            models.Index(fields=['hour']),
+        ]
+
+    def __str__(self):
+        return f"{self.view_name} - {self.hour}"
@@ -0,0 +1,220 @@
+import base64
+import json
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class InvalidCursor(ValueError):
+    """Курсор страницы поврежден или подделан."""
+
+
+def encode_cursor(value, pk, backwards=False):
+    """
+    Курсор - позиция (значение поля сортировки, id) в base64
+    """
+    data = json.dumps([value.isoformat(), pk, backwards], separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    try:
+        value, pk, backwards = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        value = parse_datetime(value)
+        if value is None or not isinstance(pk, int):
+            raise ValueError
+    except (TypeError, ValueError, UnicodeError):
+        raise InvalidCursor('Неверный курсор страницы.')
+    return value, pk, bool(backwards)
+
+
+class KeysetPage:
+    """
+    Страница выборки по ключу (поле, id) от новых записей к старым.
+    Стоимость не зависит от номера страницы: запрос начинается
+    сразу с позиции курсора по составному индексу, без OFFSET.
+    """
+
+    def __init__(self, queryset, field, cursor=None, page_size=20):
+        self.field = field
+        self.page_size = page_size
+
+        backwards = False
+        if cursor:
+            value, pk, backwards = decode_cursor(cursor)
+            if backwards:
+                queryset = queryset.filter(Q(**{f'{field}__gt': value}) | Q(**{field: value, 'pk__gt': pk}))
+            else:
+                queryset = queryset.filter(Q(**{f'{field}__lt': value}) | Q(**{field: value, 'pk__lt': pk}))
+
+        if backwards:
+            queryset = queryset.order_by(field, 'pk')
+        else:
+            queryset = queryset.order_by(f'-{field}', '-pk')
+
+        rows = list(queryset[:page_size + 1])
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if backwards:
+            rows.reverse()
+
+        self.object_list = rows
+        if backwards:
+            self.has_previous = has_more
+            self.has_next = True
+        else:
+            self.has_previous = bool(cursor)
+            self.has_next = has_more
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def _position(self, obj):
+        return getattr(obj, self.field), obj.pk
+
+    @property
+    def next_cursor(self):
+        if not self.has_next or not self.object_list:
+            return None
+        return encode_cursor(*self._position(self.object_list[-1]))
+
+    @property
+    def previous_cursor(self):
+        if not self.has_previous or not self.object_list:
+            return None
+        return encode_cursor(*self._position(self.object_list[0]), backwards=True)
+
+
+class KeysetPaginationMixin:
+    """
+    Постраничный вывод для ListView по курсору вместо номера страницы.
+    В контексте: page (KeysetPage), next_query и previous_query -
+    строки запроса со всеми текущими фильтрами и новым курсором.
+    """
+    keyset_field = 'start_time'
+    keyset_page_size = 20
+    cursor_param = 'cursor'
+
+    def keyset_page(self, queryset, field=None, cursor_param=None, page_size=None):
+        cursor_param = cursor_param or self.cursor_param
+        try:
+            return KeysetPage(
+                queryset,
+                field or self.keyset_field,
+                self.request.GET.get(cursor_param),
+                page_size or self.keyset_page_size,
+            )
+        except InvalidCursor:
+            # Поврежденный курсор - показываем первую страницу
+            return KeysetPage(queryset, field or self.keyset_field, None, page_size or self.keyset_page_size)
+
+    def cursor_query(self, cursor, cursor_param=None):
+        params = self.request.GET.copy()
+        params.pop('page', None)
+        params[cursor_param or self.cursor_param] = cursor
+        return params.urlencode()
+
+    def get_context_data(self, **kwargs):
+        page = self.keyset_page(self.object_list)
+        context = super().get_context_data(object_list=page.object_list, **kwargs)
+        context['page'] = page
+        if page.next_cursor:
+            context['next_query'] = self.cursor_query(page.next_cursor)
+        if page.previous_cursor:
+            context['previous_query'] = self.cursor_query(page.previous_cursor)
+        return context
+
+
+class KeysetCursorPagination(BasePagination):
+    """
+    Курсорная пагинация API по (поле, id).
+    Ответ: {"count": всего записей, "next": url, "previous": url, "results": [...]}.
+    count стоит одного COUNT-запроса; с include_count = False поле не отдается.
+    Неверный курсор - ответ 400.
+    """
+    ordering_field = 'start_time'
+    include_count = True
+    page_size = 50
+    max_page_size = 500
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        try:
+            self.page = KeysetPage(
+                queryset,
+                self.ordering_field,
+                request.query_params.get(self.cursor_query_param),
+                self.get_page_size(request),
+            )
+        except InvalidCursor as e:
+            raise ValidationError({self.cursor_query_param: [str(e)]})
+        self.count = queryset.count() if self.include_count else None
+        return self.page.object_list
+
+    def _link(self, cursor):
+        url = self.request.build_absolute_uri()
+        if cursor is None:
+            return None
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_next_link(self):
+        return self._link(self.page.next_cursor)
+
+    def get_previous_link(self):
+        if not self.page.has_previous:
+            return None
+        cursor = self.page.previous_cursor
+        if cursor is None:
+            return remove_query_param(self.request.build_absolute_uri(), self.cursor_query_param)
+        return self._link(cursor)
+
+    def get_paginated_response(self, data):
+        response = {
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        }
+        if self.include_count:
+            response = {'count': self.count, **response}
+        return Response(response)
+
+    def get_paginated_response_schema(self, schema):
+        properties = {'count': {'type': 'integer'}} if self.include_count else {}
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                **properties,
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class ActivityCursorPagination(KeysetCursorPagination):
+    ordering_field = 'start_time'
+
+
+class KeyboardActivityCursorPagination(KeysetCursorPagination):
+    ordering_field = 'timestamp'
+
+
+class KeyboardBucketCursorPagination(KeysetCursorPagination):
+    ordering_field = 'minute'
@@ -0,0 +1,308 @@
+import glob
+import gzip
+import re
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+from operator import itemgetter
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .metrics import Histogram
+from .models import PerformanceSummary
+
+# Запись PerformanceLogger.log_view_performance: поля в порядке записи, из времени берутся
+# час и смещение часового пояса (в старых логах его нет, время там локальное).
+# Кавычки внутри классов символов записаны как \x22, чтобы не попасть под замену ниже
+_FIELDS = (
+    rb'timestamp": "(\d{4}-\d\d-\d\dT\d\d)[\d:.]*(Z|[+-]\d\d:\d\d)?[^\x22\\]*", '
+    rb'"view_name": "([^\x22\\]*)", '
+    rb'"response_time": ([^,]+), '
+    rb'"status_code": (\d+)'
+    rb'(?:, "sample_rate": ([^,}]+))?'
+    rb'(?:, "n_queries": (\d+), "db_time": ([^,}\\]+))?'
+)
+_ENTRY = re.compile(_FIELDS)
+# В старых логах JSON вложен строкой в {"message": "..."} и кавычки экранированы.
+# Такое выражение медленнее, поэтому применяется только к блокам со старыми записями
+_LEGACY_ENTRY = re.compile(_FIELDS.replace(b'"', rb'\\?"'))
+
+HOUR_FORMAT = '%Y-%m-%dT%H'
+
+# Представление, час, смещение, sample_rate
+_group_key = itemgetter(2, 0, 1, 5)
+_response_time = itemgetter(3)
+_status = itemgetter(4)
+_n_queries = itemgetter(6)
+_db_time = itemgetter(7)
+
+
+class _HourStats:
+    """
+    Накопитель одного часа одного представления. Записи из выборки
+    учитываются с весом 1/sample_rate, поэтому доля ошибок не завышается
+    """
+    __slots__ = ('latency', 'requests', 'errors', 'sampled', 'queries', 'db_time', 'query_weight')
+
+    def __init__(self):
+        self.latency = Histogram()
+        self.requests = 0.0
+        self.errors = 0.0
+        self.sampled = 0
+        self.queries = 0.0
+        self.db_time = 0.0
+        self.query_weight = 0.0
+
+    def add(self, rows, weight):
+        """
+        Учитывает записи с одинаковым весом: поля разбираются map по всему
+        списку, а не по одной записи
+        """
+        self.latency.record_many(list(map(float, map(_response_time, rows))), weight)
+        self.requests += len(rows) * weight
+        self.sampled += len(rows)
+        for status, count in Counter(map(_status, rows)).items():
+            if status.startswith(b'5'):
+                self.errors += count * weight
+        n_queries = list(filter(None, map(_n_queries, rows)))
+        if n_queries:
+            self.queries += sum(map(int, n_queries)) * weight
+            self.db_time += sum(map(float, filter(None, map(_db_time, rows)))) * weight
+            self.query_weight += len(n_queries) * weight
+
+
+def _utc_hour(hour, offset):
+    """
+    Час записи в UTC в формате HOUR_FORMAT. Время без смещения (старые логи)
+    считается локальным временем TIME_ZONE
+    """
+    value = datetime.strptime(hour.decode(), HOUR_FORMAT)
+    if not offset:
+        value = timezone.make_aware(value)
+    elif offset != b'Z':
+        sign = -1 if offset[:1] == b'-' else 1
+        value = value.replace(tzinfo=dt_timezone(sign * timedelta(hours=int(offset[1:3]), minutes=int(offset[4:6]))))
+    else:
+        value = value.replace(tzinfo=dt_timezone.utc)
+    return value.astimezone(dt_timezone.utc).strftime(HOUR_FORMAT)
+
+
+def _since_key(since):
+    """
+    Ключ часа UTC для since; наивное время считается локальным временем TIME_ZONE
+    """
+    if timezone.is_naive(since):
+        since = timezone.make_aware(since)
+    return since.astimezone(dt_timezone.utc).strftime(HOUR_FORMAT)
+
+
+def default_log_files():
+    """
+    Файл журнала производительности из LOGGING вместе с ротированными копиями
+    """
+    path = str(settings.LOGGING['handlers']['file_performance']['filename'])
+    return sorted(glob.glob(path + '*'))
+
+
+def _open(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    return open(path, 'rb')
+
+
+def _chunks(paths, chunk_size):
+    """
+    Содержимое файлов блоками примерно по chunk_size байт, обрезанными по концу строки
+    """
+    for path in paths:
+        with _open(path) as file:
+            rest = b''
+            while True:
+                data = file.read(chunk_size)
+                if not data:
+                    if rest:
+                        yield rest
+                    break
+                data = rest + data
+                cut = data.rfind(b'\n') + 1
+                yield data[:cut]
+                rest = data[cut:]
+
+
+def aggregate_performance_log(paths, since=None, chunk_size=16 * 1024 * 1024):
+    """
+    Потоково читает журналы производительности и собирает статистику по (представление, час).
+    Записи блока выделяются одним регулярным выражением по байтам без json.loads,
+    группируются по (представление, час, sample_rate) и учитываются пакетно;
+    квантили считаются по гистограммам tracking.metrics.Histogram.
+    Часы приводятся к UTC. since - время (наивное считается локальным),
+    записи более ранних часов пропускаются.
+    Возвращает ({(представление, 'YYYY-MM-DDTHH' в UTC): _HourStats}, число учтенных записей).
+    """
+    since_key = _since_key(since) if since else None
+    hours = {}
+    stats = {}
+    entries = 0
+    for chunk in _chunks(paths, chunk_size):
+        pattern = _LEGACY_ENTRY if b'\\"timestamp' in chunk else _ENTRY
+        groups = defaultdict(list)
+        for row in pattern.findall(chunk):
+            groups[_group_key(row)].append(row)
+
+        for (view, hour, offset, rate), rows in groups.items():
+            utc_hour = hours.get((hour, offset))
+            if utc_hour is None:
+                utc_hour = hours[(hour, offset)] = _utc_hour(hour, offset)
+            if since_key and utc_hour < since_key:
+                continue
+            item = stats.get((view, utc_hour))
+            if item is None:
+                item = stats[(view, utc_hour)] = _HourStats()
+            item.add(rows, 1.0 / float(rate) if rate else 1.0)
+            entries += len(rows)
+
+    return {(view.decode('utf-8', errors='replace'), hour): item for (view, hour), item in stats.items()}, entries
+
+
+def collect_performance_log(files=None, since=None, chunk_size=16 * 1024 * 1024):
+    """
+    Статистика для сводки без неполных часов. Час может быть разбит между
+    ротированными файлами, поэтому если заданы отдельные файлы, затронутые ими часы
+    разбираются заново по всем файлам журнала (default_log_files и заданным).
+    Возвращает то же, что aggregate_performance_log; число записей - по заданным файлам.
+    """
+    all_files = default_log_files()
+    if not files:
+        return aggregate_performance_log(all_files, since=since, chunk_size=chunk_size)
+
+    stats, entries = aggregate_performance_log(files, since=since, chunk_size=chunk_size)
+    if not stats:
+        return stats, entries
+    hours = {hour for _, hour in stats}
+    first_hour = datetime.strptime(min(hours), HOUR_FORMAT).replace(tzinfo=dt_timezone.utc)
+    full_stats, _ = aggregate_performance_log(
+        sorted(set(all_files) | set(files)), since=first_hour, chunk_size=chunk_size
+    )
+    return {key: item for key, item in full_stats.items() if key[1] in hours}, entries
+
+
+def _summary(view_name, hour, item):
+    latency = item.latency
+    return PerformanceSummary(
+        view_name=view_name[:200],
+        hour=hour,
+        requests=item.requests,
+        sampled=item.sampled,
+        errors=item.errors,
+        p50=latency.quantile(0.5) * 1000,
+        p95=latency.quantile(0.95) * 1000,
+        p99=latency.quantile(0.99) * 1000,
+        max_time=latency.max * 1000,
+        avg_queries=item.queries / item.query_weight if item.query_weight else None,
+        avg_db_time=item.db_time / item.query_weight * 1000 if item.query_weight else None,
+        latency_histogram=latency.to_dict(),
+    )
+
+
+SUMMARY_FIELDS = (
+    'requests', 'sampled', 'errors', 'p50', 'p95', 'p99', 'max_time',
+    'avg_queries', 'avg_db_time', 'latency_histogram',
+)
+
+
+def store_performance_summary(stats, batch_size=500):
+    """
+    Записывает строки сводки (представление, час) из stats поверх существующих.
+    Остальные строки не трогаются, поэтому сводка переживает удаление старых логов.
+    Строка, в которой записей больше, чем в новой статистике, не заменяется:
+    значит, часть файлов этого часа уже удалена и новая статистика неполная.
+    Повторный разбор тех же файлов дает столько же записей и перезаписывает строку.
+    Возвращает число записанных строк.
+    """
+    if not stats:
+        return 0
+    hours = {key: datetime.strptime(key, HOUR_FORMAT).replace(tzinfo=dt_timezone.utc) for _, key in stats}
+    with transaction.atomic():
+        stored = dict(
+            ((view_name, hour), sampled)
+            for view_name, hour, sampled in PerformanceSummary.objects.filter(
+                hour__gte=min(hours.values()), hour__lte=max(hours.values())
+            ).values_list('view_name', 'hour', 'sampled')
+        )
+        rows = [
+            _summary(view_name, hours[key], item) for (view_name, key), item in stats.items()
+            if stored.get((view_name[:200], hours[key]), 0) <= item.sampled
+        ]
+        PerformanceSummary.objects.bulk_create(
+            rows,
+            batch_size=batch_size,
+            update_conflicts=True,
+            unique_fields=['view_name', 'hour'],
+            update_fields=SUMMARY_FIELDS,
+        )
+    return len(rows)
+
+
+def _merge(rows):
+    latency = Histogram()
+    requests = errors = 0.0
+    for row in rows:
+        latency.merge(Histogram().load(row.latency_histogram))
+        requests += row.requests
+        errors += row.errors
+    return {
+        'requests': requests,
+        'error_percent': errors / requests * 100 if requests else 0,
+        'p50': latency.quantile(0.5) * 1000,
+        'p95': latency.quantile(0.95) * 1000,
+        'p99': latency.quantile(0.99) * 1000,
+    }
+
+
+def compare_periods(days=7, now=None):
+    """
+    Статистика представлений за последние days дней и изменение p95
+    относительно предыдущего периода такой же длины. Квантили периода
+    считаются по объединенным часовым гистограммам, а не усреднением часовых квантилей.
+    Отсортировано по росту p95 - сверху представления, которые стали медленнее.
+    """
+    now = now or timezone.now()
+    start = now - timedelta(days=days)
+    previous_start = start - timedelta(days=days)
+    current, previous = {}, {}
+    for row in PerformanceSummary.objects.filter(hour__gte=previous_start, hour__lt=now):
+        (current if row.hour >= start else previous).setdefault(row.view_name, []).append(row)
+
+    result = []
+    for view_name, rows in current.items():
+        item = _merge(rows)
+        item['view_name'] = view_name
+        item['previous_p95'] = _merge(previous[view_name])['p95'] if view_name in previous else None
+        if item['previous_p95']:
+            item['p95_change'] = (item['p95'] - item['previous_p95']) / item['previous_p95'] * 100
+        else:
+            item['p95_change'] = None
+        result.append(item)
+    result.sort(key=lambda item: (item['p95_change'] is None, -(item['p95_change'] or 0), item['view_name']))
+    return result
+
+
+def p95_series(view_names, days=7, now=None):
+    """
+    Ряды p95 (мс) по дням для графика: {представление: [(дата, p95), ...]}
+    """
+    now = now or timezone.now()
+    days_rows = {}
+    rows = PerformanceSummary.objects.filter(
+        view_name__in=view_names,
+        hour__gte=now - timedelta(days=days),
+        hour__lt=now,
+    ).order_by('hour')
+    for row in rows:
+        day = timezone.localtime(row.hour).date()
+        days_rows.setdefault(row.view_name, {}).setdefault(day, []).append(row)
+    return {
+        view_name: [(day.isoformat(), _merge(day_rows)['p95']) for day, day_rows in sorted(by_day.items())]
+        for view_name, by_day in days_rows.items()
+    }
@@ -0,0 +1,224 @@
+from collections import defaultdict
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, DurationField, ExpressionWrapper, F, Sum
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+from users.models import CustomUser
+
+from .caching import bump_cache_generation
+from .models import Application, DailyAppUsage, UserActivity
+
+
+def activity_seconds(activity):
+    """
+    Длительность активности в секундах (duration или разница начала и конца)
+    """
+    if activity.duration:
+        return activity.duration.total_seconds()
+    if activity.start_time and activity.end_time:
+        return (activity.end_time - activity.start_time).total_seconds()
+    return 0
+
+
+def usage_key(activity):
+    """
+    Ключ дневной сводки: (пользователь, приложение, локальная дата начала)
+    """
+    return (
+        activity.user_id,
+        activity.application_id,
+        timezone.localtime(activity.start_time).date(),
+    )
+
+
+def duration_expression():
+    return Coalesce(
+        'duration',
+        ExpressionWrapper(F('end_time') - F('start_time'), output_field=DurationField()),
+    )
+
+
+def _upsert_delta_postgresql(user_id, application_id, date, seconds, keystrokes, sessions):
+    """
+    Инкремент сводки одним INSERT ... ON CONFLICT вместо UPDATE и повторной попытки
+    """
+    table = connection.ops.quote_name(DailyAppUsage._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO {table}
+                (user_id, application_id, date, total_seconds, keystrokes, session_count, updated_at)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+            ON CONFLICT (user_id, application_id, date) DO UPDATE SET
+                total_seconds = {table}.total_seconds + EXCLUDED.total_seconds,
+                keystrokes = {table}.keystrokes + EXCLUDED.keystrokes,
+                session_count = {table}.session_count + EXCLUDED.session_count,
+                updated_at = EXCLUDED.updated_at
+            """,
+            [user_id, application_id, date, seconds, keystrokes, sessions, timezone.now()],
+        )
+
+
+def _apply_delta(user_id, application_id, date, seconds, keystrokes, sessions):
+    if connection.vendor == 'postgresql':
+        _upsert_delta_postgresql(user_id, application_id, date, seconds, keystrokes, sessions)
+        return
+
+    lookup = {'user_id': user_id, 'application_id': application_id, 'date': date}
+    changes = {
+        'total_seconds': F('total_seconds') + seconds,
+        'keystrokes': F('keystrokes') + keystrokes,
+        'session_count': F('session_count') + sessions,
+        'updated_at': timezone.now(),
+    }
+    if DailyAppUsage.objects.filter(**lookup).update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            DailyAppUsage.objects.create(
+                total_seconds=seconds,
+                keystrokes=keystrokes,
+                session_count=sessions,
+                **lookup
+            )
+    except IntegrityError:
+        # Строку успел создать параллельный запрос
+        DailyAppUsage.objects.filter(**lookup).update(**changes)
+
+
+def add_activities(activities):
+    """
+    Инкрементально добавляет новые активности в дневную сводку.
+    Одна операция на каждую пару (приложение, день), а не на каждую активность.
+    """
+    deltas = defaultdict(lambda: [0.0, 0, 0])
+    for activity in activities:
+        delta = deltas[usage_key(activity)]
+        delta[0] += activity_seconds(activity)
+        delta[1] += activity.keyboard_presses or 0
+        delta[2] += 1
+
+    for (user_id, application_id, date), (seconds, keystrokes, sessions) in deltas.items():
+        _apply_delta(user_id, application_id, date, seconds, keystrokes, sessions)
+
+
+def _aggregate_activities(activities):
+    return activities.annotate(
+        day=TruncDate('start_time')
+    ).values('user_id', 'application_id', 'day').annotate(
+        total=Sum(duration_expression()),
+        keystrokes=Sum('keyboard_presses'),
+        sessions=Count('id'),
+    ).order_by()
+
+
+def _usage_from_row(row):
+    total = row['total']
+    return DailyAppUsage(
+        user_id=row['user_id'],
+        application_id=row['application_id'],
+        date=row['day'],
+        total_seconds=total.total_seconds() if total else 0,
+        keystrokes=row['keystrokes'] or 0,
+        session_count=row['sessions'],
+    )
+
+
+def refresh_daily_usage(keys):
+    """
+    Пересчитывает строки сводки по сырым активностям (после изменения или удаления)
+    """
+    for user_id, application_id, date in keys:
+        with transaction.atomic():
+            DailyAppUsage.objects.filter(
+                user_id=user_id, application_id=application_id, date=date
+            ).delete()
+            rows = _aggregate_activities(UserActivity.objects.filter(
+                user_id=user_id, application_id=application_id, start_time__date=date
+            ))
+            DailyAppUsage.objects.bulk_create([_usage_from_row(row) for row in rows])
+
+
+def rebuild_daily_usage(user=None, date_from=None, date_to=None, batch_size=1000):
+    """
+    Полностью перестраивает сводку за период (или за все время)
+    и сбрасывает кэш затронутых пользователей.
+    Возвращает количество созданных строк.
+    """
+    activities = UserActivity.objects.all()
+    usage = DailyAppUsage.objects.all()
+    if user is not None:
+        activities = activities.filter(user=user)
+        usage = usage.filter(user=user)
+    if date_from is not None:
+        activities = activities.filter(start_time__date__gte=date_from)
+        usage = usage.filter(date__gte=date_from)
+    if date_to is not None:
+        activities = activities.filter(start_time__date__lte=date_to)
+        usage = usage.filter(date__lte=date_to)
+
+    created = 0
+    with transaction.atomic():
+        usage.delete()
+        batch = []
+        for row in _aggregate_activities(activities).iterator(chunk_size=batch_size):
+            batch.append(_usage_from_row(row))
+            if len(batch) >= batch_size:
+                DailyAppUsage.objects.bulk_create(batch)
+                created += len(batch)
+                batch = []
+        if batch:
+            DailyAppUsage.objects.bulk_create(batch)
+            created += len(batch)
+
+    # Закэшированная статистика строилась по прежней сводке
+    user_ids = [user.pk] if user is not None else CustomUser.objects.values_list('pk', flat=True)
+    for user_id in user_ids:
+        bump_cache_generation(user_id)
+    return created
+
+
+def usage_queryset(user, date_from, date_to):
+    return DailyAppUsage.objects.filter(user=user, date__gte=date_from, date__lte=date_to)
+
+
+def usage_totals(user, date_from, date_to):
+    """
+    Суммарные показатели пользователя за период
+    """
+    totals = usage_queryset(user, date_from, date_to).aggregate(
+        total_seconds=Sum('total_seconds'),
+        keystrokes=Sum('keystrokes'),
+        sessions=Sum('session_count'),
+    )
+    return {
+        'total_seconds': totals['total_seconds'] or 0,
+        'keystrokes': totals['keystrokes'] or 0,
+        'sessions': totals['sessions'] or 0,
+    }
+
+
+def usage_by_day(user, date_from, date_to):
+    """
+    Словарь {дата: секунды} за период
+    """
+    rows = usage_queryset(user, date_from, date_to).values('date').annotate(
+        seconds=Sum('total_seconds')
+    ).order_by()
+    return {row['date']: row['seconds'] or 0 for row in rows}
+
+
+def applications_with_usage(user, date_from, date_to):
+    """
+    Приложения пользователя за период с аннотациями total_seconds, keystrokes и sessions
+    """
+    return Application.objects.filter(
+        daily_usage__user=user,
+        daily_usage__date__gte=date_from,
+        daily_usage__date__lte=date_to,
+    ).annotate(
+        total_seconds=Sum('daily_usage__total_seconds'),
+        keystrokes=Sum('daily_usage__keystrokes'),
+        sessions=Sum('daily_usage__session_count'),
+    ).order_by('-total_seconds')
@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Application, UserActivity, KeyboardActivity, TimeLog
+from .models import Application, UserActivity, KeyboardActivity, KeyboardActivityBucket, TimeLog
 
 class ApplicationSerializer(serializers.ModelSerializer):
     class Meta:
@@ -31,6 +31,12 @@ class KeyboardActivitySerializer(serializers.ModelSerializer):
         fields = ('id', 'user', 'timestamp', 'key_pressed', 'application')
         read_only_fields = ('id', 'user')
 
+class KeyboardActivityBucketSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = KeyboardActivityBucket
+        fields = ('id', 'application', 'minute', 'key_count', 'key_histogram')
+        read_only_fields = fields
+
 class TimeLogSerializer(serializers.ModelSerializer):
     duration = serializers.SerializerMethodField()
 
@@ -0,0 +1,13 @@
+from django.db import transaction
+
+from .caching import invalidate_application_map
+
+
+def application_changed(sender, instance, **kwargs):
+    """
+    Сбрасывает кэш process_name -> ID приложений пользователя при любом сохранении
+    или удалении приложения, в том числе из админки и каскадом при удалении пользователя.
+    Сброс выполняется после фиксации транзакции, чтобы кэш не заполнился старыми данными
+    """
+    if instance.user_id is not None:
+        transaction.on_commit(lambda: invalidate_application_map(instance.user_id))
@@ -0,0 +1,38 @@
+from django.conf import settings
+
+JOURNAL_MODES = {'DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF'}
+SYNCHRONOUS_MODES = {'OFF', 'NORMAL', 'FULL', 'EXTRA'}
+
+
+def sqlite_pragmas():
+    """
+    PRAGMA для нового соединения SQLite.
+    WAL позволяет читать во время записи, но меняет сам файл базы, поэтому
+    journal_mode задается только при явном SQLITE_JOURNAL_MODE.
+    synchronous=NORMAL в режиме WAL синхронизирует диск только на контрольных
+    точках, busy_timeout заставляет писателя ждать блокировку вместо ошибки
+    "database is locked".
+    """
+    pragmas = []
+    if settings.SQLITE_JOURNAL_MODE in JOURNAL_MODES:
+        pragmas.append(f'PRAGMA journal_mode={settings.SQLITE_JOURNAL_MODE}')
+    if settings.SQLITE_SYNCHRONOUS in SYNCHRONOUS_MODES:
+        pragmas.append(f'PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}')
+    pragmas += [
+        f'PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT)}',
+        f'PRAGMA cache_size={int(settings.SQLITE_CACHE_SIZE)}',
+        f'PRAGMA mmap_size={int(settings.SQLITE_MMAP_SIZE)}',
+        'PRAGMA temp_store=MEMORY',
+    ]
+    return pragmas
+
+
+def configure_sqlite_connection(sender, connection, **kwargs):
+    """
+    Обработчик сигнала connection_created: настраивает каждое новое соединение SQLite
+    """
+    if connection.vendor != 'sqlite' or not settings.SQLITE_TUNING:
+        return
+    with connection.cursor() as cursor:
+        for pragma in sqlite_pragmas():
+            cursor.execute(pragma)
@@ -1,3 +1,884 @@
-from django.test import TestCase
+import gzip
+import importlib
+import importlib.util
+import json
+import os
+import sys
+import tempfile
+import threading
+from datetime import datetime, timedelta, timezone as dt_timezone
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from admin_panel import logfiles
+from users.models import CustomUser
+
+from . import caching
+from .alerts import AlertDispatcher, TokenBucket
+from .batching import IngestWriteBatcher, _IngestJob
+from .exceptions import IngestUnavailable
+from .exports import COLUMNS
+from .ingest import parse_activity_item
+from .keyboard import compact_keyboard_activity, merge_into_buckets
+from .metrics import CountHistogram, Histogram, prometheus_text
+from .middleware import QueryTimer
+from .models import (
+    Application, DailyAppUsage, KeyboardActivity, KeyboardActivityBucket, PerformanceSummary, UserActivity,
+)
+from .performance_log import aggregate_performance_log, collect_performance_log, store_performance_summary
+
+
+def _aware(*args):
+    return timezone.make_aware(datetime(*args))
+
+
+class TrackingTestCase(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='tester', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.app = Application.objects.create(user=self.user, name='Editor', process_name='editor.exe')
+
+
+class BulkIngestTests(TrackingTestCase):
+    url = reverse('useractivity-bulk')
+
+    def test_json_batch_with_invalid_item_returns_207(self):
+        response = self.client.post(self.url, [
+            {
+                'process_name': 'editor.exe',
+                'start_time': '2026-01-01T10:00:00Z',
+                'end_time': '2026-01-01T10:30:00Z',
+                'keyboard_presses': 5,
+            },
+            {
+                'process_name': 'editor.exe',
+                'start_time': '2026-01-01T11:00:00Z',
+                'end_time': '2026-01-01T10:00:00Z',
+            },
+        ], format='json')
+
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual(response.data['failed'], 1)
+        self.assertEqual([result['status'] for result in response.data['results']], ['created', 'error'])
+        self.assertEqual(UserActivity.objects.filter(user=self.user).count(), 1)
+
+    def test_gzipped_columnar_batch_returns_201(self):
+        start = _aware(2026, 1, 1, 10).timestamp()
+        batch = {
+            'format': 'columnar',
+            'apps': ['editor.exe', 'browser.exe'],
+            'app': [0, 1, 0],
+            'start': [start, start + 600, start + 1200],
+            'duration': [600, 600, 300],
+            'keystrokes': [10, 0, 3],
+        }
+        response = self.client.post(
+            self.url,
+            gzip.compress(json.dumps(batch).encode('utf-8')),
+            content_type='application/json',
+            HTTP_CONTENT_ENCODING='gzip',
+        )
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], 3)
+        activities = UserActivity.objects.filter(user=self.user).order_by('start_time')
+        self.assertEqual([activity.application.process_name for activity in activities],
+                         ['editor.exe', 'browser.exe', 'editor.exe'])
+        self.assertEqual(activities[2].duration, timedelta(seconds=300))
+
+    def test_columnar_overflow_is_rejected_per_item(self):
+        # Последняя секунда 9999 года: start + duration выходит за пределы datetime
+        response = self.client.post(self.url, {
+            'format': 'columnar',
+            'apps': ['editor.exe'],
+            'app': [0, 0, 0],
+            'start': [_aware(2026, 1, 1, 10).timestamp(), 253402300799, 1e20],
+            'duration': [60, 3600, 60],
+        }, format='json')
+
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual([result['status'] for result in response.data['results']], ['created', 'error', 'error'])
+
+    def test_malformed_columnar_batch_is_rejected_as_format_error(self):
+        # Отдельный код ошибки: клиент переходит на JSON только из-за формата, а не из-за записей
+        response = self.client.post(self.url, {
+            'format': 'columnar',
+            'apps': ['editor.exe'],
+            'app': [0, 0],
+            'start': [_aware(2026, 1, 1, 10).timestamp()],
+            'duration': [60, 60],
+        }, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['code'], 'invalid_activity_format')
+        self.assertNotIn('results', response.data)
+
+
+@override_settings(MAX_DECOMPRESSED_REQUEST_SIZE=1024)
+class RequestDecompressionTests(TrackingTestCase):
+    url = reverse('useractivity-bulk')
+
+    def post(self, body, encoding='gzip'):
+        return self.client.post(self.url, body, content_type='application/json', HTTP_CONTENT_ENCODING=encoding)
+
+    def test_oversized_body_is_rejected(self):
+        response = self.post(gzip.compress(b'[' + b' ' * 4096 + b']'))
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(response.json()['code'], 'request_too_large')
+
+    def test_malformed_gzip_is_rejected(self):
+        response = self.post(b'not gzip at all')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['code'], 'invalid_content_encoding')
+
+    def test_truncated_gzip_is_rejected(self):
+        response = self.post(gzip.compress(b'[]' * 100)[:-10])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['code'], 'invalid_content_encoding')
+
+
+class KeysetPaginationTests(TrackingTestCase):
+    def test_cursor_is_stable_when_new_rows_arrive(self):
+        start = _aware(2026, 1, 1, 10)
+        # Одинаковое время начала: порядок внутри группы задает id
+        for minutes in (0, 0, 0, 10, 10, 20):
+            UserActivity.objects.create(
+                user=self.user,
+                application=self.app,
+                start_time=start + timedelta(minutes=minutes),
+                end_time=start + timedelta(minutes=minutes + 5),
+            )
+        expected = list(UserActivity.objects.order_by('-start_time', '-pk').values_list('pk', flat=True))
+
+        seen = []
+        url = reverse('useractivity-list') + '?page_size=2'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data['count'], len(expected) + (len(seen) >= 2))
+            seen.extend(item['id'] for item in response.data['results'])
+            url = response.data['next']
+            if len(seen) == 2:
+                # Новая запись в начале списка не сдвигает следующие страницы
+                UserActivity.objects.create(
+                    user=self.user,
+                    application=self.app,
+                    start_time=start + timedelta(hours=1),
+                    end_time=start + timedelta(hours=2),
+                )
+
+        self.assertEqual(seen, expected)
+
+    def test_invalid_cursor_returns_400(self):
+        response = self.client.get(reverse('useractivity-list') + '?cursor=broken')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('cursor', response.data['detail'])
+
+
+class DailyAppUsageTests(TrackingTestCase):
+    def usage(self):
+        return sorted(DailyAppUsage.objects.filter(user=self.user).values_list(
+            'application_id', 'date', 'total_seconds', 'session_count'
+        ))
+
+    def create_activity(self, start, minutes, application=None):
+        return UserActivity.objects.create(
+            user=self.user,
+            application=application or self.app,
+            start_time=start,
+            end_time=start + timedelta(minutes=minutes),
+        )
+
+    def test_rollup_follows_save_and_delete(self):
+        start = _aware(2026, 1, 1, 10)
+        first = self.create_activity(start, 30)
+        self.create_activity(start + timedelta(hours=1), 15)
+        day = timezone.localtime(start).date()
+        self.assertEqual(self.usage(), [(self.app.id, day, 2700.0, 2)])
+
+        first.start_time += timedelta(days=1)
+        first.end_time += timedelta(days=1)
+        first.save()
+        self.assertEqual(self.usage(), [
+            (self.app.id, day, 900.0, 1),
+            (self.app.id, day + timedelta(days=1), 1800.0, 1),
+        ])
+
+        first.delete()
+        self.assertEqual(self.usage(), [(self.app.id, day, 900.0, 1)])
+
+    def test_rollup_follows_queryset_update_and_delete(self):
+        other = Application.objects.create(user=self.user, name='Browser', process_name='browser.exe')
+        start = _aware(2026, 1, 1, 10)
+        self.create_activity(start, 30)
+        self.create_activity(start + timedelta(hours=1), 15)
+        day = timezone.localtime(start).date()
+
+        UserActivity.objects.filter(start_time=start).update(application=other)
+        self.assertEqual(self.usage(), [(self.app.id, day, 900.0, 1), (other.id, day, 1800.0, 1)])
+
+        UserActivity.objects.filter(application=self.app).delete()
+        self.assertEqual(self.usage(), [(other.id, day, 1800.0, 1)])
+
+
+class KeyboardBucketTests(TrackingTestCase):
+    def test_keystrokes_fold_into_minute_buckets(self):
+        minute = _aware(2026, 1, 1, 10, 0)
+        merge_into_buckets([
+            (self.user.id, self.app.id, minute + timedelta(seconds=5), 'a'),
+            (self.user.id, self.app.id, minute + timedelta(seconds=59), 'b'),
+            (self.user.id, self.app.id, minute + timedelta(seconds=65), 'a'),
+        ])
+        # Повторное слияние прибавляется к существующей сводке
+        merge_into_buckets([(self.user.id, self.app.id, minute + timedelta(seconds=30), 'a')])
+
+        buckets = list(KeyboardActivityBucket.objects.filter(user=self.user).order_by('minute'))
+        self.assertEqual([(bucket.minute, bucket.key_count) for bucket in buckets], [
+            (minute, 3),
+            (minute + timedelta(minutes=1), 1),
+        ])
+        self.assertEqual(buckets[0].key_histogram, {'a': 2, 'b': 1})
+
+    def test_compaction_moves_only_unbucketed_rows(self):
+        timestamp = timezone.now() - timedelta(days=30)
+        KeyboardActivity.objects.create(user=self.user, application=self.app, timestamp=timestamp, key_pressed='a')
+        KeyboardActivity.objects.create(
+            user=self.user, application=self.app, timestamp=timestamp, key_pressed='b', bucketed=True
+        )
+
+        self.assertEqual(compact_keyboard_activity(older_than_days=7), (1, 2))
+        self.assertFalse(KeyboardActivity.objects.exists())
+        bucket = KeyboardActivityBucket.objects.get(user=self.user)
+        self.assertEqual((bucket.key_count, bucket.key_histogram), (1, {'a': 1}))
+
+    @override_settings(KEYBOARD_STORAGE_MODE='bucketed')
+    def test_bucketed_create_keeps_created_response(self):
+        response = self.client.post(reverse('keyboardactivity-list'), {
+            'application': self.app.id,
+            'timestamp': '2026-01-01T10:00:05Z',
+            'key_pressed': 'a',
+        }, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data['id'], response.data['key_pressed']), (None, 'a'))
+        self.assertFalse(KeyboardActivity.objects.exists())
+        bucket = KeyboardActivityBucket.objects.get(user=self.user)
+        self.assertEqual((bucket.key_count, bucket.key_histogram), (1, {'a': 1}))
+
+    def test_update_and_delete_adjust_buckets(self):
+        url = reverse('keyboardactivity-list')
+        for key in 'ab':
+            response = self.client.post(url, {
+                'application': self.app.id,
+                'timestamp': '2026-01-01T10:00:05Z',
+                'key_pressed': key,
+            }, format='json')
+            self.assertEqual(response.status_code, 201)
+
+        detail = reverse('keyboardactivity-detail', args=[response.data['id']])
+        response = self.client.patch(detail, {'timestamp': '2026-01-01T10:01:05Z'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        buckets = list(KeyboardActivityBucket.objects.order_by('minute').values_list('key_count', 'key_histogram'))
+        self.assertEqual(buckets, [(1, {'a': 1}), (1, {'b': 1})])
+
+        self.assertEqual(self.client.delete(detail).status_code, 204)
+        buckets = list(KeyboardActivityBucket.objects.order_by('minute').values_list('key_count', 'key_histogram'))
+        self.assertEqual(buckets, [(1, {'a': 1})])
+
+
+def _load_desktop_module(name):
+    # Модули десктоп-клиента не входят в пакеты сервера и импортируются по пути файла;
+    # между собой они импортируются по имени, поэтому модуль регистрируется в sys.modules
+    if name not in sys.modules:
+        path = Path(settings.BASE_DIR) / 'desktop_app' / f'{name}.py'
+        spec = importlib.util.spec_from_file_location(name, path)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        spec.loader.exec_module(module)
+    return sys.modules[name]
+
+
+def _load_window_sources():
+    _load_desktop_module('process_cache')
+    return _load_desktop_module('window_sources')
+
+
+class FakeWindowSourceTests(SimpleTestCase):
+    def setUp(self):
+        self.source = _load_window_sources().FakeWindowSource()
+
+    def test_reports_only_window_changes(self):
+        self.source.switch_to('editor.exe', 'main.py')
+        self.source.switch_to('editor.exe', 'main.py')
+        self.source.switch_to('editor.exe', 'tests.py')
+
+        self.assertEqual(self.source.wait_for_change(timeout=1)['window_title'], 'main.py')
+        self.assertEqual(self.source.wait_for_change(timeout=1)['window_title'], 'tests.py')
+        self.assertIsNone(self.source.wait_for_change(timeout=0.05))
+
+    def test_stop_releases_waiter(self):
+        self.source.stop()
+        self.assertIsNone(self.source.wait_for_change(timeout=5))
+
+    def test_event_burst_is_reported_once(self):
+        window_sources = _load_window_sources()
+
+        class ManualEventSource(window_sources.EventWindowSource):
+            def _run(self):
+                pass
+
+        fake = self.source
+        source = ManualEventSource(fake.get_info)
+        fake.switch_to('editor.exe', 'main.py')
+        self.assertEqual(source.wait_for_change(timeout=1)['window_title'], 'main.py')
+
+        # Серия событий без смены окна не дает изменения, серия со сменой - одно
+        source.notify()
+        source.notify()
+        self.assertIsNone(source.wait_for_change(timeout=0.05))
+        fake.switch_to('browser.exe', 'docs')
+        source.notify()
+        source.notify()
+        self.assertEqual(source.wait_for_change(timeout=1)['app_name'], 'browser.exe')
+        self.assertIsNone(source.wait_for_change(timeout=0.05))
+
+    def test_falls_back_to_polling_when_events_unavailable(self):
+        window_sources = _load_window_sources()
+        fake = self.source
+        fake.switch_to('editor.exe', 'main.py')
+
+        with mock.patch.object(window_sources.sys, 'platform', 'linux'), \
+                mock.patch.object(window_sources, 'X11WindowSource', side_effect=OSError('no display')):
+            source = window_sources.create_window_source(fake.get_info, preferred='auto', poll_interval=0.01)
+
+        self.assertIsInstance(source, window_sources.PollingWindowSource)
+        self.assertEqual(source.wait_for_change(timeout=1)['window_title'], 'main.py')
+        self.assertIsNone(source.wait_for_change(timeout=0.05))
+        fake.switch_to('editor.exe', 'tests.py')
+        self.assertEqual(source.wait_for_change(timeout=1)['window_title'], 'tests.py')
+        source.stop()
+
+
+class ProcessNameCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.cache = _load_desktop_module('process_cache').ProcessNameCache(max_size=2)
+
+    def test_evicts_least_recently_used(self):
+        self.cache.put(1, 'one', 1.0)
+        self.cache.put(2, 'two', 2.0)
+        self.cache.put(1, 'one', 1.0)
+        self.cache.put(3, 'three', 3.0)
+
+        self.assertEqual(len(self.cache), 2)
+        self.assertEqual(list(self.cache._entries), [1, 3])
+
+    def test_reused_pid_is_looked_up_again(self):
+        pid = os.getpid()
+        self.assertEqual(self.cache.lookup(pid), self.cache.lookup(pid))
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+        # Запись с другим временем запуска - от процесса, который раньше занимал этот PID
+        self.cache.put(pid, 'stale', 0.0)
+        self.assertNotEqual(self.cache.name(pid), 'stale')
+        self.assertEqual(self.cache.misses, 2)
+
+
+def _activity_item(hour):
+    return {
+        'process_name': 'editor.exe',
+        'start_time': f'2026-01-01T{hour:02d}:00:00Z',
+        'end_time': f'2026-01-01T{hour:02d}:30:00Z',
+    }
+
+
+class IngestWriteBatcherTests(TransactionTestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='tester', password='password')
+        Application.objects.create(user=self.user, name='Editor', process_name='editor.exe')
+
+    def test_group_queries_are_reported_once(self):
+        batcher = IngestWriteBatcher()
+        jobs = [_IngestJob(self.user, [_activity_item(hour)], parse_activity_item) for hour in (10, 11)]
+        group_timer = QueryTimer(threshold=1)
+        with connection.execute_wrapper(group_timer):
+            batcher._write(jobs)
+
+        self.assertEqual([job.results[0]['status'] for job in jobs], ['created', 'created'])
+        self.assertEqual(sum(job.query_timer.count for job in jobs), group_timer.count)
+        self.assertEqual(UserActivity.objects.count(), 2)
+
+    def test_cancelled_job_is_not_written(self):
+        job = _IngestJob(self.user, [_activity_item(10)], parse_activity_item)
+        self.assertTrue(job.cancel())
+        self.assertFalse(job.start())
+
+        IngestWriteBatcher()._write([job])
+        self.assertIsNone(job.results)
+        self.assertFalse(UserActivity.objects.exists())
+
+    def test_timeout_cancels_only_queued_jobs(self):
+        writing = threading.Event()
+        release = threading.Event()
+
+        def blocking_parse(item):
+            writing.set()
+            release.wait(5)
+            return parse_activity_item(item)
+
+        batcher = IngestWriteBatcher(timeout=0.2)
+        outcome = {}
+
+        def submit_blocking():
+            outcome['first'] = batcher.submit(self.user, [_activity_item(10)], blocking_parse)
+
+        thread = threading.Thread(target=submit_blocking)
+        thread.start()
+        self.assertTrue(writing.wait(5))
+
+        # Писатель занят первым пакетом: второй отменяется по таймауту и не записывается
+        with self.assertRaises(IngestUnavailable):
+            batcher.submit(self.user, [_activity_item(11)])
+
+        # Первый пакет уже записывается, поэтому его запрос ждет результата дольше таймаута
+        release.set()
+        thread.join(5)
+        self.assertEqual(outcome['first'][0]['status'], 'created')
+        self.assertEqual(list(UserActivity.objects.values_list('start_time', flat=True)), [datetime(2026, 1, 1, 10, tzinfo=dt_timezone.utc)])
+
+
+def _performance_line(timestamp, view_name, response_time, status_code=200, **extra):
+    return json.dumps({
+        'timestamp': timestamp,
+        'view_name': view_name,
+        'response_time': response_time,
+        'status_code': status_code,
+        **extra,
+    }) + '\n'
+
+
+class PerformanceLogTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.log_path = Path(directory.name) / 'performance.log'
+        logging_settings = {'handlers': {'file_performance': {'filename': str(self.log_path)}}}
+        override = override_settings(LOGGING=logging_settings)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def write_log(self, suffix, lines):
+        path = Path(str(self.log_path) + suffix)
+        if suffix.endswith('.gz'):
+            with gzip.open(path, 'wt') as file:
+                file.writelines(lines)
+        else:
+            path.write_text(''.join(lines))
+        return str(path)
+
+    def test_aggregates_hours_in_utc_with_sample_weights(self):
+        path = self.write_log('', [
+            _performance_line('2026-01-01T10:05:00.100000+00:00', 'ActivityView', 0.1, n_queries=4, db_time=0.02),
+            _performance_line('2026-01-01T10:15:00+00:00', 'ActivityView', 0.2, sample_rate=0.5),
+            _performance_line('2026-01-01T10:25:00+00:00', 'ActivityView', 1.5, status_code=500),
+            # Старый формат: время без пояса записано в TIME_ZONE (Москва, UTC+3)
+            _performance_line('2026-01-01T13:35:00.500000', 'ActivityView', 0.3),
+            _performance_line('2026-01-01T11:00:00+00:00', 'StatisticsView', 0.05),
+        ])
+
+        stats, entries = aggregate_performance_log([path])
+
+        self.assertEqual(entries, 5)
+        self.assertEqual(set(stats), {('ActivityView', '2026-01-01T10'), ('StatisticsView', '2026-01-01T11')})
+        item = stats[('ActivityView', '2026-01-01T10')]
+        self.assertEqual((item.sampled, item.requests, item.errors), (4, 5.0, 1.0))
+        self.assertEqual((item.queries, item.query_weight), (4.0, 1.0))
+        self.assertAlmostEqual(item.latency.max, 1.5, places=2)
+
+    def test_since_skips_earlier_hours(self):
+        path = self.write_log('', [
+            _performance_line('2026-01-01T09:59:00+00:00', 'ActivityView', 0.1),
+            _performance_line('2026-01-01T10:00:00+00:00', 'ActivityView', 0.1),
+        ])
+
+        stats, entries = aggregate_performance_log([path], since=datetime(2026, 1, 1, 10, tzinfo=dt_timezone.utc))
+
+        self.assertEqual((list(stats), entries), ([('ActivityView', '2026-01-01T10')], 1))
+
+    def test_single_file_rebuilds_hours_from_all_rotated_files(self):
+        # Час 10 разбит ротацией между performance.log.1.gz и performance.log
+        self.write_log('.1.gz', [
+            _performance_line('2026-01-01T09:50:00+00:00', 'ActivityView', 0.1),
+            _performance_line('2026-01-01T10:10:00+00:00', 'ActivityView', 0.1),
+        ])
+        current = self.write_log('', [_performance_line('2026-01-01T10:40:00+00:00', 'ActivityView', 0.2)])
+
+        stats, entries = collect_performance_log([current])
+
+        self.assertEqual(entries, 1)
+        self.assertEqual(list(stats), [('ActivityView', '2026-01-01T10')])
+        self.assertEqual(stats[('ActivityView', '2026-01-01T10')].sampled, 2)
+
+    def test_store_keeps_rows_with_more_records(self):
+        path = self.write_log('', [
+            _performance_line('2026-01-01T10:10:00+00:00', 'ActivityView', 0.1),
+            _performance_line('2026-01-01T10:20:00+00:00', 'ActivityView', 0.3),
+        ])
+        stats, _ = aggregate_performance_log([path])
+        self.assertEqual(store_performance_summary(stats), 1)
+        # Повторный разбор тех же записей перезаписывает строку
+        self.assertEqual(store_performance_summary(stats), 1)
+
+        # Старую часть часа удалили вместе с файлом: неполная статистика строку не заменяет
+        self.write_log('', [_performance_line('2026-01-01T10:20:00+00:00', 'ActivityView', 0.3)])
+        partial, _ = aggregate_performance_log([path])
+        self.assertEqual(store_performance_summary(partial), 0)
+
+        row = PerformanceSummary.objects.get()
+        self.assertEqual(row.hour, datetime(2026, 1, 1, 10, tzinfo=dt_timezone.utc))
+        self.assertEqual((row.sampled, row.requests), (2, 2.0))
+
+
+class HistogramTests(SimpleTestCase):
+    def test_quantiles_within_bucket_error(self):
+        histogram = Histogram()
+        values = [index / 1000 for index in range(1, 1001)]
+        for value in values[:500]:
+            histogram.record(value)
+        histogram.record_many(values[500:])
+
+        self.assertEqual((histogram.count, histogram.max), (1000, 1.0))
+        for q in (0.5, 0.95, 0.99):
+            self.assertAlmostEqual(histogram.quantile(q), q, delta=q * 0.05)
+        self.assertEqual(histogram.quantile(1), 1.0)
+        self.assertEqual(Histogram().quantile(0.5), 0.0)
+
+    def test_merge_and_round_trip(self):
+        first, second = Histogram(), Histogram()
+        first.record_many([0.1, 0.2], weight=2)
+        second.record(0)
+        second.record(3.0)
+
+        first.merge(Histogram().load(json.loads(json.dumps(second.to_dict()))))
+
+        self.assertEqual((first.count, first.max), (6, 3.0))
+        self.assertAlmostEqual(first.sum, 3.6)
+        self.assertEqual(first.quantile(0.01), 0.0)
+
+    def test_prometheus_text_has_cumulative_buckets(self):
+        latency = Histogram()
+        latency.record_many([0.003, 0.02, 0.2, 40.0])
+        queries = CountHistogram()
+        queries.record_many([0, 3])
+        labels = (('view', 'ActivityView'), ('status', '2xx'))
+
+        text = prometheus_text({
+            ('tracker_http_request_duration_seconds', labels): latency,
+            ('tracker_db_queries_per_request', labels): queries,
+        })
+
+        self.assertIn('# TYPE tracker_http_request_duration_seconds histogram', text)
+        self.assertIn('tracker_http_request_duration_seconds_bucket{view="ActivityView",status="2xx",le="0.005"} 1', text)
+        self.assertIn('tracker_http_request_duration_seconds_bucket{view="ActivityView",status="2xx",le="0.25"} 3', text)
+        self.assertIn('tracker_http_request_duration_seconds_bucket{view="ActivityView",status="2xx",le="30.0"} 3', text)
+        self.assertIn('tracker_http_request_duration_seconds_bucket{view="ActivityView",status="2xx",le="+Inf"} 4', text)
+        self.assertIn('tracker_db_queries_per_request_bucket{view="ActivityView",status="2xx",le="2"} 1', text)
+        self.assertIn('tracker_db_queries_per_request_count{view="ActivityView",status="2xx"} 2', text)
+
+
+@override_settings(METRICS_TOKEN='secret', METRICS_ALLOWED_IPS=[])
+class MetricsAccessTests(TestCase):
+    def test_requires_token_or_staff_session(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
+
+        staff = CustomUser.objects.create_user(username='staff', password='password', is_staff=True)
+        self.client.force_login(staff)
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+    def test_ip_allowlist_is_opt_in(self):
+        with override_settings(METRICS_TOKEN=''):
+            self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='127.0.0.1').status_code, 403)
+        with override_settings(METRICS_ALLOWED_IPS=['10.0.0.5']):
+            self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.0.0.5').status_code, 200)
+
+
+class CachingTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        caching._registered_prefixes.clear()
+        self.addCleanup(cache.clear)
+        self.addCleanup(caching._registered_prefixes.clear)
+
+    def test_bump_generation_hides_old_entries(self):
+        builds = []
+
+        def builder():
+            builds.append(1)
+            return len(builds)
+
+        self.assertEqual(caching.get_or_build(1, 'stats', ['day'], builder), 1)
+        self.assertEqual(caching.get_or_build(1, 'stats', ['day'], builder), 1)
+        # Поколение другого пользователя не меняется
+        self.assertEqual(caching.get_or_build(2, 'stats', ['day'], builder), 2)
+
+        generation = caching.get_cache_generation(1)
+        self.assertEqual(caching.bump_cache_generation(1), generation + 1)
+        self.assertEqual(caching.get_or_build(1, 'stats', ['day'], builder), 3)
+        self.assertEqual(caching.get_or_build(2, 'stats', ['day'], builder), 2)
+
+    def test_lost_generation_counter_does_not_revive_old_keys(self):
+        old_key = caching.user_cache_key(1, 'stats', 'day')
+        cache.delete(caching._generation_key(1))
+        self.assertNotEqual(caching.user_cache_key(1, 'stats', 'day'), old_key)
+
+    def test_stats_are_opt_in(self):
+        caching.get_or_build(1, 'stats', ['day'], lambda: 1)
+        caching.get_or_build(1, 'stats', ['day'], lambda: 1)
+        self.assertEqual(caching.cache_stats(), {})
+
+    @override_settings(CACHE_STATS_ENABLED=True)
+    def test_stats_count_hits_misses_and_evictions(self):
+        caching.get_or_build(1, 'stats', ['day'], lambda: 1)
+        caching.get_or_build(1, 'stats', ['day'], lambda: 1)
+        cache.delete(caching.user_cache_key(1, 'stats', 'day'))
+        caching.get_or_build(1, 'stats', ['day'], lambda: 1)
+        caching.get_or_build(1, 'timeline', ['day'], lambda: 1)
+
+        stats = caching.cache_stats()
+        self.assertEqual(list(stats), ['stats', 'timeline'])
+        self.assertEqual(
+            (stats['stats']['hits'], stats['stats']['misses'], stats['stats']['evictions'], stats['stats']['hit_rate']),
+            (1, 2, 1, 33.3),
+        )
+
+        caching.reset_cache_stats()
+        self.assertEqual(caching.cache_stats()['stats']['misses'], 0)
+
+    def test_prefix_registered_once_across_processes(self):
+        caching._register_prefix('stats')
+        # Другой процесс не знает о регистрации, но cache.add не даст записать префикс дважды
+        caching._registered_prefixes.clear()
+        caching._register_prefix('stats')
+        caching._register_prefix('timeline')
+
+        self.assertEqual(cache.get(caching.STATS_PREFIX_COUNT_KEY), 2)
+        self.assertEqual(caching._stats_prefixes(), ['stats', 'timeline'])
+
+
+@override_settings(EXPORT_CHUNK_SIZE=2)
+class ExportStatisticsTests(TrackingTestCase):
+    url = reverse('export-statistics-api')
+
+    def setUp(self):
+        super().setUp()
+        start = _aware(2026, 1, 1, 10)
+        for minutes in (0, 10, 20):
+            UserActivity.objects.create(
+                user=self.user,
+                application=self.app,
+                start_time=start + timedelta(minutes=minutes),
+                end_time=start + timedelta(minutes=minutes + 5),
+                keyboard_presses=minutes,
+            )
+        # Вне периода
+        UserActivity.objects.create(
+            user=self.user,
+            application=self.app,
+            start_time=_aware(2026, 1, 3, 10),
+            end_time=_aware(2026, 1, 3, 11),
+        )
+
+    def export(self, **params):
+        response = self.client.get(self.url, {'date_from': '2026-01-01', 'date_to': '2026-01-02', **params})
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content)
+
+    def test_csv_is_streamed_in_chunks(self):
+        response, body = self.export()
+
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn('activity_report_2026-01-01_2026-01-02.csv"', response['Content-Disposition'])
+        lines = body.decode('utf-8-sig').splitlines()
+        self.assertEqual(len(lines), 4)
+        self.assertEqual([line.split(';')[3:6] for line in lines[1:]], [['0:05:00', 'Editor', 'editor.exe']] * 3)
+
+    def test_gzipped_columnar_export(self):
+        response, body = self.export(output='columnar', compress='gzip')
+
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertTrue(response['Content-Disposition'].endswith('.columnar.ndjson.gz"'))
+        lines = [json.loads(line) for line in gzip.decompress(body).decode('utf-8').splitlines()]
+        self.assertEqual(lines[0], {'columns': list(COLUMNS)})
+        # Группы строк по EXPORT_CHUNK_SIZE
+        self.assertEqual([line['rows'] for line in lines[1:]], [2, 1])
+        self.assertEqual(lines[1]['data']['keyboard_presses'], [0, 10])
+        self.assertEqual(lines[2]['data']['duration_seconds'], [300.0])
+
+    def test_ndjson_export(self):
+        _, body = self.export(output='ndjson')
+
+        records = [json.loads(line) for line in body.decode('utf-8').splitlines()]
+        self.assertEqual([record['keyboard_presses'] for record in records], [0, 10, 20])
+        self.assertEqual(records[0]['process_name'], 'editor.exe')
+
+    def test_unknown_format_is_rejected(self):
+        response = self.client.get(self.url, {'output': 'xlsx'})
+        self.assertEqual(response.status_code, 400)
+
+
+class QueryTimerTests(SimpleTestCase):
+    def run_queries(self, timer, durations):
+        # perf_counter вызывается до и после каждого запроса
+        ticks = []
+        for index, duration in enumerate(durations):
+            ticks += [index * 10.0, index * 10.0 + duration]
+        with mock.patch('tracking.middleware.time.perf_counter', side_effect=ticks):
+            for index, _ in enumerate(durations):
+                timer(lambda *args: 'result', f'SELECT {index}', None, False, {})
+
+    def test_keeps_only_top_n_slow_queries(self):
+        timer = QueryTimer(threshold=0.1, top_n=2)
+        self.run_queries(timer, [0.05, 0.3, 0.2, 0.5, 0.15])
+
+        self.assertEqual((timer.count, timer.slow_count), (5, 4))
+        self.assertAlmostEqual(timer.total_time, 1.2)
+        self.assertEqual([query['sql'] for query in timer.slow_queries], ['SELECT 3', 'SELECT 1'])
+
+    def test_merge_combines_counters_and_slowest(self):
+        first, second = QueryTimer(threshold=0.1, top_n=2), QueryTimer(threshold=0.1, top_n=2)
+        self.run_queries(first, [0.2, 0.01])
+        self.run_queries(second, [0.4, 0.3, 0.02])
+
+        first.merge(second)
+
+        self.assertEqual((first.count, first.slow_count), (5, 3))
+        self.assertAlmostEqual(first.total_time, 0.93)
+        self.assertEqual([round(query['time'], 6) for query in first.slow_queries], [0.4, 0.3])
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class AlertDispatcherTests(SimpleTestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.sent = []
+        self.dispatcher = AlertDispatcher(
+            send=lambda message, level, channels: self.sent.append((message, level, channels)),
+            dedup_window=300,
+            rate_per_minute=6,
+            burst=2,
+            clock=self.clock,
+        )
+
+    def test_token_bucket_refills_at_rate(self):
+        bucket = TokenBucket(rate=0.5, capacity=2, clock=self.clock)
+        self.assertEqual([bucket.consume() for _ in range(3)], [True, True, False])
+        self.clock.now = 1.0
+        self.assertFalse(bucket.consume())
+        self.clock.now = 2.0
+        self.assertTrue(bucket.consume())
+        # Простой не копит токенов больше capacity
+        self.clock.now = 100.0
+        self.assertEqual([bucket.consume() for _ in range(3)], [True, True, False])
+
+    def test_same_signature_sent_once_per_window(self):
+        for _ in range(3):
+            self.dispatcher.process('error:Timeout', 'Timeout', 'ERROR')
+        self.assertEqual(len(self.sent), 1)
+
+        self.clock.now = 301.0
+        self.dispatcher.process('error:Timeout', 'Timeout again', 'ERROR')
+        self.assertEqual([message for message, _, _ in self.sent], ['Timeout', 'Timeout again'])
+
+    def test_rate_limited_alerts_go_to_digest(self):
+        for index in range(4):
+            self.dispatcher.process(f'error:{index}', f'Error {index}', 'WARNING' if index < 3 else 'CRITICAL', ['slack'])
+        self.dispatcher.process('error:0', 'Error 0 repeated', 'WARNING')
+        self.assertEqual(len(self.sent), 2)
+
+        self.dispatcher.dropped = 5
+        self.dispatcher.flush_digest()
+
+        message, level, channels = self.sent[-1]
+        self.assertEqual(level, 'CRITICAL')
+        self.assertEqual(channels, ['email', 'slack'])
+        self.assertTrue(message.startswith('Alert digest: 3 suppressed alerts'))
+        self.assertIn('- error:0 x1: Error 0 repeated', message)
+        self.assertIn('Dropped on full queue: 5', message)
+
+        # Пустая сводка не отправляется
+        self.dispatcher.flush_digest()
+        self.assertEqual(len(self.sent), 3)
+
+
+class LogFileTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = Path(directory.name) / 'app.log'
+        self.lines = [f'INFO line {index}' for index in range(50)] + ['ERROR Ошибка записи', 'INFO последняя']
+        self.path.write_bytes(('\n'.join(self.lines) + '\n').encode('utf-8'))
+
+    def test_tail_reads_last_lines_from_small_blocks(self):
+        lines, start, end = logfiles.tail(self.path, max_lines=3, block_size=16)
+
+        self.assertEqual(lines, self.lines[-3:])
+        self.assertEqual(end, self.path.stat().st_size)
+        self.assertEqual(self.path.read_bytes()[start:end].decode('utf-8').splitlines(), self.lines[-3:])
+
+        # Следующая страница - строки до начала предыдущей
+        previous, _, previous_end = logfiles.tail(self.path, max_lines=2, end=start, block_size=16)
+        self.assertEqual((previous, previous_end), (self.lines[-5:-3], start))
+
+    def test_search_is_caseless_for_cyrillic_and_resumable(self):
+        matches, position = logfiles.search(self.path, logfiles.compile_pattern('ОШИБКА', ignore_case=True))
+        self.assertEqual(([text for _, _, text in matches], position), (['ERROR Ошибка записи'], None))
+
+        pattern = logfiles.compile_pattern(r'^INFO line 1\d$', regex=True)
+        first, position = logfiles.search(self.path, pattern, max_matches=4)
+        rest, end = logfiles.search(self.path, pattern, start=position)
+        self.assertEqual([text for _, _, text in first + rest], [f'INFO line {index}' for index in range(10, 20)])
+        self.assertIsNone(end)
+
+    def test_read_from_returns_only_complete_new_lines(self):
+        size = self.path.stat().st_size
+        with open(self.path, 'ab') as file:
+            file.write(b'INFO new\nINFO partial')
+
+        text, offset = logfiles.read_from(self.path, size)
+        self.assertEqual((text, offset), ('INFO new\n', size + len(b'INFO new\n')))
+        # После ротации файл короче смещения - чтение с начала
+        self.path.write_bytes(b'INFO rotated\n')
+        self.assertEqual(logfiles.read_from(self.path, offset), ('INFO rotated\n', 13))
+
+
+class NormalizeApplicationNamesMigrationTests(TrackingTestCase):
+    migration = importlib.import_module('tracking.migrations.0009_normalize_application_names')
+
+    def test_renames_only_known_processes(self):
+        chrome = Application.objects.create(user=self.user, name='chrome', process_name='Chrome.EXE')
+        custom = Application.objects.create(user=self.user, name='Мой редактор', process_name='myeditor.exe')
+
+        self.migration.normalize_application_names(apps, None)
+
+        chrome.refresh_from_db()
+        custom.refresh_from_db()
+        self.assertEqual((chrome.name, custom.name), ('Google Chrome', 'Мой редактор'))
@@ -0,0 +1,78 @@
+from datetime import timedelta
+
+from django.db.models import Sum
+from django.db.models.functions import TruncDate, TruncHour
+from django.utils import timezone
+
+from .rollups import duration_expression, usage_by_day
+
+
+def _bucket_seconds(activities, trunc):
+    rows = activities.annotate(
+        bucket=trunc('start_time')
+    ).values('bucket').annotate(
+        total=Sum(duration_expression())
+    ).order_by()
+    return {
+        row['bucket']: row['total'].total_seconds() if row['total'] else 0
+        for row in rows
+    }
+
+
+def seconds_by_hour(activities):
+    """
+    Словарь {час (0-23): секунды} одним сгруппированным запросом.
+    Часы берутся в текущем часовом поясе по времени начала активности.
+    """
+    result = {}
+    for bucket, seconds in _bucket_seconds(activities, TruncHour).items():
+        if timezone.is_aware(bucket):
+            bucket = timezone.localtime(bucket)
+        result[bucket.hour] = result.get(bucket.hour, 0) + seconds
+    return result
+
+
+def seconds_by_day(activities):
+    """
+    Словарь {дата: секунды} по сырым активностям одним сгруппированным запросом
+    """
+    return _bucket_seconds(activities, TruncDate)
+
+
+def hour_series(seconds):
+    """
+    Плотный ряд из 24 часов: [{'hour', 'minutes', 'seconds'}, ...]
+    """
+    return [
+        {
+            'hour': hour,
+            'minutes': round(seconds.get(hour, 0) / 60, 0),
+            'seconds': seconds.get(hour, 0),
+        }
+        for hour in range(24)
+    ]
+
+
+def day_series(date_from, date_to, seconds):
+    """
+    Плотный ряд дней за период: [(дата, секунды), ...], пропущенные дни заполняются нулями
+    """
+    days = (date_to - date_from).days + 1
+    return [
+        (date_from + timedelta(days=offset), seconds.get(date_from + timedelta(days=offset), 0))
+        for offset in range(max(days, 0))
+    ]
+
+
+def user_hour_series(activities, day):
+    """
+    Почасовая активность за день одним запросом вместо запроса на каждый час
+    """
+    return hour_series(seconds_by_hour(activities.filter(start_time__date=day)))
+
+
+def user_day_series(user, date_from, date_to):
+    """
+    Дневной ряд пользователя по сводке DailyAppUsage
+    """
+    return day_series(date_from, date_to, usage_by_day(user, date_from, date_to))
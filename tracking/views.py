@@ -1,25 +1,30 @@
-from django.shortcuts import render, get_object_or_404, redirect
+from django.shortcuts import redirect
 from rest_framework import generics, permissions, status, viewsets
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from django.utils import timezone
-from datetime import timedelta, datetime, time
-from .models import Application, UserActivity, KeyboardActivity, TimeLog
+from datetime import timedelta, datetime
+from django.http import HttpResponse, HttpResponseForbidden, StreamingHttpResponse
+from django.utils.http import parse_etags, quote_etag
+import hashlib
+import hmac
+import json
+import logging
+from .models import Application, UserActivity, KeyboardActivity, KeyboardActivityBucket, TimeLog
 from .serializers import (
     ApplicationSerializer, 
     UserActivitySerializer, 
     KeyboardActivitySerializer,
+    KeyboardActivityBucketSerializer,
     TimeLogSerializer
 )
-from django.views.generic import TemplateView, ListView, CreateView, UpdateView, DeleteView
+from django.views.generic import View, TemplateView, ListView, CreateView, UpdateView, DeleteView
 from django.contrib.auth.mixins import LoginRequiredMixin
 from rest_framework.decorators import action
 from django.urls import reverse_lazy
 from django.contrib import messages
-from django.db.models import Sum, Count, ExpressionWrapper, F, DurationField
-from django.core.cache import cache
-from django.views.decorators.cache import cache_page
-from django.db import models
+from django.views.decorators.cache import never_cache
+from django.db import transaction
 from django.utils.decorators import method_decorator
 from django.conf import settings
 from .exceptions import (
@@ -27,59 +32,48 @@ from .exceptions import (
     InvalidTimeRange,
     ApplicationNotFound,
     UserActivityNotFound,
-    InvalidActivityData
+    InvalidActivityData,
+    InvalidActivityFormat
 )
 from rest_framework.exceptions import ValidationError
+from .ingest import (
+    ActivityItemError,
+    application_map,
+    columnar_rows,
+    parse_activity_item,
+    parse_columnar_row,
+    resolve_application_id,
+    resolve_process_names,
+)
+from .pagination import (
+    ActivityCursorPagination,
+    KeyboardActivityCursorPagination,
+    KeyboardBucketCursorPagination,
+    KeysetPaginationMixin
+)
+from .rollups import applications_with_usage, usage_by_day, usage_totals
+from .caching import bump_cache_generation, get_or_build
+from .exports import (
+    EXPORT_FORMATS,
+    columnar_stream,
+    csv_stream,
+    export_rows,
+    gzip_stream,
+    ndjson_stream
+)
+from .timeseries import day_series, user_day_series, user_hour_series
+from .keyboard import merge_into_buckets, subtract_from_buckets
+from .batching import submit_activities
+from .metrics import prometheus_text
+from .app_names import apply_display_names
+
+logger = logging.getLogger(__name__)
 
 # Create your views here.
 
 class StatisticsView(LoginRequiredMixin, TemplateView):
     template_name = 'statistics.html'
     
-    # Словарь для отображения понятных названий приложений
-    app_name_mapping = {
-        'browser.exe': 'Yandex Браузер',
-        'chrome.exe': 'Google Chrome',
-        'firefox.exe': 'Mozilla Firefox',
-        'msedge.exe': 'Microsoft Edge',
-        'opera.exe': 'Opera',
-        'safari.exe': 'Safari',
-        'brave.exe': 'Brave Browser',
-        'vivaldi.exe': 'Vivaldi',
-        'iexplore.exe': 'Internet Explorer',
-        'word.exe': 'Microsoft Word',
-        'excel.exe': 'Microsoft Excel',
-        'powerpnt.exe': 'Microsoft PowerPoint',
-        'outlook.exe': 'Microsoft Outlook',
-        'winword.exe': 'Microsoft Word',
-        'notepad.exe': 'Notepad',
-        'notepad++.exe': 'Notepad++',
-        'code.exe': 'Visual Studio Code',
-        'devenv.exe': 'Visual Studio',
-        'pycharm64.exe': 'PyCharm',
-        'idea64.exe': 'IntelliJ IDEA',
-        'photoshop.exe': 'Adobe Photoshop',
-        'illustrator.exe': 'Adobe Illustrator',
-        'acrobat.exe': 'Adobe Acrobat',
-        'acrord32.exe': 'Adobe Reader',
-        'slack.exe': 'Slack',
-        'teams.exe': 'Microsoft Teams',
-        'discord.exe': 'Discord',
-        'telegram.exe': 'Telegram',
-        'whatsapp.exe': 'WhatsApp',
-        'skype.exe': 'Skype',
-        'zoom.exe': 'Zoom',
-        'steam.exe': 'Steam',
-        'spotify.exe': 'Spotify',
-        'vlc.exe': 'VLC Media Player',
-        'wmplayer.exe': 'Windows Media Player',
-        'explorer.exe': 'Windows Explorer',
-        'cmd.exe': 'Командная строка',
-        'powershell.exe': 'PowerShell',
-        'python.exe': 'Python',
-        'javaw.exe': 'Java',
-        'node.exe': 'Node.js'
-    }
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -91,28 +85,34 @@ class StatisticsView(LoginRequiredMixin, TemplateView):
         # Получаем количество дней для статистики из параметров запроса
         days = int(self.request.GET.get('days', 7))
         today = timezone.now().date()
+        
+        # Данные кэшируются до следующей записи активностей пользователя
+        context.update(get_or_build(
+            user.id, 'statistics', (days, today),
+            lambda: self.get_statistics_data(user, days, today)
+        ))
+        
+        logger.debug(f"Statistics Timestamp: {context['timestamp']}, Time: {context['formatted_time']}, Keystrokes: {context['keyboard_activity']}")
+        
+        return context
+    
+    def get_statistics_data(self, user, days, today):
+        """
+        Собирает данные страницы статистики за период
+        """
         start_date = today - timedelta(days=days-1)  # -1 потому что сегодня тоже входит
         
-        # Получаем статистику за выбранный период - принудительно обновляем
+        # Сырые активности нужны только для списка последних записей
         activities = UserActivity.objects.filter(
             user=user,
             start_time__date__gte=start_date,
             start_time__date__lte=today
         )
         
-        # Рассчитываем общее время работы
-        total_seconds = 0
-        keyboard_activity = 0
-        
-        for activity in activities:
-            if activity.duration:
-                total_seconds += activity.duration.total_seconds()
-            elif activity.start_time and activity.end_time:
-                duration = activity.end_time - activity.start_time
-                total_seconds += duration.total_seconds()
-            
-            # Суммируем нажатия клавиш
-            keyboard_activity += activity.keyboard_presses or 0
+        # Общее время работы и нажатия клавиш берем из дневной сводки
+        totals = usage_totals(user, start_date, today)
+        total_seconds = totals['total_seconds']
+        keyboard_activity = totals['keystrokes']
         
         # Форматируем время в строку для отображения
         hours, remainder = divmod(int(total_seconds), 3600)
@@ -127,18 +127,8 @@ class StatisticsView(LoginRequiredMixin, TemplateView):
         
         average_daily_keystrokes = int(keyboard_activity / days) if days > 0 else 0
         
-        # Получаем все приложения пользователя за период - без кэширования
-        apps = Application.objects.filter(
-            useractivity__user=user,
-            useractivity__start_time__date__gte=start_date,
-            useractivity__start_time__date__lte=today
-        ).annotate(
-            total_time=Sum('useractivity__duration'),
-            total_seconds=Sum(ExpressionWrapper(
-                F('useractivity__duration'), 
-                output_field=models.IntegerField()
-            ))
-        ).order_by('-total_time').distinct()
+        # Получаем все приложения пользователя за период из дневной сводки
+        apps = applications_with_usage(user, start_date, today)
         
         # Форматируем время для каждого приложения и рассчитываем проценты
         # Общее количество секунд для всех приложений
@@ -148,17 +138,7 @@ class StatisticsView(LoginRequiredMixin, TemplateView):
         prev_start_date = start_date - timedelta(days=days)
         prev_end_date = start_date - timedelta(days=1)
         
-        previous_apps = Application.objects.filter(
-            useractivity__user=user,
-            useractivity__start_time__date__gte=prev_start_date,
-            useractivity__start_time__date__lte=prev_end_date
-        ).annotate(
-            total_time=Sum('useractivity__duration'),
-            total_seconds=Sum(ExpressionWrapper(
-                F('useractivity__duration'), 
-                output_field=models.IntegerField()
-            ))
-        )
+        previous_apps = applications_with_usage(user, prev_start_date, prev_end_date)
         
         # Создаем словарь предыдущих данных для быстрого поиска
         prev_app_data = {}
@@ -168,12 +148,7 @@ class StatisticsView(LoginRequiredMixin, TemplateView):
         
         for app in apps:
             if hasattr(app, 'total_seconds') and app.total_seconds:
-                # Преобразуем время в секунды, разделив на 1000000 если значение слишком большое
-                seconds_value = app.total_seconds
-                if seconds_value > 100000:  # Если значение слишком большое, вероятно это микросекунды
-                    seconds_value = seconds_value / 1000000
-                
-                hours, remainder = divmod(int(seconds_value), 3600)
+                hours, remainder = divmod(int(app.total_seconds), 3600)
                 minutes, seconds = divmod(remainder, 60)
                 app.formatted_time = f"{hours}:{minutes:02d}:{seconds:02d}"
                 
@@ -203,27 +178,12 @@ class StatisticsView(LoginRequiredMixin, TemplateView):
                 app.trend = 0
                 app.trend_class = 'bg-secondary'
         
-        # Обновляем названия приложений для отображения
-        for app in apps:
-            process_name = app.process_name.lower() if app.process_name else ""
-            if process_name in self.app_name_mapping:
-                app.name = self.app_name_mapping[process_name]
-                app.save()
+        # Понятные названия подставляются только для отображения, без записи в базу
+        apply_display_names(apps)
         
-        # Получаем данные по дням для графика - принудительно обновляем
+        # Получаем данные по дням для графика одним запросом к сводке
         daily_data = []
-        for i in range(days):
-            date = today - timedelta(days=days-1-i)
-            day_activities = activities.filter(start_time__date=date)
-            
-            day_seconds = 0
-            for activity in day_activities:
-                if activity.duration:
-                    day_seconds += activity.duration.total_seconds()
-                elif activity.start_time and activity.end_time:
-                    duration = activity.end_time - activity.start_time
-                    day_seconds += duration.total_seconds()
-            
+        for date, day_seconds in user_day_series(user, start_date, today):
             daily_data.append({
                 'date': date,
                 'hours': round(day_seconds / 3600, 1),
@@ -257,10 +217,10 @@ class StatisticsView(LoginRequiredMixin, TemplateView):
         productivity_percent = round((productive_seconds / all_apps_seconds) * 100) if all_apps_seconds > 0 else 0
         
         # Логируем информацию о продуктивных приложениях для отладки
-        print(f"[DEBUG] Продуктивные приложения: {len(productive_apps)}")
+        logger.debug(f"Продуктивные приложения: {len(productive_apps)}")
         for app in productive_apps:
-            print(f"[DEBUG] Продуктивное приложение: {app.name}, время: {getattr(app, 'total_seconds', 0)}")
-        print(f"[DEBUG] Всего продуктивное время: {productive_seconds}, общее время: {all_apps_seconds}, процент: {productivity_percent}%")
+            logger.debug(f"Продуктивное приложение: {app.name}, время: {getattr(app, 'total_seconds', 0)}")
+        logger.debug(f"Всего продуктивное время: {productive_seconds}, общее время: {all_apps_seconds}, процент: {productivity_percent}%")
         
         # Убедимся, что продуктивность считается правильно
         if not productive_apps and all_apps_seconds > 0:
@@ -269,7 +229,7 @@ class StatisticsView(LoginRequiredMixin, TemplateView):
             productive_db_apps = Application.objects.filter(id__in=app_ids, is_productive=True)
             
             if productive_db_apps.exists():
-                print(f"[DEBUG] Найдены продуктивные приложения в БД, но не в текущей выборке: {productive_db_apps.count()}")
+                logger.debug(f"Найдены продуктивные приложения в БД, но не в текущей выборке: {productive_db_apps.count()}")
                 # Принудительно помечаем приложения как продуктивные
                 for app in apps:
                     if hasattr(app, 'id') and productive_db_apps.filter(id=app.id).exists():
@@ -280,19 +240,16 @@ class StatisticsView(LoginRequiredMixin, TemplateView):
                 productive_seconds = sum(app.total_seconds for app in productive_apps if getattr(app, 'total_seconds', None))
                 productivity_percent = round((productive_seconds / all_apps_seconds) * 100) if all_apps_seconds > 0 else 0
         
-        # Добавляем данные в контекст
-        context['apps'] = apps
-        context['formatted_time'] = formatted_time
-        context['keyboard_activity'] = keyboard_activity
-        context['today_activity'] = activities.select_related('application').order_by('-start_time')[:10]
-        context['daily_data'] = daily_data
-        context['average_daily_time'] = average_daily_time
-        context['average_daily_keystrokes'] = average_daily_keystrokes
-        context['productivity_percent'] = productivity_percent
-        
-        print(f"[DEBUG] Statistics Timestamp: {context['timestamp']}, Time: {formatted_time}, Keystrokes: {keyboard_activity}")
-        
-        return context
+        return {
+            'apps': list(apps),
+            'formatted_time': formatted_time,
+            'keyboard_activity': keyboard_activity,
+            'today_activity': list(activities.select_related('application').order_by('-start_time')[:10]),
+            'daily_data': daily_data,
+            'average_daily_time': average_daily_time,
+            'average_daily_keystrokes': average_daily_keystrokes,
+            'productivity_percent': productivity_percent,
+        }
 
 class LandingView(TemplateView):
     template_name = 'landing.html'
@@ -334,10 +291,19 @@ class ApplicationViewSet(viewsets.ModelViewSet):
         except Application.DoesNotExist:
             raise ApplicationNotFound()
 
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        bump_cache_generation(self.request.user.id)
+
+    def perform_destroy(self, instance):
+        super().perform_destroy(instance)
+        bump_cache_generation(self.request.user.id)
+
 class UserActivityViewSet(viewsets.ModelViewSet):
     queryset = UserActivity.objects.all()
     serializer_class = UserActivitySerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = ActivityCursorPagination
     
     def get_queryset(self):
         return UserActivity.objects.filter(user=self.request.user).order_by('-start_time')
@@ -357,56 +323,13 @@ class UserActivityViewSet(viewsets.ModelViewSet):
                 keyboard_presses = 0
             
             # Логируем полученные данные для отладки
-            print(f"Получены данные: app_name={app_name}, process_name={process_name}, keyboard_presses={keyboard_presses}")
-            
-            # Пытаемся получить существующее приложение
-            application = None
+            logger.debug(f"Получены данные: app_name={app_name}, process_name={process_name}, keyboard_presses={keyboard_presses}")
             
-            # Проверяем, является ли process_name числом или строкой с числом
-            is_numeric = False
-            process_id = None
-            try:
-                # Если process_name уже число или строка с числом
-                if isinstance(process_name, int) or (isinstance(process_name, str) and process_name.isdigit()):
-                    is_numeric = True
-                    process_id = int(process_name)
-                    try:
-                        application = Application.objects.get(id=process_id, user=self.request.user)
-                        print(f"Найдено приложение по ID={process_id}: {application}")
-                    except Application.DoesNotExist:
-                        # Если приложение с таким ID не существует, не используем его
-                        print(f"Приложение с ID={process_id} не найдено, создаем новое")
-                        is_numeric = False
-            except (TypeError, ValueError, AttributeError) as e:
-                print(f"Ошибка при обработке process_name как ID: {e}")
-                is_numeric = False
-            
-            # Если приложение не найдено по ID, ищем по имени процесса
-            if not application:
-                try:
-                    # Если process_name не число, используем его как имя процесса
-                    process_name_str = str(process_name) if process_name is not None else ""
-                    if process_name_str:  # Проверяем, что строка не пустая
-                        application = Application.objects.filter(process_name=process_name_str, user=self.request.user).first()
-                        if application:
-                            print(f"Найдено приложение по process_name={process_name_str}: {application}")
-                except Exception as e:
-                    print(f"Ошибка при поиске приложения по process_name: {e}")
-            
-            # Если приложение всё еще не найдено, создаем новое
-            if not application:
-                application_name = app_name or str(process_name)
-                if not application_name:
-                    application_name = "Неизвестное приложение"
-                    
-                process_name_value = str(process_name) if process_name is not None else ""
-                
-                application = Application.objects.create(
-                    name=application_name,
-                    process_name=process_name_value,
-                    user=self.request.user
-                )
-                print(f"Создано новое приложение: name={application_name}, process_name={process_name_value}")
+            # Находим или создаем приложение; известные приложения берутся из кэша без запросов
+            application_id = resolve_application_id(self.request.user, process_name, app_name)
+            if application_id is None:
+                raise InvalidActivityData(detail='Приложение не найдено.')
+            serializer.validated_data.pop('application', None)
             
             # Проверяем и устанавливаем даты для активности
             start_time = request_data.get('start_time')
@@ -426,25 +349,66 @@ class UserActivityViewSet(viewsets.ModelViewSet):
                         end_time = datetime.fromisoformat(end_time.replace('Z', '+00:00'))
                     duration = end_time - start_time
                 except (ValueError, TypeError) as e:
-                    print(f"Ошибка при вычислении duration: {e}")
+                    logger.error(f"Ошибка при вычислении duration: {e}")
             
             # Сохраняем активность с правильным объектом приложения и всеми данными
             activity = serializer.save(
                 user=self.request.user,
-                application=application,
+                application_id=application_id,
                 keyboard_presses=keyboard_presses,
                 start_time=start_time,
                 end_time=end_time,
                 duration=duration
             )
             
-            print(f"Активность успешно сохранена: {activity.id}, приложение: {application.name}")
+            logger.debug(f"Активность успешно сохранена: {activity.id}, приложение: {application_id}")
             return activity
             
         except Exception as e:
-            print(f"Ошибка при создании активности: {e}")
+            logger.error(f"Ошибка при создании активности: {e}")
             raise ValidationError(detail=str(e))
 
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """
+        Пакетная загрузка активностей от десктоп-клиента.
+        Принимает JSON-массив активностей или колоночный пакет
+        {"format": "columnar", "apps": [...], "app": [...], "start": [...], ...}
+        и возвращает статус для каждого элемента.
+        Пакет в непонятном формате отклоняется целиком с кодом invalid_activity_format.
+        """
+        items = request.data
+        parse_item = parse_activity_item
+        if isinstance(items, dict) and items.get('format') == 'columnar':
+            try:
+                items = columnar_rows(items)
+            except ActivityItemError as e:
+                raise InvalidActivityFormat(detail=str(e))
+            parse_item = parse_columnar_row
+        elif not isinstance(items, list):
+            raise InvalidActivityFormat(detail='Ожидается JSON-массив активностей.')
+
+        max_items = getattr(settings, 'BULK_INGEST_MAX_ITEMS', 1000)
+        if len(items) > max_items:
+            raise InvalidActivityData(detail=f'Слишком много записей в пакете (максимум {max_items}).')
+
+        results = submit_activities(request.user, items, parse_item)
+        created_count = sum(1 for result in results if result['status'] == 'created')
+        failed_count = len(results) - created_count
+
+        if failed_count == 0:
+            response_status = status.HTTP_201_CREATED
+        elif created_count:
+            response_status = status.HTTP_207_MULTI_STATUS
+        else:
+            response_status = status.HTTP_400_BAD_REQUEST
+
+        return Response({
+            'created': created_count,
+            'failed': failed_count,
+            'results': results
+        }, status=response_status)
+
     def update(self, request, *args, **kwargs):
         try:
             return super().update(request, *args, **kwargs)
@@ -457,64 +421,80 @@ class UserActivityViewSet(viewsets.ModelViewSet):
         except UserActivity.DoesNotExist:
             raise UserActivityNotFound()
 
+def _keyboard_event(activity):
+    return activity.user_id, activity.application_id, activity.timestamp, activity.key_pressed
+
+
 class KeyboardActivityViewSet(viewsets.ModelViewSet):
     queryset = KeyboardActivity.objects.all()
     serializer_class = KeyboardActivitySerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeyboardActivityCursorPagination
     
     def get_queryset(self):
         return KeyboardActivity.objects.filter(user=self.request.user).order_by('-timestamp')
         
+    def create(self, request, *args, **kwargs):
+        """
+        В режиме 'bucketed' сырая строка не сохраняется: нажатие учитывается
+        только в минутной сводке. Ответ тот же 201 с полями нажатия, но id равен null
+        """
+        if settings.KEYBOARD_STORAGE_MODE != 'bucketed':
+            return super().create(request, *args, **kwargs)
+
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        activity = KeyboardActivity(user=request.user, **serializer.validated_data)
+        merge_into_buckets([_keyboard_event(activity)])
+        return Response(self.get_serializer(activity).data, status=status.HTTP_201_CREATED)
+
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        """
+        Нажатие сразу учитывается в минутной сводке
+        """
+        with transaction.atomic():
+            activity = serializer.save(user=self.request.user, bucketed=True)
+            merge_into_buckets([_keyboard_event(activity)])
+
+    def perform_update(self, serializer):
+        """
+        Учтенное в сводке нажатие переносится: старое значение вычитается, новое прибавляется
+        """
+        with transaction.atomic():
+            previous = _keyboard_event(serializer.instance)
+            bucketed = serializer.instance.bucketed
+            activity = serializer.save()
+            if bucketed:
+                subtract_from_buckets([previous])
+                merge_into_buckets([_keyboard_event(activity)])
+
+    def perform_destroy(self, instance):
+        """
+        Удаленное нажатие вычитается из минутной сводки
+        """
+        with transaction.atomic():
+            if instance.bucketed:
+                subtract_from_buckets([_keyboard_event(instance)])
+            instance.delete()
+
+    @action(detail=False, methods=['get'])
+    def buckets(self, request):
+        """
+        Минутные сводки нажатий пользователя
+        """
+        queryset = KeyboardActivityBucket.objects.filter(user=request.user)
+        application_id = request.query_params.get('application')
+        if application_id:
+            queryset = queryset.filter(application_id=application_id)
+
+        paginator = KeyboardBucketCursorPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        serializer = KeyboardActivityBucketSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
 
 class DashboardView(LoginRequiredMixin, TemplateView):
     template_name = 'dashboard.html'
     
-    # Словарь для отображения понятных названий приложений
-    app_name_mapping = {
-        'browser.exe': 'Yandex Браузер',
-        'chrome.exe': 'Google Chrome',
-        'firefox.exe': 'Mozilla Firefox',
-        'msedge.exe': 'Microsoft Edge',
-        'opera.exe': 'Opera',
-        'safari.exe': 'Safari',
-        'brave.exe': 'Brave Browser',
-        'vivaldi.exe': 'Vivaldi',
-        'iexplore.exe': 'Internet Explorer',
-        'word.exe': 'Microsoft Word',
-        'excel.exe': 'Microsoft Excel',
-        'powerpnt.exe': 'Microsoft PowerPoint',
-        'outlook.exe': 'Microsoft Outlook',
-        'winword.exe': 'Microsoft Word',
-        'notepad.exe': 'Notepad',
-        'notepad++.exe': 'Notepad++',
-        'code.exe': 'Visual Studio Code',
-        'devenv.exe': 'Visual Studio',
-        'pycharm64.exe': 'PyCharm',
-        'idea64.exe': 'IntelliJ IDEA',
-        'photoshop.exe': 'Adobe Photoshop',
-        'illustrator.exe': 'Adobe Illustrator',
-        'acrobat.exe': 'Adobe Acrobat',
-        'acrord32.exe': 'Adobe Reader',
-        'slack.exe': 'Slack',
-        'teams.exe': 'Microsoft Teams',
-        'discord.exe': 'Discord',
-        'telegram.exe': 'Telegram',
-        'whatsapp.exe': 'WhatsApp',
-        'skype.exe': 'Skype',
-        'zoom.exe': 'Zoom',
-        'steam.exe': 'Steam',
-        'spotify.exe': 'Spotify',
-        'vlc.exe': 'VLC Media Player',
-        'wmplayer.exe': 'Windows Media Player',
-        'explorer.exe': 'Windows Explorer',
-        'cmd.exe': 'Командная строка',
-        'powershell.exe': 'PowerShell',
-        'python.exe': 'Python',
-        'javaw.exe': 'Java',
-        'node.exe': 'Node.js'
-    }
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -532,10 +512,9 @@ class DashboardView(LoginRequiredMixin, TemplateView):
         
         # Убедимся, что у каждой активности есть правильная длительность
         for activity in today_activities:
-            # Если длительность не установлена, но есть начало и конец, рассчитываем её
+            # Если длительность не установлена, но есть начало и конец, рассчитываем её для отображения
             if not activity.duration and activity.start_time and activity.end_time:
                 activity.duration = activity.end_time - activity.start_time
-                activity.save()
             # Если активность не завершена, рассчитываем текущую длительность
             elif activity.start_time and not activity.end_time:
                 current_time = timezone.now()
@@ -547,24 +526,31 @@ class DashboardView(LoginRequiredMixin, TemplateView):
         
         context['today_activity'] = today_activities
         
+        # Остальные данные кэшируются до следующей записи активностей пользователя
+        context.update(get_or_build(
+            user.id, 'dashboard', (today,),
+            lambda: self.get_dashboard_data(user, today)
+        ))
+        
+        logger.debug(f"Timestamp: {context['timestamp']}, Time: {context['today_stats']['formatted_time']}, Keystrokes: {context['today_stats']['keystrokes']}")
+        
+        return context
+    
+    def get_dashboard_data(self, user, today):
+        """
+        Собирает сводку дашборда за день
+        """
         # Получаем активные приложения
         active_apps = Application.objects.filter(
-            useractivity__user=user,
-            useractivity__start_time__date=today
+            daily_usage__user=user,
+            daily_usage__date=today
         ).distinct()
         
-        # Обновляем названия активных приложений
-        for app in active_apps:
-            process_name = app.process_name.lower() if app.process_name else ""
-            if process_name in self.app_name_mapping:
-                app.name = self.app_name_mapping[process_name]
-                app.save()
+        # Понятные названия активных приложений - только для отображения
+        apply_display_names(active_apps)
 
         # Получаем статистику за сегодня
         # Добавляем общее время работы за сегодня
-        # Используем прямой SQL-запрос для более точного расчета
-        from django.db import connection
-        from django.db.models import Sum
         
         # Используем объекты Django вместо прямого SQL для совместимости с SQLite
         # Исправляем расчет времени работы, чтобы оно корректно отображалось
@@ -573,14 +559,9 @@ class DashboardView(LoginRequiredMixin, TemplateView):
             start_time__date=today
         )
         
-        # Рассчитываем общее время работы на основе всех активностей
-        total_seconds = 0
-        for activity in activities:
-            if activity.duration:
-                total_seconds += activity.duration.total_seconds()
-            elif activity.start_time and activity.end_time:
-                duration = activity.end_time - activity.start_time
-                total_seconds += duration.total_seconds()
+        # Общее время работы и нажатия клавиш за сегодня берем из дневной сводки
+        totals = usage_totals(user, today, today)
+        total_seconds = totals['total_seconds']
         
         # Создаем объект timedelta для отображения
         total_work_time = timedelta(seconds=int(total_seconds))
@@ -591,17 +572,7 @@ class DashboardView(LoginRequiredMixin, TemplateView):
         formatted_time = f"{hours}:{minutes:02d}:{seconds:02d}"
         
         # Получаем все приложения пользователя за сегодня
-        apps = Application.objects.filter(
-            useractivity__user=user,
-            useractivity__start_time__date=today
-        ).annotate(
-            total_time=Sum('useractivity__duration'),
-            # Добавляем поле для отформатированного времени
-            total_seconds=Sum(ExpressionWrapper(
-                F('useractivity__duration'), 
-                output_field=models.IntegerField()
-            ))
-        ).order_by('-total_time')
+        apps = applications_with_usage(user, today, today)
         
         # Рассчитываем проценты для приложений
         all_apps_seconds = sum(app.total_seconds for app in apps if getattr(app, 'total_seconds', None))
@@ -609,12 +580,7 @@ class DashboardView(LoginRequiredMixin, TemplateView):
         # Форматируем время для каждого приложения и добавляем проценты
         for app in apps:
             if hasattr(app, 'total_seconds') and app.total_seconds:
-                # Преобразуем время в секунды, разделив на 1000000 если значение слишком большое
-                seconds_value = app.total_seconds
-                if seconds_value > 100000:  # Если значение слишком большое, вероятно это микросекунды
-                    seconds_value = seconds_value / 1000000
-                
-                hours, remainder = divmod(int(seconds_value), 3600)
+                hours, remainder = divmod(int(app.total_seconds), 3600)
                 minutes, seconds = divmod(remainder, 60)
                 app.formatted_time = f"{hours}:{minutes:02d}:{seconds:02d}"
                 
@@ -624,73 +590,32 @@ class DashboardView(LoginRequiredMixin, TemplateView):
                 app.formatted_time = "00:00:00"
                 app.percentage = 0
         
-        # Обновляем названия приложений для отображения
-        for app in apps:
-            process_name = app.process_name.lower() if app.process_name else ""
-            if process_name in self.app_name_mapping:
-                # Обновляем название приложения в базе данных
-                app.name = self.app_name_mapping[process_name]
-                app.save()
-        
-        # Создаем почасовую статистику для графика
-        hourly_activity = []
-        for hour in range(24):
-            start_hour = timezone.make_aware(datetime.combine(today, time(hour=hour, minute=0)))
-            end_hour = timezone.make_aware(datetime.combine(today, time(hour=hour + 1 if hour < 23 else 23, minute=59, second=59)))
-            
-            # Получаем активности только за этот час
-            hour_activities = activities.filter(
-                start_time__gte=start_hour,
-                start_time__lt=end_hour
-            )
-            
-            # Рассчитываем общее время активности за час
-            hour_seconds = 0
-            for activity in hour_activities:
-                if activity.duration:
-                    hour_seconds += activity.duration.total_seconds()
-                elif activity.start_time and activity.end_time:
-                    duration = activity.end_time - activity.start_time
-                    hour_seconds += duration.total_seconds()
-            
-            # Переводим секунды в минуты
-            hour_minutes = round(hour_seconds / 60, 0)
-            
-            hourly_activity.append({
-                'hour': hour,
-                'minutes': hour_minutes,
-                'seconds': hour_seconds
-            })
+        # Понятные названия приложений - только для отображения
+        apply_display_names(apps)
+        
+        # Создаем почасовую статистику для графика одним сгруппированным запросом
+        hourly_activity = user_hour_series(activities, today)
         
         today_stats = {
             'total_work_time': total_work_time,
             'formatted_time': formatted_time,
-            'apps': apps,
+            'apps': list(apps),
             
-            # Получаем количество нажатий клавиш из модели UserActivity с использованием SQL
-            'keystrokes': UserActivity.objects.filter(
-                user=user,
-                start_time__date=today
-            ).aggregate(total_keystrokes=Sum('keyboard_presses'))['total_keystrokes'] or 0,
+            'keystrokes': totals['keystrokes'],
         }
 
-        # Готовим данные напрямую без кэширования
-        context.update({
-            'active_apps': active_apps,
+        return {
+            'active_apps': list(active_apps),
             'today_stats': today_stats,
-            'today_activity': context['today_activity'],
             'hourly_activity': hourly_activity
-        })
-        
-        print(f"[DEBUG] Timestamp: {context['timestamp']}, Time: {formatted_time}, Keystrokes: {today_stats['keystrokes']}")
-        
-        return context
+        }
 
-class LogsView(LoginRequiredMixin, ListView):
+class LogsView(LoginRequiredMixin, KeysetPaginationMixin, ListView):
     template_name = 'logs.html'
     model = UserActivity
     context_object_name = 'activities'
-    paginate_by = 20
+    keyset_field = 'start_time'
+    keyset_page_size = 20
 
     def get_queryset(self):
         queryset = UserActivity.objects.filter(user=self.request.user)
@@ -710,28 +635,39 @@ class LogsView(LoginRequiredMixin, ListView):
         if application_id:
             queryset = queryset.filter(application_id=application_id)
         
-        return queryset.select_related('application').order_by('-start_time')
+        return queryset.select_related('application').order_by('-start_time', '-id')
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         
-        # Получаем клавиатурную активность
-        keyboard_queryset = KeyboardActivity.objects.filter(user=self.request.user)
+        # Клавиатурная активность читается из минутных сводок
+        keyboard_queryset = KeyboardActivityBucket.objects.filter(user=self.request.user)
         
         # Применяем те же фильтры, что и для активности
         date_from = self.request.GET.get('date_from')
         if date_from:
-            keyboard_queryset = keyboard_queryset.filter(timestamp__date__gte=date_from)
+            keyboard_queryset = keyboard_queryset.filter(minute__date__gte=date_from)
         
         date_to = self.request.GET.get('date_to')
         if date_to:
-            keyboard_queryset = keyboard_queryset.filter(timestamp__date__lte=date_to)
+            keyboard_queryset = keyboard_queryset.filter(minute__date__lte=date_to)
         
         application_id = self.request.GET.get('application')
         if application_id:
             keyboard_queryset = keyboard_queryset.filter(application_id=application_id)
         
-        context['keyboard_activities'] = keyboard_queryset.select_related('application').order_by('-timestamp')[:20]
+        # Клавиатурная активность листается своим курсором независимо от основной таблицы
+        keyboard_page = self.keyset_page(
+            keyboard_queryset.select_related('application'),
+            field='minute',
+            cursor_param='keyboard_cursor',
+        )
+        context['keyboard_activities'] = keyboard_page.object_list
+        context['keyboard_page'] = keyboard_page
+        if keyboard_page.next_cursor:
+            context['keyboard_next_query'] = self.cursor_query(keyboard_page.next_cursor, 'keyboard_cursor')
+        if keyboard_page.previous_cursor:
+            context['keyboard_previous_query'] = self.cursor_query(keyboard_page.previous_cursor, 'keyboard_cursor')
         
         # Добавляем список приложений для выпадающего списка
         context['applications'] = Application.objects.filter(
@@ -750,11 +686,20 @@ class TrackedApplicationViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        bump_cache_generation(self.request.user.id)
+
+    def perform_destroy(self, instance):
+        super().perform_destroy(instance)
+        bump_cache_generation(self.request.user.id)
+
     @action(detail=True, methods=['post'])
     def toggle_active(self, request, pk=None):
         app = self.get_object()
         app.is_active = not app.is_active
         app.save()
+        bump_cache_generation(request.user.id)
         return Response({'status': 'success'})
 
     @action(detail=True, methods=['post'])
@@ -773,6 +718,7 @@ class TrackedApplicationViewSet(viewsets.ModelViewSet):
                 
             app.is_productive = not app.is_productive
             app.save()
+            bump_cache_generation(request.user.id)
             return Response({'status': 'success', 'is_productive': app.is_productive})
         except Exception as e:
             logger.error(f"Ошибка при изменении статуса продуктивности: {e}")
@@ -787,6 +733,40 @@ class TrackedApplicationViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data)
 
+    @action(detail=False, methods=['post'])
+    def resolve(self, request):
+        """
+        Возвращает ID приложений по списку имен процессов и создает недостающие.
+        Принимает JSON-массив имен или объект {"process_names": [...]}.
+        """
+        names = request.data.get('process_names') if isinstance(request.data, dict) else request.data
+        if not isinstance(names, list) or not all(isinstance(name, str) for name in names):
+            raise ValidationError({'process_names': 'Ожидается массив имен процессов.'})
+
+        max_items = getattr(settings, 'BULK_INGEST_MAX_ITEMS', 1000)
+        if len(names) > max_items:
+            raise ValidationError({'process_names': f'Слишком много имен в запросе (максимум {max_items}).'})
+
+        return Response({'applications': resolve_process_names(request.user, names)})
+
+    @action(detail=False, methods=['get'], url_path='map')
+    def application_map(self, request):
+        """
+        Соответствие имен процессов и ID приложений пользователя.
+        Поддерживает If-None-Match: при неизменном списке отвечает 304 без тела.
+        """
+        mapping = application_map(request.user)
+        etag = quote_etag(hashlib.md5(
+            json.dumps(mapping, sort_keys=True).encode('utf-8')
+        ).hexdigest())
+
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response({'applications': mapping})
+        response['ETag'] = etag
+        return response
+
     @action(detail=False)
     def productive_apps(self, request):
         queryset = self.get_queryset().filter(is_productive=True)
@@ -871,65 +851,41 @@ class StatisticsAPIView(APIView):
     permission_classes = [permissions.IsAuthenticated]
     
     def get(self, request, format=None):
-        user = request.user
         days = int(request.query_params.get('days', 7))
-        
         today = timezone.now().date()
-        start_date = today - timedelta(days=days-1)
         
-        # Получаем активности пользователя за указанный период
-        activities = UserActivity.objects.filter(
-            user=user,
-            start_time__date__gte=start_date,
-            start_time__date__lte=today
-        )
-        
-        # Рассчитываем общее время работы
-        total_seconds = 0
-        keyboard_activity = 0
+        # Ответ кэшируется до следующей записи активностей пользователя
+        return Response(get_or_build(
+            request.user.id, 'statistics_api', (days, today),
+            lambda: self.get_statistics_data(request.user, days, today)
+        ))
+    
+    def get_statistics_data(self, user, days, today):
+        """
+        Собирает статистику использования приложений за период
+        """
+        start_date = today - timedelta(days=days-1)
         
-        for activity in activities:
-            if activity.duration:
-                total_seconds += activity.duration.total_seconds()
-            elif activity.start_time and activity.end_time:
-                duration = activity.end_time - activity.start_time
-                total_seconds += duration.total_seconds()
-            
-            # Суммируем нажатия клавиш
-            keyboard_activity += activity.keyboard_presses or 0
+        # Общее время работы и нажатия клавиш берем из дневной сводки
+        totals = usage_totals(user, start_date, today)
+        total_seconds = totals['total_seconds']
+        keyboard_activity = totals['keystrokes']
         
         # Рассчитываем средние показатели
         avg_seconds_per_day = total_seconds / days if days > 0 else 0
         
         # Получаем статистику по приложениям
         app_statistics = []
-        all_apps_seconds = 0
-        
-        apps = Application.objects.filter(
-            useractivity__user=user,
-            useractivity__start_time__date__gte=start_date,
-            useractivity__start_time__date__lte=today
-        ).annotate(
-            total_time=Sum('useractivity__duration'),
-            total_seconds=Sum(ExpressionWrapper(
-                F('useractivity__duration'), 
-                output_field=models.IntegerField()
-            ))
-        ).order_by('-total_time').distinct()
+        
+        apps = applications_with_usage(user, start_date, today)
         
         # Считаем общее время для всех приложений
-        for app in apps:
-            if hasattr(app, 'total_seconds') and app.total_seconds:
-                all_apps_seconds += app.total_seconds
+        all_apps_seconds = sum(app.total_seconds for app in apps if app.total_seconds)
         
         # Формируем статистику по приложениям
         for app in apps:
-            if hasattr(app, 'total_seconds') and app.total_seconds:
-                seconds_value = app.total_seconds
-                if seconds_value > 100000:  # Если значение слишком большое, вероятно это микросекунды
-                    seconds_value = seconds_value / 1000000
-                
-                hours, remainder = divmod(int(seconds_value), 3600)
+            if app.total_seconds:
+                hours, remainder = divmod(int(app.total_seconds), 3600)
                 minutes, seconds = divmod(remainder, 60)
                 formatted_time = f"{hours}:{minutes:02d}:{seconds:02d}"
                 
@@ -955,24 +911,10 @@ class StatisticsAPIView(APIView):
         avg_minutes, avg_seconds = divmod(avg_remainder, 60)
         avg_formatted_time = f"{avg_hours}:{avg_minutes:02d}:{avg_seconds:02d}"
         
-        # Собираем данные по дням
+        # Собираем данные по дням одним запросом к сводке
         daily_data = {}
-        for day_offset in range(days):
-            date = today - timedelta(days=days-1-day_offset)
+        for date, day_seconds in user_day_series(user, start_date, today):
             date_str = date.strftime('%Y-%m-%d')
-            
-            day_activities = activities.filter(
-                start_time__date=date
-            )
-            
-            day_seconds = 0
-            for activity in day_activities:
-                if activity.duration:
-                    day_seconds += activity.duration.total_seconds()
-                elif activity.start_time and activity.end_time:
-                    duration = activity.end_time - activity.start_time
-                    day_seconds += duration.total_seconds()
-            
             day_hours = day_seconds / 3600
             
             daily_data[date_str] = {
@@ -1000,59 +942,73 @@ class StatisticsAPIView(APIView):
             'daily_data': list(daily_data.values())
         }
         
-        return Response(response_data)
+        return response_data
 
 class ExportStatisticsAPIView(APIView):
     """
-    API для экспорта статистики использования приложений в CSV формате.
+    API для потокового экспорта активностей в CSV, NDJSON или колоночном формате.
+    Параметры: date_from и date_to (YYYY-MM-DD) или days, output (csv, ndjson, columnar),
+    compress=gzip для сжатия ответа. Параметр format занят DRF под выбор рендерера.
     """
     permission_classes = [permissions.IsAuthenticated]
     
-    def get(self, request, format=None):
-        user = request.user
-        days = int(request.query_params.get('days', 7))
-        
+    content_types = {
+        'csv': 'text/csv; charset=utf-8',
+        'ndjson': 'application/x-ndjson; charset=utf-8',
+        'columnar': 'application/x-ndjson; charset=utf-8',
+    }
+    extensions = {
+        'csv': 'csv',
+        'ndjson': 'ndjson',
+        'columnar': 'columnar.ndjson',
+    }
+    
+    def get_period(self, request):
         today = timezone.now().date()
-        start_date = today - timedelta(days=days-1)
+        date_from = request.query_params.get('date_from')
+        date_to = request.query_params.get('date_to')
         
-        # Получаем активности пользователя за указанный период
-        activities = UserActivity.objects.filter(
-            user=user,
-            start_time__date__gte=start_date,
-            start_time__date__lte=today
-        ).select_related('application').order_by('start_time')
-        
-        import csv
-        from django.http import HttpResponse
-        
-        # Создаем HTTP ответ с CSV файлом с явным указанием кодировки utf-8 и BOM для Excel
-        response = HttpResponse(content_type='text/csv; charset=utf-8-sig')
-        response.write('\ufeff')  # Добавляем BOM для лучшей совместимости с Excel
-        response['Content-Disposition'] = f'attachment; filename="activity_report_{start_date.strftime("%Y-%m-%d")}_{today.strftime("%Y-%m-%d")}.csv"'
-        
-        writer = csv.writer(response, delimiter=';')  # Используем точку с запятой в качестве разделителя для лучшей совместимости с Excel
-        writer.writerow(['Дата', 'Время начала', 'Время окончания', 'Длительность', 'Приложение', 'Процесс', 'Нажатия клавиш', 'Продуктивное'])
+        if date_from or date_to:
+            try:
+                start_date = datetime.strptime(date_from, '%Y-%m-%d').date() if date_from else None
+                end_date = datetime.strptime(date_to, '%Y-%m-%d').date() if date_to else today
+            except ValueError:
+                raise InvalidTimeRange(detail='Неверный формат даты. Используйте YYYY-MM-DD.')
+            if start_date is None:
+                raise InvalidTimeRange(detail='Не указан параметр date_from.')
+        else:
+            days = int(request.query_params.get('days', 7))
+            end_date = today
+            start_date = today - timedelta(days=days-1)
         
-        for activity in activities:
-            if activity.duration:
-                duration_str = str(activity.duration)
-            elif activity.start_time and activity.end_time:
-                duration = activity.end_time - activity.start_time
-                duration_str = str(duration)
-            else:
-                duration_str = '00:00:00'
-            
-            writer.writerow([
-                activity.start_time.strftime('%Y-%m-%d'),
-                activity.start_time.strftime('%H:%M:%S'),
-                activity.end_time.strftime('%H:%M:%S') if activity.end_time else '',
-                duration_str,
-                activity.application.name,
-                activity.application.process_name,
-                activity.keyboard_presses,
-                'Да' if activity.application.is_productive else 'Нет'
-            ])
+        if start_date > end_date:
+            raise InvalidTimeRange(detail='Дата начала позже даты окончания.')
+        return start_date, end_date
+    
+    def get(self, request, format=None):
+        export_format = request.query_params.get('output', 'csv')
+        if export_format not in EXPORT_FORMATS:
+            raise ValidationError({'output': f'Неподдерживаемый формат экспорта: {export_format}.'})
+        compress = request.query_params.get('compress') == 'gzip'
+        
+        start_date, end_date = self.get_period(request)
+        rows = export_rows(request.user, start_date, end_date)
+        
+        if export_format == 'ndjson':
+            stream = ndjson_stream(rows)
+        elif export_format == 'columnar':
+            stream = columnar_stream(rows)
+        else:
+            stream = csv_stream(rows)
         
+        filename = f'activity_report_{start_date.strftime("%Y-%m-%d")}_{end_date.strftime("%Y-%m-%d")}.{self.extensions[export_format]}'
+        if compress:
+            # Файл отдается как .gz, без Content-Encoding, чтобы браузер сохранил его сжатым
+            response = StreamingHttpResponse(gzip_stream(stream), content_type='application/gzip')
+            filename += '.gz'
+        else:
+            response = StreamingHttpResponse(stream, content_type=self.content_types[export_format])
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
         return response
 
 class DailyActivityAPIView(APIView):
@@ -1167,55 +1123,33 @@ class TimeDistributionAPIView(APIView):
     permission_classes = [permissions.IsAuthenticated]
     
     def get(self, request, format=None):
-        user = request.user
         days = int(request.query_params.get('days', 7))
-        
         today = timezone.now().date()
-        start_date = today - timedelta(days=days-1)
-        
-        # Получаем активности пользователя за указанный период
-        activities = UserActivity.objects.filter(
-            user=user,
-            start_time__date__gte=start_date,
-            start_time__date__lte=today
-        )
         
-        # Группируем по приложениям
-        app_data = {}
+        # Ответ кэшируется до следующей записи активностей пользователя
+        return Response(get_or_build(
+            request.user.id, 'time_distribution', (days, today),
+            lambda: self.get_distribution_data(request.user, days, today)
+        ))
+    
+    def get_distribution_data(self, user, days, today):
+        """
+        Собирает распределение времени по приложениям за период
+        """
+        start_date = today - timedelta(days=days-1)
         
-        for activity in activities:
-            app_id = activity.application.id
-            app_name = activity.application.name
-            process_name = activity.application.process_name
-            is_productive = activity.application.is_productive
-            
-            if activity.duration:
-                duration_seconds = activity.duration.total_seconds()
-            elif activity.start_time and activity.end_time:
-                duration = activity.end_time - activity.start_time
-                duration_seconds = duration.total_seconds()
-            else:
-                continue
-            
-            if app_id not in app_data:
-                app_data[app_id] = {
-                    'id': app_id,
-                    'name': app_name,
-                    'process_name': process_name,
-                    'is_productive': is_productive,
-                    'total_seconds': 0,
-                    'activities_count': 0
-                }
-            
-            app_data[app_id]['total_seconds'] += duration_seconds
-            app_data[app_id]['activities_count'] += 1
-        
-        # Сортируем по времени использования
-        sorted_apps = sorted(
-            app_data.values(), 
-            key=lambda x: x['total_seconds'], 
-            reverse=True
-        )
+        # Группировка по приложениям уже выполнена в дневной сводке
+        sorted_apps = [
+            {
+                'id': app.id,
+                'name': app.name,
+                'process_name': app.process_name,
+                'is_productive': app.is_productive,
+                'total_seconds': app.total_seconds or 0,
+                'activities_count': app.sessions or 0
+            }
+            for app in applications_with_usage(user, start_date, today)
+        ]
         
         # Рассчитываем общее время
         total_seconds = sum(app['total_seconds'] for app in sorted_apps)
@@ -1262,7 +1196,7 @@ class TimeDistributionAPIView(APIView):
             'applications': sorted_apps
         }
         
-        return Response(response_data)
+        return response_data
 
 class DashboardAPIView(APIView):
     """
@@ -1271,27 +1205,20 @@ class DashboardAPIView(APIView):
     permission_classes = [permissions.IsAuthenticated]
     
     def get(self, request, format=None):
-        user = request.user
-        
-        # Получаем статистику за сегодня
         today = timezone.now().date()
-        today_start = datetime.combine(today, time.min)
-        today_end = datetime.combine(today, time.max)
-        
-        today_activities = UserActivity.objects.filter(
-            user=user,
-            start_time__date=today
-        )
-        
-        # Рассчитываем общее время за сегодня
-        today_seconds = 0
         
-        for activity in today_activities:
-            if activity.duration:
-                today_seconds += activity.duration.total_seconds()
-            elif activity.start_time and activity.end_time:
-                duration = activity.end_time - activity.start_time
-                today_seconds += duration.total_seconds()
+        # Ответ кэшируется до следующей записи активностей пользователя
+        return Response(get_or_build(
+            request.user.id, 'dashboard_api', (today,),
+            lambda: self.get_dashboard_data(request.user, today)
+        ))
+    
+    def get_dashboard_data(self, user, today):
+        """
+        Собирает данные дашборда за сегодня и за неделю
+        """
+        # Получаем статистику за сегодня из дневной сводки
+        today_seconds = usage_totals(user, today, today)['total_seconds']
         
         hours, remainder = divmod(int(today_seconds), 3600)
         minutes, seconds = divmod(remainder, 60)
@@ -1300,21 +1227,8 @@ class DashboardAPIView(APIView):
         # Получаем статистику за неделю
         week_start = today - timedelta(days=6)
         
-        weekly_activities = UserActivity.objects.filter(
-            user=user,
-            start_time__date__gte=week_start,
-            start_time__date__lte=today
-        )
-        
-        # Рассчитываем общее время за неделю
-        week_seconds = 0
-        
-        for activity in weekly_activities:
-            if activity.duration:
-                week_seconds += activity.duration.total_seconds()
-            elif activity.start_time and activity.end_time:
-                duration = activity.end_time - activity.start_time
-                week_seconds += duration.total_seconds()
+        weekly_apps = list(applications_with_usage(user, week_start, today))
+        week_seconds = sum(app.total_seconds or 0 for app in weekly_apps)
         
         hours, remainder = divmod(int(week_seconds), 3600)
         minutes, seconds = divmod(remainder, 60)
@@ -1324,20 +1238,7 @@ class DashboardAPIView(APIView):
         prev_week_start = week_start - timedelta(days=7)
         prev_week_end = today - timedelta(days=7)
         
-        prev_weekly_activities = UserActivity.objects.filter(
-            user=user,
-            start_time__date__gte=prev_week_start,
-            start_time__date__lte=prev_week_end
-        )
-        
-        prev_week_seconds = 0
-        
-        for activity in prev_weekly_activities:
-            if activity.duration:
-                prev_week_seconds += activity.duration.total_seconds()
-            elif activity.start_time and activity.end_time:
-                duration = activity.end_time - activity.start_time
-                prev_week_seconds += duration.total_seconds()
+        prev_week_seconds = usage_totals(user, prev_week_start, prev_week_end)['total_seconds']
         
         weekly_change_percentage = 0
         if prev_week_seconds > 0:
@@ -1356,51 +1257,21 @@ class DashboardAPIView(APIView):
         ).count()
         
         # Продуктивность за неделю
-        productive_seconds = 0
-        for activity in weekly_activities:
-            if activity.application.is_productive:
-                if activity.duration:
-                    productive_seconds += activity.duration.total_seconds()
-                elif activity.start_time and activity.end_time:
-                    duration = activity.end_time - activity.start_time
-                    productive_seconds += duration.total_seconds()
+        productive_seconds = sum(app.total_seconds or 0 for app in weekly_apps if app.is_productive)
         
         productivity_percentage = round((productive_seconds / week_seconds) * 100, 1) if week_seconds > 0 else 0
         
-        # Топ-5 приложений за неделю
-        app_usage = {}
-        
-        for activity in weekly_activities:
-            app_id = activity.application.id
-            app_name = activity.application.name
-            process_name = activity.application.process_name
-            is_productive = activity.application.is_productive
-            
-            if activity.duration:
-                duration_seconds = activity.duration.total_seconds()
-            elif activity.start_time and activity.end_time:
-                duration = activity.end_time - activity.start_time
-                duration_seconds = duration.total_seconds()
-            else:
-                continue
-            
-            if app_id not in app_usage:
-                app_usage[app_id] = {
-                    'id': app_id,
-                    'name': app_name,
-                    'process_name': process_name,
-                    'is_productive': is_productive,
-                    'total_seconds': 0
-                }
-            
-            app_usage[app_id]['total_seconds'] += duration_seconds
-        
-        # Сортируем по времени использования и берем топ-5
-        top_apps = sorted(
-            app_usage.values(),
-            key=lambda x: x['total_seconds'],
-            reverse=True
-        )[:5]
+        # Топ-5 приложений за неделю (сводка уже отсортирована по времени)
+        top_apps = [
+            {
+                'id': app.id,
+                'name': app.name,
+                'process_name': app.process_name,
+                'is_productive': app.is_productive,
+                'total_seconds': app.total_seconds or 0
+            }
+            for app in weekly_apps[:5]
+        ]
         
         # Добавляем форматированное время и процент
         for app in top_apps:
@@ -1409,24 +1280,10 @@ class DashboardAPIView(APIView):
             app['formatted_time'] = f"{hours}:{minutes:02d}:{seconds:02d}"
             app['percentage'] = round((app['total_seconds'] / week_seconds) * 100, 1) if week_seconds > 0 else 0
         
-        # Данные по дням недели
+        # Данные по дням недели одним запросом к сводке
         daily_data = {}
-        for day_offset in range(7):
-            date = week_start + timedelta(days=day_offset)
+        for date, day_seconds in day_series(week_start, week_start + timedelta(days=6), usage_by_day(user, week_start, today)):
             date_str = date.strftime('%Y-%m-%d')
-            
-            day_activities = weekly_activities.filter(
-                start_time__date=date
-            )
-            
-            day_seconds = 0
-            for activity in day_activities:
-                if activity.duration:
-                    day_seconds += activity.duration.total_seconds()
-                elif activity.start_time and activity.end_time:
-                    duration = activity.end_time - activity.start_time
-                    day_seconds += duration.total_seconds()
-            
             day_hours = day_seconds / 3600
             
             daily_data[date_str] = {
@@ -1460,6 +1317,29 @@ class DashboardAPIView(APIView):
             'daily_data': list(daily_data.values())
         }
         
-        return Response(response_data)
+        return response_data
 
 # Конец новых API_views
+
+@method_decorator(never_cache, name='dispatch')
+class MetricsView(View):
+    """
+    Гистограммы времени ответа и запросов к БД в текстовом формате Prometheus.
+    Доступ по токену METRICS_TOKEN или сессии сотрудника; адреса METRICS_ALLOWED_IPS
+    пускаются только если список задан явно
+    """
+
+    def _allowed(self, request):
+        token = settings.METRICS_TOKEN
+        if token:
+            authorization = request.META.get('HTTP_AUTHORIZATION', '')
+            if hmac.compare_digest(authorization, f'Bearer {token}'):
+                return True
+        if request.user.is_authenticated and request.user.is_staff:
+            return True
+        return request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS
+
+    def get(self, request, *args, **kwargs):
+        if not self._allowed(request):
+            return HttpResponseForbidden()
+        return HttpResponse(prometheus_text(), content_type='text/plain; version=0.0.4; charset=utf-8')